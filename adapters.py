@@ -0,0 +1,300 @@
+from addresses import zip_code
+from urllib.parse import urlsplit
+import importlib
+import threading
+
+
+class CountyAdapter:
+    """
+    The steps of a lookup on one appraisal district website
+
+    Each county module in counties/ has a subclass of this named ADAPTER. The lookup, batch,
+    pipeline, async and service code only talk to the adapter, so adding a district is a new
+    module and a register() call, nothing else changes.
+
+    A lookup is search -> fetch -> parse:
+        property_id = adapter.search(query)
+        house = adapter.parser()(*adapter.fetch(property_id))
+
+    lookup() and lookup_id() run these steps with the county's caching, subclasses override
+    them when the website needs something else (i.e. a page found by the search request itself).
+    lookup_async() and lookup_id_async() are the same for async_lookup.py, they run the threaded
+    lookup unless the county sends its requests on the event loop.
+    """
+
+    def __init__(self, module):
+        """
+        :param module: The county module, its PARSERS and PARSER choose how pages are parsed
+        """
+
+        self.module = module
+
+    def search(self, query):
+        """
+        Finds the property of an address
+
+        :param query: Address or property ID as typed by the user
+        :return: The property ID or None if not found
+        """
+
+        raise NotImplementedError
+
+    def fetch(self, property_id):
+        """
+        Downloads the pages of a property
+
+        :param property_id: ID returned by search()
+        :return: Tuple of the arguments of the parse function, picklable so it can be sent to a process
+        """
+
+        raise NotImplementedError
+
+    def parser(self):
+        """
+        :return: The module level parse function chosen with PARSER, taking the tuple returned by fetch()
+        """
+
+        return self.module.PARSERS[self.module.PARSER]
+
+    def parse(self, *pages):
+        """
+        :return: An instance of the House object
+        """
+
+        return self.parser()(*pages)
+
+    def fetch_changed(self, property_id, validators=None):
+        """
+        Downloads the pages of a property again for refresh.py, skipping the cache
+
+        :param property_id: ID returned by search()
+        :param validators: ETag and Last-Modified saved by the last refresh, sent as a conditional request
+        :return: Tuple of the pages as returned by fetch(), or None if the website answered 304 Not Modified,
+                 and the validators to save for the next refresh
+        """
+
+        raise NotImplementedError
+
+    def change_hash(self, pages):
+        """
+        Hashes the parts of the pages that change between refreshes, the values and the deeds,
+        so unchanged pages are not parsed
+
+        :param pages: Tuple returned by fetch_changed()
+        :return: Hex digest
+        """
+
+        raise NotImplementedError
+
+    def lookup(self, query, lazy=False):
+        """
+        Runs a complete lookup
+
+        :param query: Address or property ID
+        :param lazy: Load fields kept on other pages when first used, if the county has any
+        :return: An instance of the House object or None if not found
+        """
+
+        property_id = self.search(query)
+
+        if property_id is None:
+            return None
+
+        return self.lookup_id(property_id)
+
+    def is_property_id(self, query):
+        """
+        Checks a property ID before it is looked up, so a malformed one is reported as bad input
+
+        :param query: Property ID as typed by the user
+        :return: True if the query has the form of the county's property IDs
+        """
+
+        return bool(query.strip())
+
+    def lookup_id(self, property_id):
+        """
+        Looks up a property by its ID, skipping the search
+
+        :return: An instance of the House object
+        """
+
+        return self.parse(*self.fetch(property_id))
+
+    async def lookup_async(self, scraper, query):
+        """
+        Runs a complete lookup on the event loop of an AsyncScraper
+
+        :param scraper: The async_lookup.AsyncScraper sending the requests and parsing the pages
+        :param query: Address or property ID
+        :return: An instance of the House object or None if not found
+        """
+
+        return await scraper.run_in_thread(self.lookup, query)
+
+    async def lookup_id_async(self, scraper, property_id):
+        """
+        Looks up a property by its ID on the event loop of an AsyncScraper
+
+        :param scraper: The async_lookup.AsyncScraper sending the requests and parsing the pages
+        :return: An instance of the House object
+        """
+
+        return await scraper.run_in_thread(self.lookup_id, property_id)
+
+
+# Registered counties, maps the county key to its settings
+# The county modules are only imported when a lookup first needs them
+REGISTRY = {}
+
+# Other ways a county can be written in the menu or an input file, maps them to the county key
+ALIASES = {}
+
+# Maps each zip code to the keys of the counties it is in
+ZIP_CODES = {}
+
+# Maps a 3 digit zip code prefix to the counties of the zip codes starting with it that are not listed
+ZIP_PREFIXES = {}
+
+# Parser chosen for each county with lookup.set_parser(), applied when its module is imported
+CHOSEN_PARSERS = {}
+
+_adapters = {}
+_lock = threading.Lock()
+
+
+def register(key, module, url, name=None, id_label=None, aliases=(), zip_codes=()):
+    """
+    Adds a county so it can be looked up everywhere
+
+    Usage:
+        adapters.register('mcad', 'counties.mcad', 'https://mcad-tx.org', name='Montgomery',
+                          aliases=['montgomery'], zip_codes=['77301', '77302', '77304'])
+
+    :param key: Short lower case name used in input files and the cache i.e. "fbcad"
+    :param module: Import path of the county module, it must have an ADAPTER
+    :param url: Website of the county, requests to it get their own connection pool and rate limiter
+    :param name: County name for people i.e. "Fort Bend"
+    :param id_label: Label of the House element holding the property ID, the key in upper case by default
+    :param aliases: Other names of the county, lower case
+    :param zip_codes: Zip codes in the county, a 3 digit prefix stands for every zip code starting with it
+                      that no county lists in full. A zip code listed by several counties is not auto-detected
+    """
+
+    REGISTRY[key] = {'module': module,
+                     'url': url,
+                     'host': urlsplit(url).netloc,
+                     'name': name or key.upper(),
+                     'id_label': id_label or key.upper()}
+
+    for alias in aliases:
+        ALIASES[alias] = key
+
+    for code in zip_codes:
+        table = ZIP_PREFIXES if len(code) == 3 else ZIP_CODES
+        table.setdefault(code, [])
+        if key not in table[code]:
+            table[code].append(key)
+
+    # Replacing a county drops the adapter already loaded for it
+    with _lock:
+        _adapters.pop(key, None)
+
+
+def resolve_county(name):
+    """
+    Converts a county name, alias or menu number into a county key
+
+    :param name: County as typed by the user i.e. "1", "FBCAD", "Harris"
+    :return: A registered county key i.e. "fbcad"
+    """
+
+    key = str(name).strip().lower()
+    key = ALIASES.get(key, key)
+
+    if key not in REGISTRY:
+        raise ValueError(f'Unknown county: {name}')
+
+    return key
+
+
+def get_adapter(county):
+    """
+    Gets the adapter of a county, importing its module on first use
+
+    :param county: County name, alias or menu number
+    :return: The CountyAdapter of the county
+    """
+
+    key = resolve_county(county)
+
+    with _lock:
+        adapter = _adapters.get(key)
+
+        if adapter is None:
+            adapter = _adapters[key] = importlib.import_module(REGISTRY[key]['module']).ADAPTER
+
+            if CHOSEN_PARSERS.get(key) in adapter.module.PARSERS:
+                adapter.module.PARSER = CHOSEN_PARSERS[key]
+
+    return adapter
+
+
+def loaded_adapter(county):
+    """
+    :param county: County key
+    :return: The CountyAdapter of the county or None if its module was not imported yet
+    """
+
+    with _lock:
+        return _adapters.get(county)
+
+
+def counties():
+    """
+    :return: The keys of the registered counties in the order they were registered
+    """
+
+    return list(REGISTRY)
+
+
+def host_of(county):
+    """
+    :return: The website host of a county i.e. "public.hcad.org", used to limit requests per website
+    """
+
+    return REGISTRY[county]['host']
+
+
+def detect_county(address):
+    """
+    Finds the county of an address from its zip code
+
+    :param address: Address with a zip code at the end i.e. "1234 Main St, Houston TX 77002"
+    :return: The county key or None if there is no zip code, or it is unknown or in several counties
+    """
+
+    code = zip_code(address)
+
+    if code is None:
+        return None
+
+    keys = ZIP_CODES.get(code) or ZIP_PREFIXES.get(code[:3], [])
+
+    return keys[0] if len(keys) == 1 else None
+
+
+# Zip codes shared by Fort Bend and Harris, rows with these need a county
+SHARED_ZIP_CODES = ['77053', '77071', '77083', '77085', '77099', '77450', '77477', '77489', '77494']
+
+register('fbcad', 'counties.fbcad', 'https://esearch.fbcad.org', name='Fort Bend', id_label='FBCAD',
+         aliases=['1', 'fort bend', 'fortbend'],
+         zip_codes=['77406', '77407', '77417', '77441', '77444', '77459', '77461', '77464', '77469', '77471',
+                    '77478', '77479', '77481', '77498', '77545'] + SHARED_ZIP_CODES)
+
+register('hcad', 'counties.hcad', 'https://public.hcad.org', name='Harris', id_label='HCAD',
+         aliases=['2', 'harris'],
+         zip_codes=['770', '77336', '77338', '77339', '77345', '77346', '77373', '77375', '77377', '77379',
+                    '77388', '77389', '77396', '77429', '77433', '77447', '77449', '77493', '77502', '77503',
+                    '77504', '77505', '77506', '77507', '77520', '77521', '77530', '77532', '77536', '77547',
+                    '77562', '77571', '77586', '77587', '77598'] + SHARED_ZIP_CODES)
@@ -0,0 +1,203 @@
+from adapters import REGISTRY, resolve_county
+from addresses import index_key
+import collections
+import threading
+import argparse
+import cache
+import time
+import csv
+
+
+# Rows written to the index at once when importing a file
+IMPORT_BATCH = 10000
+
+# Most addresses kept in memory, least recently used addresses are removed first
+MEMORY_SIZE = 10000
+
+# Addresses resolved in this process, checked before the cache file
+# Maps (county, index_key() of the address) to the property ID
+_memory = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def find(county, address):
+    """
+    Gets the property ID of an address that was found before
+
+    Addresses resolved in this process are answered from memory, the others from the cache file.
+    The cache file is not used when the cache is disabled.
+    Unlike cached pages the index does not expire since an address keeps its property ID.
+    Addresses are matched with their unit and zip code or city, see addresses.index_key().
+
+    :param county: County key i.e. "fbcad"
+    :param address: Address as typed by the user
+    :return: The property ID (FBCAD property ID or HCAD account number) or None
+    """
+
+    key = index_key(address)
+
+    if not key:
+        return None
+
+    with _lock:
+        property_id = _memory.get((county, key))
+        if property_id:
+            _memory.move_to_end((county, key))
+            return property_id
+
+    if not cache.SETTINGS['enabled']:
+        return None
+
+    row = cache.connect().execute('SELECT property_id FROM address_index WHERE county = ? AND address = ?',
+                                  (county, key)).fetchone()
+
+    if row is None:
+        return None
+
+    memorize(county, key, row[0])
+    return row[0]
+
+
+def memorize(county, key, property_id):
+    """
+    Keeps a resolved address in memory
+
+    :param key: The index_key() of the address
+    """
+
+    with _lock:
+        _memory[(county, key)] = property_id
+        _memory.move_to_end((county, key))
+
+        while len(_memory) > MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def add(county, address, property_id, source='lookup'):
+    """
+    Saves the property ID of an address
+
+    :param source: Where the ID came from, "lookup" or "import"
+    """
+
+    key = index_key(address)
+
+    if key and property_id:
+        memorize(county, key, str(property_id).strip())
+
+    add_many(county, [(address, property_id)], source)
+
+
+def add_many(county, pairs, source='import'):
+    """
+    Saves the property IDs of many addresses in one transaction
+
+    :param county: County key i.e. "fbcad"
+    :param pairs: Iterable of (address, property ID) tuples
+    :param source: Where the IDs came from, "lookup" or "import"
+    :return: Number of addresses saved
+    """
+
+    if not cache.SETTINGS['enabled']:
+        return 0
+
+    now = time.time()
+    rows = [(county, index_key(address), str(property_id).strip(), source, now)
+            for address, property_id in pairs]
+    rows = [row for row in rows if row[1] and row[2]]
+
+    # Updating addresses already in memory so they do not keep an old ID
+    with _lock:
+        for row in rows:
+            if (county, row[1]) in _memory:
+                _memory[(county, row[1])] = row[2]
+
+    connection = cache.connect()
+    connection.execute('BEGIN')
+    try:
+        connection.executemany('INSERT OR REPLACE INTO address_index VALUES (?, ?, ?, ?, ?)', rows)
+        connection.execute('COMMIT')
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
+
+    return len(rows)
+
+
+def property_id_of(county, house):
+    """
+    Gets the property ID the county parsers add to the House elements
+
+    :return: The property ID or None
+    """
+
+    for label, value in house.elements:
+        if label == REGISTRY[county]['id_label']:
+            return value
+
+    return None
+
+
+def remember(county, address, house):
+    """
+    Adds the address of a successful lookup to the index so the next lookup can skip the search
+    """
+
+    property_id = property_id_of(county, house)
+
+    if property_id:
+        add(county, address, property_id)
+
+
+def import_csv(path, county, address_column='address', id_column='property_id', delimiter=None):
+    """
+    Adds the addresses of a bulk export file to the index
+
+    The file is read row by row and written in batches so large exports use little memory.
+
+    :param path: CSV file, or a tab separated .txt file such as the HCAD real_acct.txt export
+    :param county: County name or alias
+    :param address_column: Header of the column with the street address
+    :param id_column: Header of the column with the property ID or account number
+    :param delimiter: Column separator, by default a tab for .txt files and a comma otherwise
+    :return: Number of addresses saved
+    """
+
+    county = resolve_county(county)
+
+    if delimiter is None:
+        delimiter = '\t' if path.lower().endswith('.txt') else ','
+
+    total = 0
+
+    with open(path, newline='', encoding='utf-8', errors='replace') as file:
+        reader = csv.DictReader(file, delimiter=delimiter)
+
+        for column in (address_column, id_column):
+            if column not in (reader.fieldnames or []):
+                raise ValueError(f'Column {column} not found in {path}')
+
+        pairs = []
+        for row in reader:
+            pairs.append((row[address_column] or '', row[id_column] or ''))
+
+            if len(pairs) >= IMPORT_BATCH:
+                total += add_many(county, pairs)
+                pairs = []
+
+        total += add_many(county, pairs)
+
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import a bulk export file into the address index')
+    parser.add_argument('input', help='CSV or tab separated .txt file')
+    parser.add_argument('--county', required=True, help='fbcad or hcad')
+    parser.add_argument('--address-column', default='address', help='Header of the street address column')
+    parser.add_argument('--id-column', default='property_id', help='Header of the property ID column')
+    parser.add_argument('--delimiter', help='Column separator, guessed from the file extension by default')
+    args = parser.parse_args()
+
+    count = import_csv(args.input, args.county, args.address_column, args.id_column, args.delimiter)
+    print(f'Imported {count} addresses')
@@ -0,0 +1,226 @@
+import re
+
+
+# USPS street suffix abbreviations (Publication 28, Appendix C1) used by the appraisal districts
+# Only street types are listed, words such as CREEK, LAKE or GLEN are left alone since in these
+# counties they are usually part of the street name i.e. "SAMPLE CREEK DR"
+SUFFIXES = {'ALLEY': 'ALY', 'AVENUE': 'AVE', 'AV': 'AVE', 'AVN': 'AVE', 'BOULEVARD': 'BLVD', 'BLV': 'BLVD',
+            'CIRCLE': 'CIR', 'CIRCL': 'CIR', 'CRCL': 'CIR', 'COURT': 'CT', 'CRT': 'CT', 'COVE': 'CV',
+            'CROSSING': 'XING', 'CRSSNG': 'XING', 'DRIVE': 'DR', 'DRV': 'DR', 'EXPRESSWAY': 'EXPY',
+            'EXPWY': 'EXPY', 'FREEWAY': 'FWY', 'FRWY': 'FWY', 'HIGHWAY': 'HWY', 'HIWAY': 'HWY', 'LANE': 'LN',
+            'LOOP': 'LOOP', 'PARKWAY': 'PKWY', 'PKY': 'PKWY', 'PLACE': 'PL', 'PLAZA': 'PLZ', 'ROAD': 'RD',
+            'SQUARE': 'SQ', 'STREET': 'ST', 'STR': 'ST', 'TERRACE': 'TER', 'TRACE': 'TRCE', 'TRAIL': 'TRL',
+            'WAY': 'WAY'}
+
+# Suffixes as typed or already abbreviated
+STREET_TYPES = set(SUFFIXES) | set(SUFFIXES.values())
+
+# Street directionals and their abbreviations
+DIRECTIONALS = {'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W',
+                'NORTHEAST': 'NE', 'NORTHWEST': 'NW', 'SOUTHEAST': 'SE', 'SOUTHWEST': 'SW',
+                'N': 'N', 'S': 'S', 'E': 'E', 'W': 'W', 'NE': 'NE', 'NW': 'NW', 'SE': 'SE', 'SW': 'SW'}
+
+# Words that start a unit number i.e. "APT 5", the word and the number after it are removed
+UNIT_WORDS = {'APT', 'APARTMENT', 'UNIT', 'STE', 'SUITE', 'BLDG', 'BUILDING', 'LOT', 'RM', 'ROOM', 'FL', 'FLOOR',
+              'SPC', 'SPACE', 'NO', '#'}
+
+# Characters that are not part of an address, "#" is kept to find unit numbers
+PUNCTUATION = re.compile(r"[^\w#/ -]")
+
+# A unit number written straight after a "#" i.e. "#5"
+UNIT_NUMBER = re.compile(r'#\s*\S+')
+
+# A 5 digit zip code, with or without the +4, at the end of an address after the street
+ZIP_CODE = re.compile(r'\S.*\b(\d{5})(?:-\d{4})?\s*$')
+
+
+def street_line(address):
+    """
+    Gets the street part of an address, the city, state and zip code come after the first comma
+
+    :param address: Address as typed i.e. "1234 Main Street, Houston TX 77002"
+    :return: The part before the first comma i.e. "1234 Main Street"
+    """
+
+    return address.split(',')[0]
+
+
+def normalize_address(address):
+    """
+    Converts an address into the form the appraisal districts use so small differences
+    in how it is typed do not cause a failed search
+
+    Usage:
+        normalize_address('1234 North Main Street Apt. 5, Houston TX')  # '1234 N MAIN ST'
+
+    :param address: Address as typed by the user
+    :return: Upper case street address with USPS suffixes and directionals, without the unit number
+    """
+
+    text = PUNCTUATION.sub(' ', street_line(address).upper())
+    text = UNIT_NUMBER.sub(' ', text)
+    words = text.split()
+
+    # Removing the unit number and everything after it
+    for position, word in enumerate(words):
+        if position > 1 and word in UNIT_WORDS:
+            words = words[:position]
+            break
+
+    if not words:
+        return ''
+
+    # A directional at the end of the address i.e. "MAIN ST NORTH"
+    if len(words) > 2 and words[-1] in DIRECTIONALS and words[-2] in STREET_TYPES:
+        words[-1] = DIRECTIONALS[words[-1]]
+        suffix = -2
+    else:
+        suffix = -1
+
+    # The suffix is only changed when there is a street name before it i.e. "100 PLAZA" stays the same
+    start = 1 if words[0].isdigit() else 0
+    if len(words) - start > 1 and words[suffix] in SUFFIXES:
+        words[suffix] = SUFFIXES[words[suffix]]
+
+    # A directional before the street name i.e. "NORTH MAIN ST", kept when it is the street name itself
+    if len(words) - start > 2 and words[start] in DIRECTIONALS:
+        words[start] = DIRECTIONALS[words[start]]
+
+    return ' '.join(words)
+
+
+def split_address(address):
+    """
+    Splits an address into its street number and street name
+
+    :param address: Address as typed by the user
+    :return: Tuple of the street number ('' if there is none) and the normalized street name
+    """
+
+    words = normalize_address(address).split()
+
+    if words and words[0].isdigit():
+        return words[0], ' '.join(words[1:])
+
+    return '', ' '.join(words)
+
+
+def zip_code(address):
+    """
+    Gets the zip code at the end of an address
+
+    :param address: Address as typed i.e. "1234 Main St, Houston TX 77002-1234"
+    :return: The 5 digit zip code i.e. "77002" or None if there is none
+    """
+
+    match = ZIP_CODE.match(address.strip())
+    return match.group(1) if match else None
+
+
+def unit_number(address):
+    """
+    Gets the unit number of an address
+
+    Usage:
+        unit_number('1234 Main St Apt. 5, Houston TX')  # '5'
+        unit_number('1234 Main St #12B')  # '12B'
+
+    :param address: Address as typed by the user
+    :return: The unit number in upper case or None if there is none
+    """
+
+    text = PUNCTUATION.sub(' ', street_line(address).upper())
+
+    match = UNIT_NUMBER.search(text)
+    if match:
+        return match.group(0).lstrip('#').strip()
+
+    words = text.split()
+
+    for position, word in enumerate(words[:-1]):
+        if position > 1 and word in UNIT_WORDS:
+            return words[position + 1].lstrip('#') or None
+
+    return None
+
+
+def locality(address):
+    """
+    Gets the part of an address that tells streets of the same name apart, the zip code or else the city
+
+    :param address: Address as typed i.e. "1234 Main St, Sugar Land TX 77479"
+    :return: The zip code i.e. "77479", the city in upper case i.e. "SUGAR LAND", or '' if there is neither
+    """
+
+    code = zip_code(address)
+    if code:
+        return code
+
+    if ',' not in address:
+        return ''
+
+    words = PUNCTUATION.sub(' ', address.split(',', 1)[1].upper()).split()
+    return ' '.join(word for word in words if word not in ('TX', 'TEXAS') and not word[0].isdigit())
+
+
+def index_key(address):
+    """
+    Converts an address into its key in the address index
+
+    The unit and the zip code or city are part of the key so the units of a building, and the same
+    street in two cities, are not mixed up. An address typed without them only matches others without them.
+
+    Usage:
+        index_key('1234 North Main Street Apt. 5, Houston TX 77002')  # '1234 N MAIN ST #5, 77002'
+
+    :param address: Address as typed by the user
+    :return: The key, '' if there is no street address
+    """
+
+    street = normalize_address(address)
+
+    if not street:
+        return ''
+
+    unit = unit_number(address)
+    if unit:
+        street += f' #{unit}'
+
+    place = locality(address)
+
+    return f'{street}, {place}' if place else street
+
+
+def situs_address(address):
+    """
+    Rewrites a situs address that has the city before the comma, as in the FBCAD search results,
+    with the comma after the street like an address typed by a user
+
+    Usage:
+        situs_address('1234 SAMPLE CREEK DR SUGAR LAND, TX 77479')  # '1234 SAMPLE CREEK DR, SUGAR LAND TX 77479'
+        situs_address('500 PARK PLACE DR UNIT 5 RICHMOND, TX 77469')  # '500 PARK PLACE DR UNIT 5, RICHMOND TX 77469'
+
+    :param address: Situs address
+    :return: The address, unchanged when no street type is found
+    """
+
+    line, _, rest = address.partition(',')
+    words = PUNCTUATION.sub(' ', line.upper()).split()
+
+    # Looking from the end so a street type inside the street name is not taken i.e. "PARK PLACE DR"
+    for position in range(len(words) - 1, 0, -1):
+        if words[position] in STREET_TYPES:
+            end = position + 1
+            if end < len(words) and words[end] in DIRECTIONALS:
+                end += 1
+
+            # Keeping the unit with the street i.e. "UNIT 5" or "#5"
+            if end < len(words) and words[end].startswith('#'):
+                end += 2 if words[end] == '#' else 1
+            elif end + 1 < len(words) and words[end] in UNIT_WORDS:
+                end += 2
+
+            city = ' '.join(words[end:] + rest.split())
+            return f"{' '.join(words[:end])}, {city}" if city else ' '.join(words[:end])
+
+    return address
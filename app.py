@@ -1,96 +1,250 @@
 from utilities import format_result
-from counties import fbcad, hcad
-import pyperclip
-import os
+from lookup import lookup, lookup_id, set_parser
+from exporters import open_writer
+from adapters import REGISTRY, resolve_county
+import argparse
+import bulk
+import cache
+import sys
 
 
-def start_program():
+# ANSI codes that clear the terminal and move the cursor to the top
+# Used instead of running the "cls" command in a new shell
+CLEAR_SCREEN = '\033[2J\033[H'
+
+
+def copy_to_clipboard(text):
     """
-    Clears the command prompt screen
-    Then initiates the program
+    Copies the text to the clipboard, does nothing if no clipboard is available
+    i.e. when running on a server
     """
 
-    # Clears the cmd screen
-    os.system('cls')
-    selection = input('(1) FBCAD or (2) HCAD > ')
-    go_to(selection)
+    import pyperclip
+
+    try:
+        pyperclip.copy(text)
+    except pyperclip.PyperclipException:
+        pass
+
 
+def pause():
+    input('\nPress Enter to continue...')
 
-def go_to(selection):
+
+def interactive():
     """
-    Processes the User selection to route the script
-    Enables functionality to go back to start_program()
+    Asks the user for a county and an address, shows the result and starts over
+
+    The user can enter x to go back to the county selection and q to quit.
     """
 
-    result = None
+    # Menu choices and the county each one selects, one number per registered county
+    menu = {str(number): county for number, county in enumerate(REGISTRY, start=1)}
+    prompt = ' or '.join(f"({number}) {REGISTRY[county]['id_label']}" for number, county in menu.items())
+
+    while True:
+        # Clears the screen
+        print(CLEAR_SCREEN, end='')
+        selection = input(f'{prompt} > ').strip()
+
+        if selection.lower() == 'q':
+            return
+
+        if selection not in menu:
+            continue
 
-    if selection == '1':
         # Ask the user for the address to search
-        print('\nFort Bend County selected. Enter (x) to go back.\n')
-        query = input("Enter Property Address > ")
+        print(f"\n{REGISTRY[menu[selection]]['name']} County selected. Enter (x) to go back.\n")
+        query = input("Enter Property Address > ").strip()
 
-        # If user inputs x, restart the program
+        # If user inputs x, go back to the county selection
         if query.lower() == 'x':
-            start_program()
+            continue
 
-        else:
-            # Running a search on the address
-            print("\nSearching...")
-            try:
-                result = fbcad.get_property_id(query.strip())
+        # Running a search on the address
+        print("\nSearching...")
 
-            except Exception as e:
-                result = None
-                print(f'\nReceived error: \n\n{e}\n\n')
-                os.system('pause')
-                start_program()
+        try:
+            result = lookup(menu[selection], query)
+        except Exception as e:
+            print(f'\nReceived error: \n\n{e}\n\n')
+            pause()
+            continue
 
         # Checking if the property was found
         if result:
-            pyperclip.copy(format_result(result))
+            copy_to_clipboard(format_result(result))
             print(format_result(result))
-            os.system('pause')
-
         else:
-            print(f'\nNo Results for: {query.strip()}')
-            os.system('pause')
-            start_program()
+            print(f'\nNo Results for: {query}')
 
-    elif selection == '2':
-        # Ask the user for the address to search
-        print('\nHarris County selected. Enter (x) to go back.\n')
-        query = input("Enter Property Address > ")
+        pause()
 
-        # If user inputs x, restart the program
-        if query.lower() == 'x':
-            start_program()
 
-        else:
-            # Running a search on the address
-            print("\nSearching...")
+def run_sweep(args):
+    """
+    Finds every FBCAD property of a street or subdivision and downloads their pages
 
-            try:
-                result = hcad.get_data(query.strip())
+    :return: Exit code, 1 if nothing was found
+    """
 
-            except Exception as e:
-                result = None
-                print(f'\nReceived error: \n\n{e}\n\n')
-                os.system('pause')
-                start_program()
+    from counties import fbcad
+
+    if not args.output and not cache.SETTINGS['enabled']:
+        print('Without the cache the downloaded pages are not kept, use --output to save the results',
+              file=sys.stderr)
+        return 1
+
+    records = fbcad.sweep(args.keywords, args.workers, parse=bool(args.output))
+
+    if args.output:
+        with open_writer(args.output) as writer:
+            for record in records:
+                writer.write(record)
+
+    statuses = {}
+    for record in records:
+        statuses[record['status']] = statuses.get(record['status'], 0) + 1
+
+    print(f'{len(records)} properties for: {args.keywords} {statuses}')
+    return 0 if records else 1
 
-        # Checking if the property was found
-        if result:
-            pyperclip.copy(format_result(result))
-            print(format_result(result))
-            os.system('pause')
 
+def run_lookup(args):
+    """
+    Looks up a single address and prints the result
+
+    :return: Exit code, 0 if found and 1 if not found or the lookup failed
+    """
+
+    try:
+        if args.id:
+            result = lookup_id(args.county, args.address)
         else:
-            print(f'\nNo Results for: {query.strip()}')
-            os.system('pause')
-            start_program()
+            result = lookup(args.county, args.address)
+    except Exception as e:
+        print(f'Lookup failed for {args.address}: {e}', file=sys.stderr)
+        return 1
 
+    if not result:
+        print(f'No Results for: {args.address}', file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(result.to_json())
     else:
-        start_program()
+        print(format_result(result))
+
+    if args.copy:
+        copy_to_clipboard(format_result(result))
+
+    return 0
+
+
+def add_settings(parser):
+    """
+    Adds the options shared by the lookup and interactive commands
+    """
+
+    parser.add_argument('--parser', choices=['soup', 'lxml', 'stream'], default='soup',
+                        help='How pages are parsed, lxml is faster and gives the same results, '
+                             'stream is lxml parsing pages while they download, it only saves memory '
+                             'with --no-cache since the cache keeps the page text')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or save cached results')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached results but save the new ones')
+    parser.add_argument('--no-bulk', action='store_true', help='Do not answer from the loaded export files')
+
+
+def build_parser(command=None):
+    """
+    :param command: The command being run, the batch and serve options are only added for their own
+                    command since their modules are slow to import. None adds every option
+    """
+
+    parser = argparse.ArgumentParser(description='Scrape property data from the Fort Bend and Harris '
+                                                 'County Appraisal District websites')
+    commands = parser.add_subparsers(dest='command')
+
+    lookup_parser = commands.add_parser('lookup', help='Look up a single address')
+    lookup_parser.add_argument('address', help='Property address, or account number for HCAD')
+    lookup_parser.add_argument('--county', required=True, help='County name or alias i.e. fbcad or hcad')
+    lookup_parser.add_argument('--id', action='store_true',
+                               help='The address is an FBCAD property ID or HCAD account number')
+    lookup_parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+    lookup_parser.add_argument('--copy', action='store_true', help='Copy the formatted result to the clipboard')
+    add_settings(lookup_parser)
+
+    batch_parser = commands.add_parser('batch', help='Look up a file of addresses')
+    if command in (None, 'batch'):
+        import batch
+        batch.add_arguments(batch_parser)
+
+    sweep_parser = commands.add_parser('sweep', help='Download every FBCAD property of a street or subdivision')
+    sweep_parser.add_argument('keywords', help='Street or subdivision name i.e. "Sample Creek"')
+    sweep_parser.add_argument('--workers', type=int, default=4, help='Most property pages downloaded at once')
+    sweep_parser.add_argument('--output', help='Also parse the properties and write them to a file')
+    add_settings(sweep_parser)
+
+    serve_parser = commands.add_parser('serve', help='Answer lookups over HTTP as JSON for other tools')
+    if command in (None, 'serve'):
+        import server
+        server.add_arguments(serve_parser)
+
+    interactive_parser = commands.add_parser('interactive', help='Ask for addresses one at a time (default)')
+    add_settings(interactive_parser)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs the command given on the command line, the interactive prompt if there is none
+
+    :param argv: Command line arguments, defaults to sys.argv
+    :return: Exit code
+    """
+
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Only the modules of the command being run are imported, the prompt shows up sooner
+    parser = build_parser(argv[0] if argv else 'interactive')
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        import batch
+        batch.run_from_args(args)
+        return 0
+
+    if args.command == 'serve':
+        import server
+        server.run_from_args(args)
+        return 0
+
+    # Running without a command starts the interactive prompt with the default settings
+    if args.command is None:
+        args = parser.parse_args(['interactive'])
+
+    cache.configure(enabled=not args.no_cache, refresh=args.refresh)
+    bulk.configure(enabled=not args.no_bulk)
+    set_parser(args.parser)
+
+    if args.command == 'lookup':
+        try:
+            args.county = resolve_county(args.county)
+        except ValueError as e:
+            parser.error(str(e))
+        return run_lookup(args)
+
+    if args.command == 'sweep':
+        return run_sweep(args)
+
+    try:
+        interactive()
+    except (KeyboardInterrupt, EOFError):
+        print()
+
+    return 0
 
 
-start_program()
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from adapters import get_adapter, host_of, counties, resolve_county
+from limiter import PRIORITIES
+from client import HEADERS
+import address_index
+import bulk
+import functools
+import client
+import aiohttp
+import asyncio
+import cache
+
+
+class AsyncScraper:
+    """
+    Runs lookups for every registered county on an asyncio event loop
+
+    The HTTP requests of many lookups are in flight at the same time while
+    the CPU heavy parsing is sent to a thread or process pool so it does
+    not block the event loop. Each lookup is run by its county adapter
+    (CountyAdapter.lookup_async), which sends its requests with request()
+    and parses with parse().
+
+    Usage:
+        async with AsyncScraper() as scraper:
+            house = await scraper.fetch_house('hcad', '123 Main St')
+    """
+
+    def __init__(self, per_host=20, timeout=30, parse_workers=None, processes=False, priority='bulk'):
+        """
+        :param per_host: Most requests in flight at once against one county website
+        :param timeout: Seconds to wait for a website to respond
+        :param parse_workers: Number of threads/processes parsing pages
+        :param processes: Parse in a process pool to use all cores instead of a thread pool
+        :param priority: Priority class of the requests at the rate limiters shared with the threaded lookups,
+                         a key of limiter.PRIORITIES
+        """
+
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}')
+
+        self.priority = priority
+        self.per_host = per_host
+        self.timeout = timeout
+        self.limits = None
+        pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self.executor = pool(max_workers=parse_workers)
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        if self.limits is None:
+            # One semaphore per county website, created here so they belong to the running event loop
+            self.limits = {host_of(county): asyncio.Semaphore(self.per_host) for county in counties()}
+
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.per_host)
+            self.session = aiohttp.ClientSession(headers=HEADERS, connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self.executor.shutdown(wait=False)
+
+    async def request(self, county, method, url, **kwargs):
+        """
+        Sends a request while holding one of the slots for the county website
+
+        :return: The text of the page
+        """
+
+        await self.open()
+
+        # The rate limiter of the website is shared with the threaded lookups
+        limiter = client.get_limiter(url)
+
+        async with self.limits[host_of(county)]:
+            await limiter.acquire_async(PRIORITIES[self.priority])
+
+            # Set before the request so an error raised before the response (i.e. too many redirects) can release
+            throttled = False
+
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    throttled = response.status in client.THROTTLE_STATUS
+                    # Check for errors
+                    response.raise_for_status()
+                    page = await response.text()
+            except asyncio.TimeoutError:
+                limiter.release(throttled=True)
+                raise
+            except aiohttp.ClientResponseError:
+                limiter.release(throttled=throttled)
+                raise
+            except Exception:
+                limiter.release()
+                raise
+
+            limiter.release()
+            return page
+
+    async def parse(self, function, *args):
+        """
+        Runs a county parse function in the pool so the event loop keeps serving requests
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    async def fetch_house(self, county, query):
+        """
+        Looks up a property on the website of the given county
+
+        :param county: County name, alias or menu number
+        :param query: Property address (or account number for HCAD)
+        :return: An instance of the House object or None if not found
+        """
+
+        county = resolve_county(county)
+        query = query.strip()
+
+        # Returning the saved result if this address was looked up before or is in the export files
+        house = bulk.find_house(county, query) or cache.get_house(county, 'address', query)
+        if house:
+            return house
+
+        house = await get_adapter(county).lookup_async(self, query)
+
+        if house:
+            cache.put_house(county, 'address', query, house)
+            address_index.remember(county, query, house)
+
+        return house
+
+    async def fetch_id(self, county, property_id):
+        """
+        Looks up a property by its FBCAD property ID or HCAD account number
+
+        :return: An instance of the House object
+        """
+
+        county = resolve_county(county)
+        property_id = str(property_id).strip()
+
+        house = bulk.find_house(county, property_id) or cache.get_house(county, 'id', property_id)
+        if house:
+            return house
+
+        house = await get_adapter(county).lookup_id_async(self, property_id)
+
+        cache.put_house(county, 'id', property_id, house)
+
+        return house
+
+    async def cached_request(self, county, kind, key, method, url, **kwargs):
+        """
+        Gets a page from the cache or downloads it and saves it in the cache
+        """
+
+        page = cache.get_page(county, kind, key)
+
+        if page is None:
+            page = await self.request(county, method, url, **kwargs)
+            cache.put_page(county, kind, key, page)
+
+        return page
+
+    async def run_in_thread(self, function, *args):
+        """
+        Runs a threaded lookup, for counties whose adapter does not send its requests on the event loop,
+        so new counties work here before getting an async implementation
+
+        :param function: i.e. the lookup() method of an adapter
+        :return: The result of the function
+        """
+
+        loop = asyncio.get_running_loop()
+
+        def run():
+            # The requests of the thread are sent in the scraper's priority class
+            with client.priority(self.priority):
+                return function(*args)
+
+        # Not the parse executor, it may be a process pool
+        return await loop.run_in_executor(None, run)
+
+    async def fetch_all(self, queries):
+        """
+        Looks up many properties at once
+
+        :param queries: Iterable of (county, query) tuples
+        :return: List of House objects, None or the exception raised, in the same order as the queries
+        """
+
+        tasks = [self.fetch_house(county, query) for county, query in queries]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Scraper used by fetch_house(), created on first use
+_scraper = None
+
+
+async def fetch_house(county, query):
+    """
+    Looks up a property using a shared AsyncScraper
+
+    :param county: County name, alias or menu number
+    :param query: Property address (or account number for HCAD)
+    :return: An instance of the House object or None if not found
+    """
+
+    global _scraper
+
+    if _scraper is None:
+        _scraper = AsyncScraper()
+
+    return await _scraper.fetch_house(county, query)
+
+
+async def close():
+    """
+    Closes the shared AsyncScraper, call before the event loop ends
+    """
+
+    global _scraper
+
+    if _scraper is not None:
+        await _scraper.close()
+        _scraper = None
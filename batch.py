@@ -0,0 +1,356 @@
+from lookup import lookup, resolve_county, set_parser
+from adapters import REGISTRY, detect_county
+from exporters import WRITERS, open_writer
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import argparse
+import cProfile
+import scheduler
+import metrics
+import client
+import pstats
+import bulk
+import sys
+import cache
+import time
+import csv
+
+
+def read_rows(path, default_county=None):
+    """
+    Reads the addresses to look up from a CSV or plain text file
+
+    A CSV file needs a header row with an "address" column and
+    optionally a "county" column. Any other file is treated as
+    one address per line, all searched in the default county.
+    Without a default county, rows that do not name one go to
+    the county of their zip code.
+
+    :param path: Path to the input file
+    :param default_county: County used when a row does not name one
+    :return: A generator of (row number, county, address) tuples
+    """
+
+    with open(path, newline='', encoding='utf-8') as f:
+        first_line = f.readline()
+        f.seek(0)
+
+        # Checking if the file has a CSV header naming the address column
+        header = [column.strip().lower() for column in next(csv.reader([first_line]), [])]
+
+        if 'address' in header:
+            reader = csv.DictReader(f)
+            # Matching the header names without caring about case or spaces
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+            for number, row in enumerate(reader, start=1):
+                address = (row.get('address') or '').strip()
+                if address:
+                    yield number, row.get('county') or default_county or detect_county(address), address
+        else:
+            for number, line in enumerate(f, start=1):
+                address = line.strip()
+                if address:
+                    yield number, default_county or detect_county(address), address
+
+
+def percentile(values, percent):
+    """
+    Gets the nearest-rank percentile from a list of numbers
+
+    :param values: List of numbers
+    :param percent: Percentile to get i.e. 95
+    :return: The percentile value or 0 if the list is empty
+    """
+
+    if not values:
+        return 0
+
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class BatchStats:
+    """
+    Keeps count of the lookups in a batch run and how long each one took
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.hosts = {}
+        self.found = 0
+        self.not_found = 0
+        self.errors = 0
+        self.started = time.monotonic()
+
+    def record(self, county, status, latency):
+        with self.lock:
+            self.latencies.append(latency)
+            # Rows with an unknown county did not reach any website
+            if county in REGISTRY:
+                host = REGISTRY[county]['host']
+                self.hosts[host] = self.hosts.get(host, 0) + 1
+            if status == 'found':
+                self.found += 1
+            elif status == 'not found':
+                self.not_found += 1
+            else:
+                self.errors += 1
+
+    def report(self):
+        """
+        :return: A string summarizing the throughput and latency of the run
+        """
+
+        elapsed = time.monotonic() - self.started
+        total = len(self.latencies)
+        rate = total / elapsed if elapsed else 0
+
+        hosts = '\n'.join(f'  {host}: {count}' for host, count in sorted(self.hosts.items()))
+
+        limits = '\n'.join(f"  {limit['host']}: {limit['rate']} requests/sec, {limit['concurrency']} at once, "
+                           f"{limit['throttled']} throttled"
+                           for limit in client.limiter_stats())
+
+        return f"""
+Lookups    : {total} ({self.found} found, {self.not_found} not found, {self.errors} errors)
+Elapsed    : {elapsed:.2f}s
+Throughput : {rate:.2f} lookups/sec
+Latency p50: {percentile(self.latencies, 50):.3f}s
+Latency p95: {percentile(self.latencies, 95):.3f}s
+Per host   :
+{hosts}
+Rate limits:
+{limits or '  no requests sent'}
+"""
+
+
+def run_one(number, county, address, limits, stats):
+    """
+    Looks up a single address while holding the concurrency slot for its county
+
+    :return: A dict describing the outcome, ready to be written out,
+             failed lookups have "retryable" set to client.is_retryable() of the error
+    """
+
+    record = {'row': number, 'county': county, 'query': address}
+    started = time.monotonic()
+
+    try:
+        if not county:
+            raise ValueError('No county given and the zip code is missing or in several counties')
+
+        county = resolve_county(county)
+        record['county'] = county
+
+        # Queued as bulk on the shared scheduler so interactive lookups in this process go first
+        with limits[county]:
+            house = scheduler.run('bulk', county, lookup, address)
+
+        if house:
+            record['status'] = 'found'
+            record['house'] = house
+        else:
+            record['status'] = 'not found'
+
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+        record['retryable'] = client.is_retryable(e)
+
+    record['latency'] = round(time.monotonic() - started, 3)
+    stats.record(record['county'], record['status'], record['latency'])
+
+    return record
+
+
+def run_batch(rows, writer, workers=8, per_host=4):
+    """
+    Looks up many addresses at once and writes each result as soon as it completes
+
+    :param rows: Iterable of (row number, county, address) tuples
+    :param writer: A writer from exporters.py, results are passed to it as soon as they complete
+    :param workers: Number of lookups running at the same time
+    :param per_host: Most lookups allowed at once against a single county website
+    :return: A BatchStats instance for the run
+    """
+
+    stats = BatchStats()
+
+    # One semaphore per county so a slow website cannot take all the workers
+    limits = {county: threading.BoundedSemaphore(per_host) for county in REGISTRY}
+
+    # The lookups run on the scheduler's threads, the pool threads wait for them
+    scheduler.fit(workers, per_host)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        for number, county, address in rows:
+            pending.add(pool.submit(run_one, number, county, address, limits, stats))
+
+            # Only keep a limited number of lookups queued so large files are not loaded at once
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write_results(done, writer)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write_results(done, writer)
+
+    return stats
+
+
+def write_results(futures, writer):
+    for future in futures:
+        writer.write(future.result())
+
+
+def add_arguments(parser):
+    """
+    Adds the batch options to an argparse parser
+    """
+
+    parser.add_argument('input', help='CSV file with an address column, or a file with one address per line')
+    parser.add_argument('output', help='File the results are written to, as JSON lines, CSV, Parquet or Arrow')
+    parser.add_argument('--format', choices=sorted(WRITERS),
+                        help='Format of the output file, by default picked from its extension')
+    parser.add_argument('--flush-every', type=int, help='Number of results written to the output file at once')
+    parser.add_argument('--county', help='County used for rows without a county column i.e. fbcad or hcad, '
+                                         'by default picked from the zip code')
+    parser.add_argument('--workers', type=int, default=8, help='Number of lookups running at the same time')
+    parser.add_argument('--per-host', type=int, default=4, help='Most lookups at once against one county website')
+    parser.add_argument('--parser', choices=['soup', 'lxml', 'stream'], default='soup',
+                        help='How pages are parsed, lxml is faster and gives the same results, '
+                             'stream is lxml parsing pages while they download, it only saves memory '
+                             'with --no-cache since the cache keeps the page text')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Parse pages in separate processes to use all cores')
+    parser.add_argument('--parse-workers', type=int, help='Number of parsing processes with --pipeline')
+    parser.add_argument('--chunk-size', type=int, default=20,
+                        help='Pages sent to a parsing process at once with --pipeline')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or save cached results')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached results but save the new ones')
+    parser.add_argument('--no-bulk', action='store_true', help='Do not answer from the loaded export files')
+    parser.add_argument('--rate', type=float, help='Requests per second sent to each website to start with')
+    parser.add_argument('--fixed-rate', action='store_true',
+                        help='Keep the starting rate instead of adjusting it to how the websites respond')
+    parser.add_argument('--journal', metavar='FILE',
+                        help='Keep the progress in a journal file so a stopped run resumes where it left off')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help='Run cProfile around the batch and print the hot spots, '
+                             'also saving the full profile if a file is given')
+    parser.add_argument('--metrics-json', metavar='FILE', help='Save the time spent in each lookup stage to a JSON file')
+    parser.add_argument('--metrics-port', type=int, help='Serve the stage timings for Prometheus at :PORT/metrics')
+
+
+def run_from_args(args):
+    cache.configure(enabled=not args.no_cache, refresh=args.refresh)
+    bulk.configure(enabled=not args.no_bulk)
+    client.configure(adaptive=not args.fixed_rate, **({'rate': args.rate} if args.rate else {}))
+    set_parser(args.parser)
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    if args.profile:
+        stats, profile_stats = run_profiled(run_job, args)
+        print_profile(profile_stats, args.profile)
+    else:
+        stats = run_job(args)
+
+    print(stats.report())
+    print(metrics.report())
+
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+
+
+def run_job(args):
+    """
+    Runs the batch described by the command line arguments
+
+    :return: A BatchStats instance for the run
+    """
+
+    if args.journal:
+        # Imported here since the jobs module uses run_one from this module
+        import jobs
+
+        with jobs.Journal(args.journal) as journal:
+            journal.add_rows(read_rows(args.input, args.county))
+            stats = jobs.run(journal, workers=args.workers, per_host=args.per_host)
+            jobs.export(journal, args.output, args.format, args.flush_every)
+
+        return stats
+
+    with open_writer(args.output, args.format, args.flush_every) as writer:
+        rows = read_rows(args.input, args.county)
+
+        if args.pipeline:
+            # Imported here since the pipeline module uses BatchStats from this module
+            from pipeline import run_pipeline
+            stats = run_pipeline(rows, writer, workers=args.workers, per_host=args.per_host,
+                                 parse_workers=args.parse_workers, chunk_size=args.chunk_size)
+        else:
+            stats = run_batch(rows, writer, workers=args.workers, per_host=args.per_host)
+
+    return stats
+
+
+def run_profiled(function, *args):
+    """
+    Runs a function under cProfile, including the worker threads it starts
+
+    Parsing processes started by the pipeline are not profiled.
+
+    :return: Tuple of the function's result and the pstats.Stats of all the threads
+    """
+
+    profilers = [cProfile.Profile()]
+
+    def profile_thread(*ignored):
+        # Called on the first event of each new thread, the thread's own profiler then takes over
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+
+    # From Python 3.12 a single profiler sees every thread
+    if sys.version_info < (3, 12):
+        threading.setprofile(profile_thread)
+
+    profilers[0].enable()
+    try:
+        result = function(*args)
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None)
+
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+
+    return result, stats
+
+
+def print_profile(stats, path='-', top=25):
+    """
+    Prints the functions that took the most time
+
+    :param stats: pstats.Stats of the run
+    :param path: File the full profile is saved to, "-" to only print it
+    :param top: Number of functions printed
+    """
+
+    if path != '-':
+        stats.dump_stats(path)
+
+    stats.sort_stats('cumulative').print_stats(top)
+    stats.sort_stats('tottime').print_stats(top)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Look up a file of addresses on the CAD websites')
+    add_arguments(arg_parser)
+    run_from_args(arg_parser.parse_args())
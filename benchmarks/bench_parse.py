@@ -0,0 +1,159 @@
+import os
+import sys
+
+# Allowing the benchmark to be run from any folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from counties import fbcad, hcad
+import statistics
+import tracemalloc
+import warnings
+import argparse
+import json
+import glob
+import time
+
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+
+def load_cases(folder):
+    """
+    Finds the saved pages to benchmark
+
+    Pages are matched by name so more can be added by saving them next to the others:
+    fbcad_search*.json, fbcad_view*.html, hcad_record*.html and hcad_ownership*.html
+    (the ownership page with the same ending as the record page is used with it)
+
+    :param folder: Folder containing the saved pages
+    :return: List of (name, parser name, function) where the function parses the page with that parser
+    """
+
+    def read(path):
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    cases = []
+
+    for path in sorted(glob.glob(os.path.join(folder, 'fbcad_search*.json'))):
+        page = read(path)
+        # The search results are JSON so there is only one way to parse them
+        cases.append((os.path.basename(path), 'json', lambda page=page: json.loads(page)['resultsList'][0]))
+
+    for path in sorted(glob.glob(os.path.join(folder, 'fbcad_view*.html'))):
+        page = read(path)
+        for parser, function in fbcad.PARSERS.items():
+            cases.append((os.path.basename(path), parser,
+                          lambda page=page, function=function: function(page, 'R000000')))
+
+    for path in sorted(glob.glob(os.path.join(folder, 'hcad_record*.html'))):
+        page = read(path)
+        ownership_path = path.replace('hcad_record', 'hcad_ownership')
+        ownership_page = read(ownership_path) if os.path.exists(ownership_path) else None
+        for parser, function in hcad.PARSERS.items():
+            cases.append((os.path.basename(path), parser,
+                          lambda page=page, ownership_page=ownership_page, function=function:
+                          function(page, ownership_page)))
+
+    # Saved pages are parsed by "stream" with the lxml parser, it only differs when downloading
+    return [case for case in cases if case[1] != 'stream']
+
+
+def measure(function, repeat):
+    """
+    Times a parse and measures the memory it uses
+
+    :param function: Function parsing one page
+    :param repeat: Number of timed runs
+    :return: Dict of timings in milliseconds, peak memory in KB and blocks still allocated after the parse
+    """
+
+    # Warming up so imports and caches do not count towards the first run
+    function()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # Memory is measured on a separate run since tracing slows down the parse
+    # tracemalloc only sees memory allocated by Python, the lxml tree itself is built in C and is not counted
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = function()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del result
+
+    return {'min_ms': round(min(timings), 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'peak_kb': round(peak / 1024, 1),
+            'blocks': blocks}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares median parse times against a previous run
+
+    :param results: Results of this run
+    :param baseline: Results loaded from a previous --output file
+    :param tolerance: Allowed slowdown i.e. 0.2 for 20%
+    :return: List of messages for each case that got slower than allowed
+    """
+
+    failures = []
+
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        allowed = baseline[key]['median_ms'] * (1 + tolerance)
+        if result['median_ms'] > allowed:
+            failures.append(f"{key}: {result['median_ms']}ms is slower than {baseline[key]['median_ms']}ms")
+
+    return failures
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Benchmark the county page parsers on saved pages')
+    arg_parser.add_argument('--fixtures', default=FIXTURES, help='Folder containing the saved pages')
+    arg_parser.add_argument('--repeat', type=int, default=50, help='Number of timed runs for each page')
+    arg_parser.add_argument('--output', help='Save the results to this JSON file')
+    arg_parser.add_argument('--baseline', help='Fail if slower than the results saved in this JSON file')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline')
+    args = arg_parser.parse_args(argv)
+
+    # BeautifulSoup warns about some of the arguments used by the county modules
+    warnings.simplefilter('ignore')
+
+    results = {}
+
+    print(f"{'page':<26}{'parser':<8}{'min ms':>10}{'median ms':>11}{'peak KB':>10}{'blocks':>9}")
+
+    for name, parser, function in load_cases(args.fixtures):
+        result = measure(function, args.repeat)
+        results[f'{name}:{parser}'] = result
+        print(f"{name:<26}{parser:<8}{result['min_ms']:>10}{result['median_ms']:>11}"
+              f"{result['peak_kb']:>10}{result['blocks']:>9}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            failures = compare(results, json.load(f), args.tolerance)
+        for failure in failures:
+            print(failure)
+        if failures:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import os
+import sys
+
+# Allowing the benchmark to be run from any folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import subprocess
+import statistics
+import argparse
+import json
+import re
+
+
+# What app.py runs before showing the first prompt, without waiting for input
+STARTUP = "import app; app.build_parser('interactive'); app.set_parser('soup')"
+
+# Selecting a county imports its module and the parsing stack, timed to see what a lookup adds
+SELECTIONS = {'fbcad': STARTUP + "; import adapters; adapters.get_adapter('fbcad')",
+              'hcad': STARTUP + "; import adapters; adapters.get_adapter('hcad')"}
+
+# Modules that must not be imported before a county is selected or a command needs them
+HEAVY = ['requests', 'urllib3', 'bs4', 'lxml', 'pyperclip', 'counties', 'asyncio', 'http.server',
+         'concurrent.futures', 'pyarrow']
+
+# Default most milliseconds the startup imports may take
+BUDGET = 60.0
+
+# A line of the -X importtime output: "import time:  self [us] | cumulative | imported package"
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def import_times(code):
+    """
+    Runs code in a new interpreter with -X importtime
+
+    :param code: Python code passed to -c
+    :return: Dict of each module imported at the top level (not by another module) to its cumulative
+             import time in milliseconds, and the set of every module imported
+    """
+
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                               capture_output=True, text=True)
+
+    if completed.returncode:
+        raise RuntimeError(f'Running {code!r} failed:\n{completed.stderr}')
+
+    top_level = {}
+    modules = set()
+
+    for match in IMPORT_LINE.finditer(completed.stderr):
+        modules.add(match.group(4))
+        # Modules imported by another module are indented under it
+        if len(match.group(3)) == 1:
+            top_level[match.group(4)] = int(match.group(2)) / 1000
+
+    return top_level, modules
+
+
+def measure(code, runs):
+    """
+    Times the imports of code, leaving out the ones every interpreter makes at startup (site, encodings...)
+
+    :param code: Python code passed to -c
+    :param runs: Number of interpreters started, the median is kept
+    :return: Dict of the median and fastest import time in milliseconds, the slowest top level imports
+             and the set of modules imported
+    """
+
+    interpreter = set(import_times('pass')[0])
+
+    totals = []
+    slowest = {}
+    modules = set()
+
+    for _ in range(runs):
+        top_level, modules = import_times(code)
+        top_level = {name: ms for name, ms in top_level.items() if name not in interpreter}
+        totals.append(sum(top_level.values()))
+
+        for name, ms in top_level.items():
+            slowest.setdefault(name, []).append(ms)
+
+    slowest = sorted(((name, statistics.median(times)) for name, times in slowest.items()), key=lambda item: -item[1])
+
+    return {'median_ms': round(statistics.median(totals), 2),
+            'min_ms': round(min(totals), 2),
+            'slowest': [[name, round(ms, 2)] for name, ms in slowest[:8]],
+            'modules': modules}
+
+
+def heavy_imports(modules):
+    """
+    :param modules: Set of imported module names
+    :return: Sorted list of the HEAVY modules, or their submodules, in it
+    """
+
+    return sorted({name for name in modules for heavy in HEAVY if name == heavy or name.startswith(heavy + '.')})
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Measure the startup import time of app.py with -X importtime')
+    arg_parser.add_argument('--runs', type=int, default=7, help='Number of interpreters started for each case')
+    arg_parser.add_argument('--budget', type=float, default=BUDGET, help='Most milliseconds the startup may take')
+    arg_parser.add_argument('--output', help='Save the results to this JSON file')
+    arg_parser.add_argument('--baseline', help='Fail if slower than the startup saved in this JSON file')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline')
+    args = arg_parser.parse_args(argv)
+
+    failures = []
+    results = {}
+
+    print(f"{'case':<10}{'min ms':>10}{'median ms':>11}  slowest imports")
+
+    for name, code in [('startup', STARTUP)] + list(SELECTIONS.items()):
+        result = measure(code, args.runs)
+        modules = result.pop('modules')
+        results[name] = result
+
+        slowest = ', '.join(f'{module} {ms}ms' for module, ms in result['slowest'][:4])
+        print(f"{name:<10}{result['min_ms']:>10}{result['median_ms']:>11}  {slowest}")
+
+        if name == 'startup':
+            result['heavy'] = heavy_imports(modules)
+
+    startup = results['startup']
+
+    if startup['heavy']:
+        failures.append(f"Imported before a county is selected: {', '.join(startup['heavy'])}")
+
+    if startup['median_ms'] > args.budget:
+        failures.append(f"startup: {startup['median_ms']}ms is over the budget of {args.budget}ms")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            allowed = json.load(f)['startup']['median_ms'] * (1 + args.tolerance)
+        if startup['median_ms'] > allowed:
+            failures.append(f"startup: {startup['median_ms']}ms is slower than the baseline, at most {allowed:.2f}ms")
+
+    for failure in failures:
+        print(failure)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
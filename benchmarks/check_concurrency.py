@@ -0,0 +1,129 @@
+import os
+import sys
+
+# Allowing the check to be run from any folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import scheduler
+import pipeline
+import threading
+import argparse
+import refresh
+import batch
+import cache
+import bulk
+import time
+
+
+class Probe:
+    """
+    Stands in for the lookups of a run, each one waits a little and the most running at once is kept
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def __call__(self, *args):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+        time.sleep(self.seconds)
+
+        with self.lock:
+            self.running -= 1
+
+
+class Writer(list):
+    """
+    Keeps the results of a run instead of writing them to a file
+    """
+
+    def write(self, record):
+        self.append(record)
+
+
+class Portfolio:
+    """
+    The parts of refresh.Portfolio used by refresh.run(), without a file
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def properties(self):
+        return [{'county': 'hcad', 'property_id': str(number)} for number in range(self.rows)]
+
+    def save(self, result):
+        pass
+
+
+def run_batch(rows, workers, per_host, probe):
+    batch.lookup = lambda county, address: probe()
+    batch.run_batch([(number, 'hcad', f'{number} Main St') for number in range(rows)], Writer(), workers, per_host)
+
+
+def run_pipeline(rows, workers, per_host, probe):
+    pipeline.download = lambda county, query: probe()
+    rows = [(number, 'hcad', f'{number} Main St') for number in range(rows)]
+    pipeline.run_pipeline(rows, Writer(), workers, per_host)
+
+
+def run_refresh(rows, workers, per_host, probe):
+    def check(state):
+        probe()
+        return {'status': 'unchanged', **state}
+
+    refresh.check = check
+    refresh.run(Portfolio(rows), workers=workers, per_host=per_host)
+
+
+# The runs checked, each one queues its lookups on the shared scheduler
+RUNS = {'batch': run_batch,
+        'pipeline': run_pipeline,
+        'refresh': run_refresh}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Check that batch, pipeline and refresh runs reach their '
+                                                     '--per-host lookups at once on the shared scheduler')
+    arg_parser.add_argument('--rows', type=int, default=32, help='Lookups in each run')
+    arg_parser.add_argument('--workers', type=int, default=16, help='Lookups running at the same time')
+    arg_parser.add_argument('--per-host', type=int, default=8, help='Most lookups at once against one website')
+    arg_parser.add_argument('--seconds', type=float, default=0.1, help='Seconds each lookup takes')
+    args = arg_parser.parse_args(argv)
+
+    # Every row is looked up, none is answered from the saved results
+    cache.configure(enabled=False)
+    bulk.configure(enabled=False)
+
+    failures = []
+
+    # Each run starts its own scheduler as it would in a new process, then the batch runs again
+    # next to a scheduler already started with the default settings, as in a process serving lookups
+    for name, run, serving in [(name, run, False) for name, run in RUNS.items()] + [('serving', run_batch, True)]:
+        scheduler.configure()
+        if serving:
+            scheduler.get_scheduler()
+
+        probe = Probe(args.seconds)
+        run(args.rows, args.workers, args.per_host, probe)
+
+        expected = min(args.workers, args.per_host)
+        print(f'{name:<10}{probe.peak:>4} of {expected} lookups at once')
+
+        if probe.peak != expected:
+            failures.append(f'{name}: {probe.peak} lookups at once instead of {expected}')
+
+    for failure in failures:
+        print(failure)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
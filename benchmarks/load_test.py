@@ -0,0 +1,186 @@
+import os
+import sys
+
+# Allowing the load test to be run from any folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from concurrent.futures import ThreadPoolExecutor
+from mock_server import MockServer, SETTINGS
+from adapters import REGISTRY, register
+from counties import fbcad, hcad
+from batch import percentile
+import contextlib
+import argparse
+import metrics
+import client
+import cache
+import bulk
+import json
+import time
+import io
+
+
+# The function each county's lookups run, the same entry points the app uses
+LOOKUPS = {'fbcad': fbcad.get_property_id,
+           'hcad': hcad.get_data}
+
+# Addresses looked up, numbered so every lookup is new and goes to the server
+QUERIES = {'fbcad': '{} Sample Creek Dr',
+           'hcad': '{} Sample St'}
+
+
+def point_at(county, url):
+    """
+    Sends the requests of a county to another server, i.e. a MockServer
+
+    The county is registered again with the new url so it gets its own connection pool and rate limiter.
+
+    :param county: "fbcad" or "hcad"
+    :param url: Server url without a trailing slash i.e. "http://127.0.0.1:8400"
+    """
+
+    if county == 'fbcad':
+        fbcad.SEARCH_URL = url + '/Search/SearchResults'
+        fbcad.VIEW_URL = url + '/Property/View/'
+    else:
+        hcad.BASE_URL = url
+        hcad.RECORD_URL = url + '/records/QuickRecord.asp'
+
+    settings = REGISTRY[county]
+    register(county, settings['module'], url, name=settings['name'], id_label=settings['id_label'])
+
+    # Building a new session so the new url gets its connection pool
+    client.configure()
+
+
+def run_load(counties, requests, concurrency):
+    """
+    Runs lookups at a fixed concurrency and times each one
+
+    :param counties: County keys, lookups alternate between them
+    :param requests: Number of lookups
+    :param concurrency: Lookups running at the same time
+    :return: List of (county, outcome, seconds) where the outcome is "found", "not found" or the error class name
+    """
+
+    def run_one(number):
+        county = counties[number % len(counties)]
+        started = time.perf_counter()
+
+        try:
+            house = LOOKUPS[county](QUERIES[county].format(1000 + number))
+            outcome = 'found' if house else 'not found'
+        except Exception as e:
+            outcome = type(e).__name__
+
+        return county, outcome, time.perf_counter() - started
+
+    # The county modules print some errors, they would flood the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(run_one, range(requests)))
+
+
+def summarize(results, elapsed):
+    """
+    :return: Dict of the throughput, latency percentiles in seconds and outcomes of each county and all lookups
+    """
+
+    summary = {}
+
+    for county in sorted({county for county, outcome, seconds in results}) + ['all']:
+        rows = [row for row in results if county in ('all', row[0])]
+        latencies = [seconds for _, _, seconds in rows]
+        outcomes = {}
+        for _, outcome, _ in rows:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        summary[county] = {'lookups': len(rows),
+                           'throughput': round(len(rows) / elapsed, 2) if elapsed else 0,
+                           'p50': round(percentile(latencies, 50), 3),
+                           'p95': round(percentile(latencies, 95), 3),
+                           'p99': round(percentile(latencies, 99), 3),
+                           'max': round(max(latencies), 3) if latencies else 0,
+                           'outcomes': outcomes}
+
+    return summary
+
+
+def report(summary, elapsed, servers):
+    """
+    :return: The summary as a table, for printing
+    """
+
+    lines = [f"{'county':<8}{'lookups':>9}{'per sec':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  outcomes"]
+
+    for county, row in summary.items():
+        lines.append(f"{county:<8}{row['lookups']:>9}{row['throughput']:>10}{row['p50']:>8.3f}s{row['p95']:>8.3f}s"
+                     f"{row['p99']:>8.3f}s{row['max']:>8.3f}s  {row['outcomes']}")
+
+    lines.append(f'\nElapsed: {elapsed:.2f}s')
+
+    # "not found" with recorded pages means an error the county module printed and swallowed
+    for county, server in servers.items():
+        lines.append(f'{county} server responses: {server.stats()["status"]}')
+
+    for limit in client.limiter_stats():
+        lines.append(f"{limit['host']}: {limit['rate']} requests/sec, {limit['concurrency']} at once, "
+                     f"{limit['throttled']} throttled")
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Load test the lookups against a local stand-in server')
+    arg_parser.add_argument('--county', choices=['fbcad', 'hcad', 'both'], default='both')
+    arg_parser.add_argument('--requests', type=int, default=200, help='Number of lookups')
+    arg_parser.add_argument('--concurrency', type=int, default=16, help='Lookups running at the same time')
+    arg_parser.add_argument('--latency', type=float, default=SETTINGS['latency'], help='Server seconds per response')
+    arg_parser.add_argument('--jitter', type=float, default=SETTINGS['jitter'], help='Random seconds added or removed')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help='Share of responses that are a 500')
+    arg_parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of responses that are a 429')
+    arg_parser.add_argument('--max-rps', type=float, help='Server answers 429 above this many requests per second')
+    arg_parser.add_argument('--retry-after', type=int, default=SETTINGS['retry_after'], help='Retry-After of the 429s')
+    arg_parser.add_argument('--rate', type=float, help='Requests per second the client starts at')
+    arg_parser.add_argument('--fixed-rate', action='store_true', help='Keep the client rate instead of adapting it')
+    arg_parser.add_argument('--output', help='Save the summary to this JSON file')
+    args = arg_parser.parse_args(argv)
+
+    counties = ['fbcad', 'hcad'] if args.county == 'both' else [args.county]
+
+    # Every lookup goes to the server
+    cache.configure(enabled=False)
+    bulk.configure(enabled=False)
+    client.configure(adaptive=not args.fixed_rate, **({'rate': args.rate} if args.rate else {}))
+    metrics.reset()
+
+    # One server per county so each has its own host, connection pool and rate limiter like the real websites
+    servers = {}
+    for county in counties:
+        servers[county] = MockServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                     throttle_rate=args.throttle_rate, max_rps=args.max_rps,
+                                     retry_after=args.retry_after).start()
+        point_at(county, servers[county].url)
+
+    try:
+        started = time.perf_counter()
+        results = run_load(counties, args.requests, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+        summary = summarize(results, elapsed)
+        print(report(summary, elapsed, servers))
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'settings': vars(args), 'elapsed': round(elapsed, 3), 'summary': summary,
+                           'spans': metrics.snapshot()}, f, indent=2)
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+import threading
+import argparse
+import random
+import glob
+import json
+import time
+import os
+
+
+# Folder with the recorded pages, the same ones bench_parse.py uses
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Default behaviour of the server, every setting can be changed while it runs with configure()
+SETTINGS = {'latency': 0.1,  # Seconds before each response
+            'jitter': 0.05,  # Up to this many seconds added to or removed from the latency at random
+            'error_rate': 0.0,  # Share of requests answered with a 500 error
+            'throttle_rate': 0.0,  # Share of requests answered with a 429 at random
+            'max_rps': None,  # Requests per second above which every request gets a 429, like a real rate limit
+            'retry_after': 1}  # Retry-After header sent with the 429 responses, in seconds
+
+# The pages each path answers with, several recorded pages of one kind are served in turn
+PAGES = {'search': 'fbcad_search*.json',
+         'view': 'fbcad_view*.html',
+         'record': 'hcad_record*.html',
+         'ownership': 'hcad_ownership*.html'}
+
+
+class MockServer:
+    """
+    A local stand-in for the FBCAD and HCAD websites serving recorded pages
+
+    Answers the same paths as the real websites so the county modules only need their urls changed:
+        GET  /Search/SearchResults           FBCAD search results (JSON)
+        GET  /Property/View/<id>             FBCAD property page
+        POST /records/QuickRecord.asp        HCAD record page
+        POST /records/OwnershipHistory.asp   HCAD Ownership History popup
+        GET  /stats                          Number of responses sent by status code
+
+    Usage:
+        server = MockServer(latency=0.2, error_rate=0.01).start()
+        fbcad.SEARCH_URL = server.url + '/Search/SearchResults'
+        ...
+        server.stop()
+    """
+
+    def __init__(self, port=0, host='127.0.0.1', fixtures=FIXTURES, **settings):
+        """
+        :param port: Port to listen on, 0 picks a free port
+        :param fixtures: Folder with the recorded pages
+        :param settings: Any of the keys of SETTINGS
+        """
+
+        self.settings = dict(SETTINGS)
+        self.configure(**settings)
+        self.pages = {kind: load_pages(fixtures, pattern) for kind, pattern in PAGES.items()}
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.served = 0
+
+        # Token bucket for max_rps
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+        self.server = ThreadingHTTPServer((host, port), make_handler(self))
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+
+    def configure(self, **settings):
+        for name in settings:
+            if name not in SETTINGS:
+                raise ValueError(f'Unknown setting: {name}')
+
+        self.settings.update(settings)
+
+    def start(self):
+        """
+        Serves in a background thread
+
+        :return: The server itself
+        """
+
+        threading.Thread(target=self.server.serve_forever, daemon=True, name='mock-server').start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {'served': self.served, 'status': dict(self.counts)}
+
+    def count(self, status):
+        with self.lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+            self.served += 1
+
+    def over_rate(self):
+        """
+        :return: True if the request is above max_rps
+        """
+
+        max_rps = self.settings['max_rps']
+
+        if not max_rps:
+            return False
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(max_rps, self.tokens + (now - self.updated) * max_rps)
+            self.updated = now
+
+            if self.tokens < 1:
+                return True
+
+            self.tokens -= 1
+            return False
+
+    def next_page(self, kind):
+        pages = self.pages[kind]
+
+        with self.lock:
+            index = self.served % len(pages)
+
+        return pages[index]
+
+    def answer(self, kind):
+        """
+        Picks the response of a request after waiting the latency
+
+        :param kind: A key of PAGES
+        :return: Tuple of status code, headers and body
+        """
+
+        settings = self.settings
+        time.sleep(max(0.0, settings['latency'] + random.uniform(-settings['jitter'], settings['jitter'])))
+
+        if self.over_rate() or random.random() < settings['throttle_rate']:
+            return 429, {'Retry-After': str(settings['retry_after'])}, b'Too Many Requests'
+
+        if random.random() < settings['error_rate']:
+            return 500, {}, b'Internal Server Error'
+
+        return 200, {}, self.next_page(kind)
+
+
+def load_pages(folder, pattern):
+    """
+    :return: List of the recorded pages matching a pattern, as bytes
+    """
+
+    pages = []
+
+    for path in sorted(glob.glob(os.path.join(folder, pattern))):
+        with open(path, 'rb') as file:
+            pages.append(file.read())
+
+    if not pages:
+        raise FileNotFoundError(f'No recorded pages matching {pattern} in {folder}')
+
+    return pages
+
+
+def make_handler(mock):
+    """
+    Builds the request handler class of a MockServer
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keeping connections open like the real websites so connection reuse can be measured
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+
+            if path == '/stats':
+                self.send(200, {'Content-Type': 'application/json'}, json.dumps(mock.stats()).encode(), False)
+            elif path == '/Search/SearchResults':
+                self.send(*mock.answer('search'))
+            elif path.startswith('/Property/View/'):
+                self.send(*mock.answer('view'))
+            else:
+                self.send(404, {}, b'Not Found')
+
+        def do_POST(self):
+            # Reading the form data so the connection can be reused
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            path = urlsplit(self.path).path
+
+            if path == '/records/QuickRecord.asp':
+                self.send(*mock.answer('record'))
+            elif path == '/records/OwnershipHistory.asp':
+                self.send(*mock.answer('ownership'))
+            else:
+                self.send(404, {}, b'Not Found')
+
+        def send(self, status, headers, body, counted=True):
+            if counted:
+                mock.count(status)
+
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            # Thousands of requests would flood the console
+            pass
+
+    return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the FBCAD and HCAD websites')
+    parser.add_argument('--port', type=int, default=8400)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--fixtures', default=FIXTURES, help='Folder with the recorded pages')
+    parser.add_argument('--latency', type=float, default=SETTINGS['latency'], help='Seconds before each response')
+    parser.add_argument('--jitter', type=float, default=SETTINGS['jitter'], help='Random seconds added or removed')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with a 429')
+    parser.add_argument('--max-rps', type=float, help='Answer 429 above this many requests per second')
+    parser.add_argument('--retry-after', type=int, default=SETTINGS['retry_after'], help='Retry-After of the 429s')
+    args = parser.parse_args()
+
+    mock_server = MockServer(args.port, args.host, args.fixtures, latency=args.latency, jitter=args.jitter,
+                             error_rate=args.error_rate, throttle_rate=args.throttle_rate, max_rps=args.max_rps,
+                             retry_after=args.retry_after)
+
+    print(f'Serving recorded pages on {mock_server.url}')
+
+    try:
+        mock_server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
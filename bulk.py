@@ -0,0 +1,367 @@
+from adapters import REGISTRY, resolve_county
+from addresses import index_key
+from utilities import House
+import address_index
+import threading
+import datetime
+import argparse
+import sqlite3
+import mmap
+import json
+import time
+import csv
+import os
+
+
+# Default settings, these can be changed with configure()
+SETTINGS = {'path': os.environ.get('CAD_BULK_PATH',
+                                   os.path.join(os.path.expanduser('~'), '.cad_scraper', 'bulk.sqlite')),
+            'enabled': True,  # Set to False to always scrape the websites
+            'min_tax_year': None}  # Older records are stale, defaults to last year since exports come out mid-year
+
+# Rows written to the store in one transaction
+CHUNK_ROWS = 5000
+
+# Counties whose parser counts a half bath as 0.5 in baths instead of setting half_baths,
+# the export has the full and half baths in separate rows so they are added up the same way
+HALF_BATHS_IN_BATHS = ('hcad',)
+
+# How the columns of each export file map to the House fields
+# "id" and "fields" hold column names for delimited files and [start, end] character positions
+# for fixed width files, a list of several columns/positions is joined with spaces
+# "locality" is added to the address after a comma, the city and zip code kept in other columns
+# "filter" only keeps the rows where a column has the given value (delimited files only)
+# The HCAD files are the tab separated Real and Building files from the HCAD data download page
+# FBCAD publishes a fixed width export whose layout changes between years, it is given with --layout
+LAYOUTS = {'hcad': [{'file': 'real_acct.txt', 'format': 'delimited', 'delimiter': '\t', 'encoding': 'latin-1',
+                     'id': 'acct', 'fields': {'address': 'site_addr_1', 'value': 'tot_mkt_val'},
+                     'locality': ['site_addr_2', 'site_addr_3']},
+                    {'file': 'building_res.txt', 'format': 'delimited', 'delimiter': '\t', 'encoding': 'latin-1',
+                     'id': 'acct', 'fields': {'sqft': 'im_sq_ft', 'year_built': 'date_erected'}},
+                    {'file': 'fixtures.txt', 'format': 'delimited', 'delimiter': '\t', 'encoding': 'latin-1',
+                     'id': 'acct', 'filter': {'type': 'RMB'}, 'fields': {'bedrooms': 'units'}},
+                    {'file': 'fixtures.txt', 'format': 'delimited', 'delimiter': '\t', 'encoding': 'latin-1',
+                     'id': 'acct', 'filter': {'type': 'RMF'}, 'fields': {'baths': 'units'}},
+                    {'file': 'fixtures.txt', 'format': 'delimited', 'delimiter': '\t', 'encoding': 'latin-1',
+                     'id': 'acct', 'filter': {'type': 'RMH'}, 'fields': {'half_baths': 'units'}}],
+           'fbcad': []}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS properties (county TEXT, property_id TEXT, search_address TEXT, tax_year INTEGER,
+                                       stored REAL, {', '.join(House.CSV_FIELDS)},
+                                       PRIMARY KEY (county, property_id));
+CREATE INDEX IF NOT EXISTS properties_address ON properties (county, search_address);
+CREATE TABLE IF NOT EXISTS loaded_fields (county TEXT, field TEXT, PRIMARY KEY (county, field));
+"""
+
+# Each thread gets its own connection since sqlite connections can not be shared
+_local = threading.local()
+
+
+def configure(**settings):
+    """
+    Changes the bulk store settings
+
+    :param settings: Any of path, enabled, min_tax_year
+    """
+
+    for name in settings:
+        if name not in SETTINGS:
+            raise ValueError(f'Unknown setting: {name}')
+
+    SETTINGS.update(settings)
+
+
+def connect():
+    """
+    Gets the sqlite connection for the current thread, creating the store file if needed
+
+    :return: A sqlite3 Connection
+    """
+
+    connection = getattr(_local, 'connection', None)
+
+    if connection is None or _local.path != SETTINGS['path']:
+        folder = os.path.dirname(SETTINGS['path'])
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        connection = sqlite3.connect(SETTINGS['path'], timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        connection.row_factory = sqlite3.Row
+
+        _local.connection = connection
+        _local.path = SETTINGS['path']
+
+    return connection
+
+
+def read_lines(path):
+    """
+    Reads a file line by line through a memory map so large exports are not loaded into memory
+
+    :return: Generator of the lines as bytes
+    """
+
+    with open(path, 'rb') as file:
+        # An empty file can not be memory mapped
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from iter(data.readline, b'')
+
+
+def read_rows(path, layout):
+    """
+    Reads an export file with a layout from LAYOUTS
+
+    :return: Generator of (property ID, dict of House field to text) tuples
+    """
+
+    encoding = layout.get('encoding', 'utf-8')
+    lines = (line.decode(encoding, errors='replace') for line in read_lines(path))
+
+    if layout.get('format', 'delimited') == 'fixed':
+        if layout.get('filter'):
+            raise ValueError(f'The layout of {path} has a filter, filters only work with delimited files')
+
+        def get(line, spec):
+            # A single [start, end] position or a list of them
+            if isinstance(spec[0], int):
+                return line[spec[0]:spec[1]].strip()
+            return ' '.join(line[start:end].strip() for start, end in spec).strip()
+
+        rows = (line.rstrip('\r\n') for line in lines)
+
+    else:
+        reader = csv.reader(lines, delimiter=layout.get('delimiter', ','))
+        header = {name.strip().lower(): position for position, name in enumerate(next(reader, []))}
+
+        def column(name):
+            if name.lower() not in header:
+                raise ValueError(f'Column {name} not found in {path}')
+            return header[name.lower()]
+
+        # Converting the column names of the layout to positions once
+        def positions(spec):
+            return column(spec) if isinstance(spec, str) else [column(name) for name in spec]
+
+        layout = dict(layout, id=positions(layout['id']),
+                      fields={field: positions(spec) for field, spec in layout['fields'].items()},
+                      filter={positions(name): value for name, value in layout.get('filter', {}).items()})
+
+        if 'locality' in layout:
+            layout['locality'] = positions(layout['locality'])
+
+        def get(row, spec):
+            if isinstance(spec, int):
+                return row[spec].strip() if spec < len(row) else ''
+            return ' '.join(row[position].strip() for position in spec if position < len(row)).strip()
+
+        rows = reader
+
+    for row in rows:
+        if not row:
+            continue
+
+        if any(get(row, spec) != value for spec, value in layout.get('filter', {}).items()):
+            continue
+
+        property_id = get(row, layout['id'])
+        if not property_id:
+            continue
+
+        values = {field: get(row, spec) for field, spec in layout['fields'].items()}
+
+        # "100 MAIN ST" and "HOUSTON 77002" become "100 MAIN ST, HOUSTON 77002" so the zip code is in the key
+        locality = get(row, layout['locality']) if 'locality' in layout else ''
+        if locality and values['address']:
+            values['address'] = f"{values['address']}, {locality}"
+
+        yield property_id, values
+
+
+def write_chunk(connection, county, fields, chunk, tax_year):
+    """
+    Adds the rows of one file to the store, the other fields of a property are kept
+    """
+
+    columns = ['county', 'property_id', 'tax_year', 'stored'] + fields
+    if 'address' in fields:
+        columns.append('search_address')
+
+    now = time.time()
+    rows = []
+    for property_id, values in chunk:
+        row = [county, property_id, tax_year, now] + [values[field] for field in fields]
+        if 'address' in fields:
+            row.append(index_key(values['address']))
+        rows.append(row)
+
+    updates = ', '.join(f'{column} = excluded.{column}' for column in columns[2:])
+
+    connection.execute('BEGIN')
+    try:
+        connection.executemany(f"INSERT INTO properties ({', '.join(columns)}) "
+                               f"VALUES ({', '.join('?' * len(columns))}) "
+                               f"ON CONFLICT (county, property_id) DO UPDATE SET {updates}", rows)
+        connection.execute('COMMIT')
+    except Exception:
+        connection.execute('ROLLBACK')
+        raise
+
+    # Addresses also go to the address index so scraping a stale record skips the search
+    if 'address' in fields:
+        address_index.add_many(county, [(values['address'], property_id) for property_id, values in chunk])
+
+
+def ingest(path, county, layout, tax_year=None):
+    """
+    Adds an export file to the store in chunks of CHUNK_ROWS rows
+
+    :param path: Export file
+    :param county: County key i.e. "hcad"
+    :param layout: A layout from LAYOUTS
+    :param tax_year: Tax year of the export, defaults to the current year
+    :return: Number of rows added
+    """
+
+    tax_year = tax_year or datetime.datetime.now().year
+    fields = [field for field in layout['fields'] if field in House.CSV_FIELDS]
+
+    if len(fields) != len(layout['fields']):
+        raise ValueError(f'Unknown House fields in the layout of {path}')
+
+    if 'locality' in layout and 'address' not in fields:
+        raise ValueError(f'The layout of {path} has a locality without an address')
+
+    connection = connect()
+
+    # A record answers lookups once it has every field the loaded layouts of its county fill
+    connection.executemany('INSERT OR IGNORE INTO loaded_fields VALUES (?, ?)', [(county, field) for field in fields])
+    total = 0
+    chunk = []
+
+    for row in read_rows(path, layout):
+        chunk.append(row)
+
+        if len(chunk) >= CHUNK_ROWS:
+            write_chunk(connection, county, fields, chunk, tax_year)
+            total += len(chunk)
+            chunk = []
+
+    if chunk:
+        write_chunk(connection, county, fields, chunk, tax_year)
+        total += len(chunk)
+
+    return total
+
+
+def ingest_files(paths, county, layouts=None, tax_year=None):
+    """
+    Adds export files to the store, each file is read with the layouts for its file name
+
+    :param paths: List of export files
+    :param county: County name or alias
+    :param layouts: List of layouts, defaults to the ones in LAYOUTS for the county
+    :param tax_year: Tax year of the exports, defaults to the current year
+    :return: Dict of file path to number of rows added
+    """
+
+    county = resolve_county(county)
+    layouts = LAYOUTS.get(county, []) if layouts is None else layouts
+    totals = {}
+
+    for path in paths:
+        matching = [layout for layout in layouts if layout['file'].lower() == os.path.basename(path).lower()]
+
+        if not matching:
+            raise ValueError(f'No layout for {os.path.basename(path)}, '
+                             f'known files: {", ".join(layout["file"] for layout in layouts)}')
+
+        totals[path] = sum(ingest(path, county, layout, tax_year) for layout in matching)
+
+    return totals
+
+
+def required_fields(county):
+    """
+    Gets the fields a record must have to answer a lookup, the ones filled by the layouts loaded for its county
+
+    A record missing one of them, i.e. a property without a row in one of the files, is treated as missing
+    so the website is scraped instead of answering with a blank. A field stored as 0 is a real 0 from the
+    export, i.e. no garage. The fields no loaded layout fills are left empty in the House.
+
+    :param county: County key i.e. "hcad"
+    :return: Tuple of House fields
+    """
+
+    fields = [row['field'] for row in connect().execute('SELECT field FROM loaded_fields WHERE county = ?', (county,))]
+
+    # A house without half baths has no half bath row in the HCAD export
+    if county in HALF_BATHS_IN_BATHS:
+        fields = [field for field in fields if field != 'half_baths']
+
+    return tuple(field for field in House.FIELDS if field in fields)
+
+
+def find_house(county, query):
+    """
+    Looks up a property in the store by its ID or address
+
+    :param county: County key i.e. "hcad"
+    :param query: Property ID or address as typed by the user
+    :return: An instance of the House object, or None when the record is missing or stale
+    """
+
+    if not SETTINGS['enabled'] or not os.path.exists(SETTINGS['path']):
+        return None
+
+    # The unit and the zip code or city are part of the key so another unit or city is never answered
+    row = connect().execute('SELECT * FROM properties WHERE county = ? AND (property_id = ? OR search_address = ?)',
+                             (county, query.strip().upper(), index_key(query))).fetchone()
+
+    if row is None:
+        return None
+
+    min_tax_year = SETTINGS['min_tax_year'] or datetime.datetime.now().year - 1
+    if row['tax_year'] < min_tax_year or any(row[field] in (None, '') for field in required_fields(county)):
+        return None
+
+    data = {field: row[field] for field in House.CSV_FIELDS}
+
+    if county in HALF_BATHS_IN_BATHS and data['baths'] not in (None, ''):
+        # The export has the full and half baths in separate rows, the parser counts a half bath as 0.5
+        data['baths'] = float(data['baths']) + float(data['half_baths'] or 0) / 2
+        data['half_baths'] = None
+
+    # Adding the property ID the way the county parsers do
+    data['elements'] = json.loads(data['elements']) if data['elements'] else []
+    data['elements'].insert(0, [REGISTRY[county]['id_label'], row['property_id']])
+
+    return House.from_dict(data)
+
+
+def load_layouts(path):
+    """
+    Reads layouts from a JSON file, a list in the format of LAYOUTS
+    """
+
+    with open(path) as file:
+        return json.load(file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load appraisal district export files into the local store')
+    parser.add_argument('files', nargs='+', help='Export files, matched to the layouts by file name')
+    parser.add_argument('--county', required=True, help='fbcad or hcad')
+    parser.add_argument('--layout', help='JSON file with the layouts of the files, needed for FBCAD')
+    parser.add_argument('--tax-year', type=int, help='Tax year of the export, defaults to the current year')
+    args = parser.parse_args()
+
+    layouts = load_layouts(args.layout) if args.layout else None
+
+    for path, count in ingest_files(args.files, args.county, layouts, args.tax_year).items():
+        print(f'{path}: {count} rows')
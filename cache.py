@@ -0,0 +1,210 @@
+from utilities import House
+import itertools
+import threading
+import datetime
+import sqlite3
+import json
+import time
+import os
+
+
+# Default settings, these can be changed with configure()
+SETTINGS = {'path': os.environ.get('CAD_CACHE_PATH',
+                                   os.path.join(os.path.expanduser('~'), '.cad_scraper', 'cache.sqlite')),
+            'enabled': True,  # Set to False to never read or write the cache
+            'refresh': False,  # Set to True to skip reading the cache but still save new results
+            'max_age': 30 * 24 * 60 * 60,  # Seconds an entry is kept, entries also expire with the tax year
+            'max_bytes': 200 * 1024 * 1024}  # Least recently used entries are removed above this size
+
+# Raw pages (HTML/JSON) and parsed House objects are kept in separate tables
+# so a page can be re-parsed if the parsing code changes
+# The address_index table is used by address_index.py and does not expire
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, county TEXT, body TEXT,
+                                  tax_year INTEGER, stored REAL, used REAL, size INTEGER);
+CREATE TABLE IF NOT EXISTS houses (key TEXT PRIMARY KEY, county TEXT, body TEXT,
+                                   tax_year INTEGER, stored REAL, used REAL, size INTEGER);
+CREATE TABLE IF NOT EXISTS address_index (county TEXT, address TEXT, property_id TEXT, source TEXT, stored REAL,
+                                          PRIMARY KEY (county, address));
+CREATE INDEX IF NOT EXISTS pages_used ON pages (used);
+CREATE INDEX IF NOT EXISTS houses_used ON houses (used);
+"""
+
+# Writes between checks of the cache size, a check adds up the size of every entry
+EVICT_EVERY = 100
+
+# Each thread gets its own connection since sqlite connections can not be shared
+_local = threading.local()
+
+# Number of writes in this process, the size is checked on the first write and every EVICT_EVERY after it
+_writes = itertools.count()
+
+
+def configure(**settings):
+    """
+    Changes the cache settings
+
+    :param settings: Any of path, enabled, refresh, max_age, max_bytes
+    """
+
+    for name in settings:
+        if name not in SETTINGS:
+            raise ValueError(f'Unknown setting: {name}')
+
+    SETTINGS.update(settings)
+
+
+def connect():
+    """
+    Gets the sqlite connection for the current thread, creating the cache file if needed
+
+    :return: A sqlite3 Connection
+    """
+
+    connection = getattr(_local, 'connection', None)
+
+    # Opening a new connection if this is the first call or the path was changed
+    if connection is None or _local.path != SETTINGS['path']:
+        folder = os.path.dirname(SETTINGS['path'])
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        connection = sqlite3.connect(SETTINGS['path'], timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+
+        _local.connection = connection
+        _local.path = SETTINGS['path']
+
+    return connection
+
+
+def make_key(county, kind, query):
+    """
+    Builds a cache key that is the same for small differences in how a query is typed
+
+    :param county: County key i.e. "fbcad"
+    :param kind: What is stored i.e. "search", "view", "address"
+    :param query: Address, property ID or url
+    :return: A string key i.e. "fbcad:address:123 MAIN ST"
+    """
+
+    return f"{county}:{kind}:{' '.join(str(query).upper().split())}"
+
+
+def read(table, key):
+    if not SETTINGS['enabled'] or SETTINGS['refresh']:
+        return None
+
+    connection = connect()
+    row = connection.execute(f'SELECT body, tax_year, stored FROM {table} WHERE key = ?', (key,)).fetchone()
+
+    if row is None:
+        return None
+
+    body, tax_year, stored = row
+
+    # Appraisal values change every tax year so older entries are thrown away
+    if tax_year != datetime.datetime.now().year or time.time() - stored > SETTINGS['max_age']:
+        connection.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+        return None
+
+    # Marking the entry as recently used so it is the last to be evicted
+    connection.execute(f'UPDATE {table} SET used = ? WHERE key = ?', (time.time(), key))
+
+    return body
+
+
+def write(table, key, county, body):
+    if not SETTINGS['enabled']:
+        return
+
+    now = time.time()
+    connection = connect()
+    connection.execute(f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       (key, county, body, datetime.datetime.now().year, now, now, len(body)))
+
+    if next(_writes) % EVICT_EVERY == 0:
+        evict(connection)
+
+
+def evict(connection):
+    """
+    Removes the least recently used entries once the cache is over its size limit
+
+    Only run every EVICT_EVERY writes so the cache can go over max_bytes by up to that many entries
+    """
+
+    total = sum(connection.execute(f'SELECT COALESCE(SUM(size), 0) FROM {table}').fetchone()[0]
+                for table in ('pages', 'houses'))
+
+    if total <= SETTINGS['max_bytes']:
+        return
+
+    # Removing entries until the cache is back under 90% of the limit
+    # so it does not have to evict again on the very next write
+    target = total - SETTINGS['max_bytes'] * 0.9
+
+    rows = connection.execute("SELECT 'pages', key, size, used FROM pages UNION ALL "
+                              "SELECT 'houses', key, size, used FROM houses ORDER BY used").fetchall()
+
+    removed = []
+    for table, key, size, used in rows:
+        if target <= 0:
+            break
+        removed.append((table, key))
+        target -= size
+
+    for table, key in removed:
+        connection.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+
+
+def get_page(county, kind, query):
+    """
+    Gets a saved raw page
+
+    :return: The page text or None if it is not cached
+    """
+
+    return read('pages', make_key(county, kind, query))
+
+
+def put_page(county, kind, query, body):
+    """
+    Saves a raw page so it does not have to be downloaded again
+    """
+
+    write('pages', make_key(county, kind, query), county, body)
+
+
+def get_house(county, kind, query):
+    """
+    Gets a saved lookup result
+
+    :return: An instance of the House object or None if it is not cached
+    """
+
+    body = read('houses', make_key(county, kind, query))
+
+    if body is None:
+        return None
+
+    return House.from_dict(json.loads(body))
+
+
+def put_house(county, kind, query, house):
+    """
+    Saves a lookup result
+    """
+
+    write('houses', make_key(county, kind, query), county, house.to_json())
+
+
+def clear():
+    """
+    Removes everything from the cache
+    """
+
+    connection = connect()
+    connection.execute('DELETE FROM pages')
+    connection.execute('DELETE FROM houses')
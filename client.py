@@ -0,0 +1,284 @@
+from urllib.parse import urlsplit
+from limiter import HostLimiter, PRIORITIES
+from adapters import REGISTRY
+import contextlib
+import metrics
+import threading
+import time
+
+
+# Setting User agent to mimic browser
+# Every request to the CAD websites is sent with these headers
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:70.0) Gecko/20100101 Firefox/70.0',
+           'Accept-Encoding': 'gzip, deflate'}
+
+# Default settings, these can be changed with configure()
+SETTINGS = {'pool_size': 10,  # Connections kept open per website
+            'timeout': 30,  # Seconds to wait for the website to respond
+            'retries': 3,  # Times a request is retried on 429 and 5xx errors
+            'backoff': 0.5,  # Retries wait 0.5s, 1s, 2s... between attempts
+            'rate': 10.0,  # Requests per second sent to each website to start with
+            'min_rate': 0.5,  # Lowest rate after the website throttles
+            'max_rate': 50.0,  # Highest rate reached while the website responds normally
+            'concurrency': 4,  # Requests in flight per website to start with, grows up to pool_size
+            'adaptive': True,  # Set to False to keep the starting rate and concurrency
+            'max_retry_after': 120}  # Longest Retry-After pause accepted from a website, in seconds
+
+# Status codes that are worth retrying
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+# Status codes meaning the website wants fewer requests, the rate limiter slows down on these
+THROTTLE_STATUS = [429, 503]
+
+_session = None
+_limiters = {}
+_lock = threading.Lock()
+
+# Priority class of the requests sent by the current thread, see priority()
+_context = threading.local()
+
+
+def configure(**settings):
+    """
+    Changes the connection settings and drops the current session
+    so the next request builds a new one with the new settings
+
+    :param settings: Any of the keys of SETTINGS
+    """
+
+    global _session
+
+    for name in settings:
+        if name not in SETTINGS:
+            raise ValueError(f'Unknown setting: {name}')
+
+    with _lock:
+        SETTINGS.update(settings)
+        if _session:
+            _session.close()
+        _session = None
+        # The rate limiters start again from the new settings
+        _limiters.clear()
+
+
+def get_session():
+    """
+    Gets the shared request session, creating it on first use
+
+    The session is shared by all lookups in the process so that
+    connections to the county websites are reused between lookups
+    instead of paying for a new TCP and TLS handshake every time.
+
+    :return: A requests Session
+    """
+
+    global _session
+
+    with _lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+
+def build_session():
+    # requests is imported with the first request, the menu and --help do not wait for it
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    import requests
+
+    session = requests.Session()
+    session.headers.update(HEADERS)
+
+    # Only connection errors are retried here, error responses are retried by request()
+    # so every attempt goes through the rate limiter and slows it down
+    retry = Retry(total=SETTINGS['retries'],
+                  backoff_factor=SETTINGS['backoff'],
+                  status=0,
+                  # HCAD searches are POST calls, these only read data so are safe to retry
+                  allowed_methods=None,
+                  raise_on_status=False)
+
+    # Each registered county website gets its own pool of kept-alive connections
+    for county in REGISTRY.values():
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SETTINGS['pool_size'], max_retries=retry)
+        session.mount(county['url'], adapter)
+
+    return session
+
+
+def get_limiter(url):
+    """
+    Gets the rate limiter of the website of a url, creating it on first use
+
+    The limiters are shared by all lookups in the process, threads and the async engine alike.
+
+    :param url: Full url of a page
+    :return: A HostLimiter
+    """
+
+    host = urlsplit(url).netloc
+
+    with _lock:
+        if host not in _limiters:
+            _limiters[host] = HostLimiter(host,
+                                          rate=SETTINGS['rate'],
+                                          concurrency=SETTINGS['concurrency'],
+                                          min_rate=SETTINGS['min_rate'],
+                                          max_rate=SETTINGS['max_rate'],
+                                          max_concurrency=SETTINGS['pool_size'],
+                                          adaptive=SETTINGS['adaptive'])
+        return _limiters[host]
+
+
+@contextlib.contextmanager
+def priority(name):
+    """
+    Sends the requests made by the current thread in a priority class
+
+    When requests of several classes wait for the same website the rate limiter lets the
+    interactive ones go first, then refresh, then bulk.
+
+    Usage:
+        with client.priority('bulk'):
+            lookup('hcad', address)
+
+    :param name: A key of limiter.PRIORITIES
+    """
+
+    if name not in PRIORITIES:
+        raise ValueError(f'Unknown priority: {name}')
+
+    previous = getattr(_context, 'priority', 0)
+    _context.priority = PRIORITIES[name]
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+def limiter_stats():
+    """
+    :return: List with the stats() of each website's rate limiter
+    """
+
+    with _lock:
+        limiters = list(_limiters.values())
+
+    return [limiter.stats() for limiter in limiters]
+
+
+def retry_after(response):
+    """
+    Reads the Retry-After header, only the number of seconds form is supported
+
+    :return: Seconds to wait, at most max_retry_after, or None
+    """
+
+    value = response.headers.get('Retry-After', '')
+
+    if not value.strip().isdigit():
+        return None
+
+    return min(int(value), SETTINGS['max_retry_after'])
+
+
+def request(method, url, **kwargs):
+    """
+    Sends a request through the shared session and the rate limiter of the website
+
+    429 and 5xx responses are retried, waiting longer each time or as long as
+    the website asks in its Retry-After header.
+
+    :param method: HTTP method i.e. "GET" or "POST"
+    :param url: Full url of the page
+    :param kwargs: Any other arguments accepted by requests
+    :return: A requests Response
+    """
+
+    from requests.exceptions import Timeout
+
+    kwargs.setdefault('timeout', SETTINGS['timeout'])
+    limiter = get_limiter(url)
+
+    for attempt in range(SETTINGS['retries'] + 1):
+        # Time spent waiting for the rate limiter
+        with metrics.span(f'http.wait.{limiter.host}'):
+            limiter.acquire(getattr(_context, 'priority', 0))
+
+        try:
+            # The whole request, the connection and the download
+            with metrics.span(f'http.request.{limiter.host}'):
+                response = get_session().request(method, url, **kwargs)
+        except Timeout:
+            limiter.release(throttled=True)
+            raise
+        except Exception:
+            limiter.release()
+            raise
+
+        # Time until the response headers arrived, the rest of the request is the download
+        metrics.record(f'http.headers.{limiter.host}', response.elapsed.total_seconds())
+
+        throttled = response.status_code in THROTTLE_STATUS
+        limiter.release(throttled, retry_after(response) if throttled else None)
+
+        if response.status_code not in RETRY_STATUS or attempt == SETTINGS['retries']:
+            return response
+
+        response.close()
+        time.sleep(SETTINGS['backoff'] * 2 ** attempt)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def is_retryable(error):
+    """
+    Tells errors that may go away on a later try from the ones that will not
+
+    :param error: Exception raised by a lookup
+    :return: True for connection errors, timeouts and 429 / 5xx responses, False for anything else
+             i.e. a ValueError for a bad row or a page that could not be parsed since the property was not found
+    """
+
+    from requests.exceptions import ConnectionError, Timeout, ChunkedEncodingError, HTTPError
+
+    if isinstance(error, HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUS
+
+    return isinstance(error, (ConnectionError, Timeout, ChunkedEncodingError))
+
+
+def conditional_headers(validators):
+    """
+    Builds the headers of a conditional request, the website answers 304 Not Modified
+    without sending the page again when it has not changed
+
+    :param validators: Dict with the etag and last_modified saved from an earlier response, or None
+    :return: Dict of headers, empty when there is nothing to send
+    """
+
+    headers = {}
+
+    if validators and validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators and validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    return headers
+
+
+def validators_of(response):
+    """
+    Reads the ETag and Last-Modified headers of a response for conditional_headers()
+
+    :return: Dict with the etag and last_modified, None for the ones the website does not send
+    """
+
+    return {'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')}
@@ -1,13 +1,41 @@
 from utilities import House, format_result
+from addresses import normalize_address, situs_address
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
-import pyperclip
+from lxml import etree
+import address_index
+import adapters
+import parsing
+import metrics
+import client
+import cache
 import requests
 import datetime
 import json
+import sys
 import re
 
 
-def get_property_id(address):
+# The FBCAD URL for the initial query
+SEARCH_URL = 'https://esearch.fbcad.org/Search/SearchResults'
+
+# The FBCAD URL of a property page, the property ID is added at the end
+VIEW_URL = 'https://esearch.fbcad.org/Property/View/'
+
+# A property ID typed instead of an address i.e. "R416144"
+PROPERTY_ID = re.compile(r'^R\d+$', re.IGNORECASE)
+
+# Results asked for on each page of the search results by search_all()
+SEARCH_PAGE_SIZE = 100
+
+# Most pages of search results read by one sweep, 5000 properties
+SWEEP_MAX_PAGES = 50
+
+# Headings of the tables compared by refresh.py, the appraised values and the sales
+CHANGE_SECTIONS = ['Property Roll Value History', 'Property Deed History']
+
+
+def get_property_id(address, lazy=False):
     """
     This function queries the FBCAD website for the unique Property ID
     and Quick Reference ID assigned by FBCAD.
@@ -15,45 +43,190 @@ def get_property_id(address):
     If the property is not found this function returns None.
 
     :param address: User provided address to search on FBCAD website
+    :param lazy: Not used, FBCAD has all the fields on one page (same arguments as hcad.get_data)
     :return: FBCAD Property ID and Quick Reference ID or None
     """
 
-    # Creating a new request session
-    r = requests.Session()
+    # Returning the saved result if this address was looked up before
+    house = cache.get_house('fbcad', 'address', address)
+    if house:
+        return house
 
-    # Setting User agent to mimic browser
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:70.0) Gecko/20100101 Firefox/70.0'}
+    try:
+        # A property ID goes straight to the property page
+        property_id = property_id_of(address)
+        if property_id:
+            return get_data(property_id)
+
+        id_one = search(address)
+
+        if id_one is None:
+            return None
+
+        # If property is found, call get_data() with its property ID
+        house = get_data(id_one)
+        cache.put_house('fbcad', 'address', address, house)
+        address_index.remember('fbcad', address, house)
+        return house
+
+    except requests.exceptions.HTTPError as e:
+        # Throttling is raised so it is reported as an error instead of the property not being found
+        if e.response is not None and e.response.status_code in client.THROTTLE_STATUS:
+            raise
+
+        print(e)
+        return None
+
+
+def property_id_of(query):
+    """
+    Checks if a property ID was typed instead of an address
+
+    :param query: Address or property ID as typed i.e. " r416144"
+    :return: The property ID as the website writes it i.e. "R416144", or None for an address
+    """
+
+    query = str(query).strip()
+    return query.upper() if PROPERTY_ID.match(query) else None
+
+
+def search(address):
+    """
+    Fetch step of a lookup: searches FBCAD for the address
+
+    :param address: User provided address to search on FBCAD website
+    :return: The Property ID of the first result or None
+    """
+
+    # Skipping the search when this address was found before or is in an imported export
+    property_id = address_index.find('fbcad', address)
+    if property_id:
+        return property_id
 
     # These are the params for the GET call to FBCAD url
+    # The whole address is sent, the city and zip code tell apart streets of the same name
     # parameters = {'ty': 2020, 'f': address}
-    parameters = {'keywords': address}
+    parameters = {'keywords': address.strip()}
 
-    # The FBCAD URL for the initial query
-    url = 'https://esearch.fbcad.org/Search/SearchResults'
+    page = cache.get_page('fbcad', 'search', address)
 
-    try:
-        s = r.get(url, headers=headers, params=parameters)
+    if page is None:
+        # The shared client session sends the browser headers and reuses open connections
+        with metrics.span('fbcad.search'):
+            s = client.get(SEARCH_URL, params=parameters)
 
         # Check for errors
         s.raise_for_status()
 
-        # The returned data is in JSON format so parsing JSON
-        json_data = json.loads(s.text)
-
-        # In the JSON results, Record Count shows 0 if property not found
-        if json_data['resultsList'] != 0:
-            # If property is found, retrieve the property IDs
-            # and call get_data()
-            id_one = json_data['resultsList'][0]['propertyId']
-            return get_data(id_one)
-        else:
-            return None
+        page = s.text
+        cache.put_page('fbcad', 'search', address, page)
 
-    except requests.exceptions.HTTPError as e:
-        print(e)
+    # The returned data is in JSON format so parsing JSON
+    json_data = json.loads(page)
+
+    # Keeping the other results too, a search on a street often returns its neighbours
+    if len(json_data['resultsList']) > 1:
+        address_index.add_many('fbcad', [(situs_address(result.get('address') or ''), result['propertyId'])
+                                         for result in json_data['resultsList'][1:]], source='search')
+
+    # In the JSON results, the results list is empty if property not found
+    if json_data['resultsList']:
+        # If property is found, retrieve the property IDs
+        return json_data['resultsList'][0]['propertyId']
+    else:
         return None
 
 
+def search_all(keywords, max_pages=SWEEP_MAX_PAGES):
+    """
+    Reads every page of the search results for a street or subdivision name
+
+    :param keywords: Search text i.e. "Sample Creek"
+    :param max_pages: Most pages of results read
+    :return: List of (property ID, situs address) tuples in the order FBCAD returns them
+    """
+
+    keywords = normalize_address(keywords) or keywords.strip()
+    results = []
+    seen = set()
+
+    for page_number in range(1, max_pages + 1):
+        key = f'{keywords} page {page_number}'
+        page = cache.get_page('fbcad', 'search', key)
+
+        if page is None:
+            parameters = {'keywords': keywords, 'page': page_number, 'pageSize': SEARCH_PAGE_SIZE}
+
+            with metrics.span('fbcad.search'):
+                s = client.get(SEARCH_URL, params=parameters)
+
+            s.raise_for_status()
+
+            page = s.text
+            cache.put_page('fbcad', 'search', key, page)
+
+        json_data = json.loads(page)
+        page_results = json_data['resultsList'] or []
+        new_results = [(result['propertyId'], result.get('address') or '') for result in page_results
+                       if result['propertyId'] not in seen]
+
+        # Stopping when a page only repeats earlier results, in case the page parameter is ignored
+        if not new_results:
+            break
+
+        results.extend(new_results)
+        seen.update(property_id for property_id, address in new_results)
+
+        total = json_data.get('totalResults')
+        if len(page_results) < SEARCH_PAGE_SIZE or (total and len(results) >= total):
+            break
+
+    return results
+
+
+def sweep(keywords, workers=4, parse=False, max_pages=SWEEP_MAX_PAGES):
+    """
+    Finds every property of a street or subdivision with one search and downloads their pages
+
+    The address of every result is added to the address index and the property pages are saved
+    in the cache, so looking up any of these addresses later skips both the search and the download.
+
+    :param keywords: Search text i.e. "Sample Creek"
+    :param workers: Most property pages downloaded at once
+    :param parse: Also parse the pages, the House objects are returned and saved in the cache
+    :param max_pages: Most pages of search results read
+    :return: List of dicts in the format of batch.run_one(), the status is "fetched" when not parsing
+    """
+
+    results = search_all(keywords, max_pages)
+
+    address_index.add_many('fbcad', [(situs_address(address), property_id)
+                                     for property_id, address in results if address], source='sweep')
+
+    def prefetch(number, property_id, address):
+        record = {'row': number, 'county': 'fbcad', 'query': address or property_id}
+
+        try:
+            if parse:
+                record['house'] = get_data(property_id)
+                record['status'] = 'found'
+            else:
+                fetch_property(property_id)
+                record['status'] = 'fetched'
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+
+        return record
+
+    # The client rate limiter also applies, workers only caps the downloads waiting on it
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(prefetch, number, property_id, address)
+                   for number, (property_id, address) in enumerate(results, start=1)]
+
+        return [future.result() for future in futures]
+
+
 def get_data(property_id):
     """
     Gets all the data from the FBCAD website for the particular property.
@@ -62,19 +235,94 @@ def get_data(property_id):
     :return: An instance of the House object containing the results
     """
 
-    # Creating a new request session
-    r = requests.Session()
+    # Returning the saved result if this property was looked up before
+    house = cache.get_house('fbcad', 'id', property_id)
+    if house:
+        return house
 
-    # Setting User agent to mimic browser
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:70.0) Gecko/20100101 Firefox/70.0'}
+    if PARSER == 'stream':
+        # The page is parsed while it downloads
+        root = fetch_property_tree(property_id)
+        with metrics.span('fbcad.parse'):
+            results = parse_tree(root, property_id)
+    else:
+        results = parse_property(fetch_property(property_id), property_id)
+
+    cache.put_house('fbcad', 'id', property_id, results)
+
+    # Return the House object
+    return results
+
+
+def fetch_property(property_id):
+    """
+    Fetch step of a lookup: downloads the property page
+
+    :param property_id: FBCAD Quick Reference ID "R416144"
+    :return: HTML of the property page
+    """
 
-    # These are the params for the specific property
-    url = 'https://esearch.fbcad.org/Property/View/' + property_id
+    page = cache.get_page('fbcad', 'view', property_id)
 
-    s = r.get(url, headers=headers)
+    if page is None:
+        # These are the params for the specific property
+        with metrics.span('fbcad.view'):
+            s = client.get(VIEW_URL + property_id)
+
+        # Check for errors so an error page is not saved in the cache
+        s.raise_for_status()
+
+        page = s.text
+        cache.put_page('fbcad', 'view', property_id, page)
+
+    return page
+
+
+def fetch_property_tree(property_id):
+    """
+    Fetch step of a streaming lookup: builds the lxml tree of the property page while it downloads
+
+    :param property_id: FBCAD Quick Reference ID "R416144"
+    :return: The root element of the property page
+    """
+
+    page = cache.get_page('fbcad', 'view', property_id)
+
+    if page is not None:
+        return parsing.parse_html(page)
+
+    # The span covers the download and the parse since they overlap
+    with metrics.span('fbcad.view'):
+        s = client.get(VIEW_URL + property_id, stream=True)
+        root, page = parsing.parse_response(s, keep_text=cache.SETTINGS['enabled'])
+
+    if page is not None:
+        cache.put_page('fbcad', 'view', property_id, page)
+
+    return root
+
+
+def parse_property(page, property_id):
+    """
+    Builds the House object from an FBCAD property page using the parser set in PARSER
+
+    :param page: HTML of the "/Property/View/<id>" page
+    :param property_id: FBCAD Quick Reference ID "R416144"
+    :return: An instance of the House object containing the results
+    """
+
+    return PARSERS[PARSER](page, property_id)
+
+
+@metrics.timed('fbcad.parse')
+def parse_soup(page, property_id):
+    """
+    Extracts the property data by building a full BeautifulSoup tree of the page
+    """
 
     # Parsing results from above url through BeautifulSoup
-    soup = BeautifulSoup(s.text, 'lxml')
+    with metrics.span('fbcad.parse.tree'):
+        soup = BeautifulSoup(page, 'lxml')
 
     # The property page on FBCAD is made up of tables
     house_appraisal = soup.find(text=re.compile("Property Roll Value History"))
@@ -89,32 +337,138 @@ def get_data(property_id):
     # The complete address for the house
     formatted_address = soup.find('th', text='Situs Address:').next_element.next_element.text
 
-    # The appraised value for the house
-    appraised_value = ""
-
-    try:
-        house_appraisal_table_row = house_appraisal_table.find('td', text=datetime.datetime.now().year)
+    # The appraised value for the house is the last cell in the row of the tax year
+    def appraisal_row_value(year):
+        house_appraisal_table_row = house_appraisal_table.find('td', text=year)
         if house_appraisal_table_row:
-            appraised_value_raw = house_appraisal_table_row.parent.findAll('td')[-1].text.strip()
-            if appraised_value_raw != "N/A":
-                appraised_value = appraised_value_raw
-            else:
-                appraised_value = house_appraisal_table.find(
-                    'td', text=datetime.datetime.now().year - 1).parent.findAll(
-                    'td')[-1].text.strip()
-        else:
-            house_appraisal_table_row = house_appraisal_table.find('td', text=datetime.datetime.now().year - 1)
-            appraised_value = house_appraisal_table_row.parent.findAll('td')[-1].text.strip()
-    except IndexError:
-        appraised_value = "Not Found"
+            return house_appraisal_table_row.parent.findAll('td')[-1].text.strip()
+        return None
 
     # The square footage for the house
     sqft_raw = soup.find(text=re.compile("Living Area")).next_element
-    square_foot = sqft_raw.replace('sqft', '')[:-3].replace(',', '')
 
     # Elements: Main Area, Attached Garage, Open Porch etc
     house_elements_table_rows = house_elements_table.find_all('tr')
 
+    # Getting the cell with the house details such as baths etc
+    detail_cells = house_elements_table_rows[1].find_all('td')
+
+    # Getting the rest of the details from the first cell that contains baths etc
+    details = [dcell.text for dcell in detail_cells[1].find_all('div')]
+
+    # Manually adding Main Area (first floor) label and square footage
+    element_rows = [['Main Area', detail_cells[-1].text]]
+
+    # Skipping the first row of values as it is the table header
+    for row in house_elements_table_rows[2:]:
+        cells = row.find_all('td')
+        element_rows.append([cells[1].text, cells[-1].text])
+
+    # Get the year built
+    year_built = detail_cells[-2].text
+
+    # Selecting the Deed History table to get last sale information
+    # Getting the first row of data which includes deed date, seller, buyer etc
+    deed_cells = [cell.text for row in house_deed_table.find_all('tr')[1:2] for cell in row.find_all('td')]
+
+    return build_house(property_id, formatted_address, appraisal_row_value, sqft_raw,
+                       details, element_rows, year_built, deed_cells)
+
+
+# Precompiled XPath selectors for parse_lxml()
+# Each finds the first text on the page containing the heading, then the table after it
+APPRAISAL_TABLE = etree.XPath("(//text()[contains(., 'Property Roll Value History')])[1]/following::table[1]")
+DEED_TABLE = etree.XPath("(//text()[contains(., 'Property Deed History')])[1]/following::table[1]")
+ELEMENTS_TABLE = etree.XPath("(//text()[contains(., 'Property Improvement - Building')])[1]/following::table[1]")
+SITUS_ADDRESS = etree.XPath("(//th[. = 'Situs Address:'])[1]/following::node()[1]")
+LIVING_AREA = etree.XPath("(//text()[contains(., 'Living Area')])[1]/following::text()[1]")
+YEAR_CELL = etree.XPath(".//td[. = $year]")
+
+
+@metrics.timed('fbcad.parse')
+def parse_lxml(page, property_id):
+    """
+    Extracts the property data with precompiled XPath selectors on an lxml tree,
+    only reading the tables that are needed instead of searching the whole page each time
+    """
+
+    with metrics.span('fbcad.parse.tree'):
+        root = parsing.parse_html(page)
+
+    return parse_tree(root, property_id)
+
+
+def parse_tree(root, property_id):
+    """
+    Reads the property data from the lxml tree of the page, built by parse_lxml() or while streaming
+    """
+
+    house_appraisal_table = parsing.first(APPRAISAL_TABLE, root)
+    house_deed_table = parsing.first(DEED_TABLE, root)
+    house_elements_table = parsing.first(ELEMENTS_TABLE, root)
+
+    # The complete address for the house
+    formatted_address = parsing.text_of(parsing.first(SITUS_ADDRESS, root))
+
+    # The appraised value for the house is the last cell in the row of the tax year
+    def appraisal_row_value(year):
+        house_appraisal_table_row = parsing.first(YEAR_CELL, house_appraisal_table, year=str(year))
+        if house_appraisal_table_row is not None:
+            return parsing.CELLS(house_appraisal_table_row.getparent())[-1].text_content().strip()
+        return None
+
+    # The square footage for the house
+    sqft_raw = parsing.first(LIVING_AREA, root)
+
+    # Elements: Main Area, Attached Garage, Open Porch etc
+    house_elements_table_rows = parsing.ROWS(house_elements_table)
+
+    # Getting the cell with the house details such as baths etc
+    detail_cells = parsing.CELLS(house_elements_table_rows[1])
+    details = [dcell.text_content() for dcell in parsing.DIVS(detail_cells[1])]
+
+    element_rows = [['Main Area', detail_cells[-1].text_content()]]
+
+    for row in house_elements_table_rows[2:]:
+        cells = parsing.CELLS(row)
+        element_rows.append([cells[1].text_content(), cells[-1].text_content()])
+
+    year_built = detail_cells[-2].text_content()
+
+    deed_cells = [cell.text_content() for row in parsing.ROWS(house_deed_table)[1:2] for cell in parsing.CELLS(row)]
+
+    return build_house(property_id, formatted_address, appraisal_row_value, str(sqft_raw),
+                       details, element_rows, year_built, deed_cells)
+
+
+def build_house(property_id, formatted_address, appraisal_row_value, sqft_raw,
+                details, element_rows, year_built, deed_cells):
+    """
+    Turns the text extracted from the FBCAD page by either parser into a House object
+
+    :param property_id: FBCAD Quick Reference ID "R416144"
+    :param formatted_address: The Situs Address
+    :param appraisal_row_value: Function returning the appraised value for a year or None
+    :param sqft_raw: The living area text i.e. "2,345.00sqft"
+    :param details: Text of each detail line i.e. "Bedrooms:4"
+    :param element_rows: List of [label, sqft] for every building element
+    :param year_built: Text of the year built cell
+    :param deed_cells: Text of each cell in the latest deed row
+    :return: An instance of the House object containing the results
+    """
+
+    # The appraised value for the house
+    appraised_value = appraisal_row_value(datetime.datetime.now().year)
+
+    # The current year shows N/A until it is certified, so using last year's value
+    if appraised_value is None or appraised_value == "N/A":
+        appraised_value = appraisal_row_value(datetime.datetime.now().year - 1)
+
+    if appraised_value is None:
+        appraised_value = "Not Found"
+
+    square_foot = sqft_raw.replace('sqft', '')[:-3].replace(',', '')
+
     house_elements = []
 
     # Getting the Account # / Property ID
@@ -122,20 +476,13 @@ def get_data(property_id):
     # Adding the FBCAD Account Number to the element arrays
     house_elements.append(["FBCAD", acct_number])
 
-    # Getting the cell with the house details such as baths etc
-    detail_row = house_elements_table_rows[1]
-    detail_cells = detail_row.find_all('td')
-
-    # Manually adding Main Area (first floor) label and square footage
-    house_elements.append(['Main Area', detail_cells[-1].text.replace('.00', '').strip()])
-
-    # Getting the rest of the details from the first cell that contains baths etc
-    detail_cells_divs = detail_cells[1].find_all('div')
+    for label, value in element_rows:
+        house_elements.append([label.strip(), value.replace('.00', '').strip()])
 
     bedrooms, baths, half_baths, fireplace = [0] * 4
 
-    for dcell in detail_cells_divs:
-        data = dcell.text.split(":")
+    for detail in details:
+        data = detail.split(":")
         if data[0].lower() == "bedrooms":
             bedrooms = data[1]
         elif data[0].lower() == "bathrooms":
@@ -145,11 +492,6 @@ def get_data(property_id):
         elif data[0].lower() == "fireplaces":
             fireplace = data[1]
 
-    # Skipping the first row of values as it is the table header
-    for row in house_elements_table_rows[2:]:
-        cells = row.find_all('td')
-        house_elements.append([cells[1].text.strip(), cells[-1].text.replace('.00', '').strip()])
-
     # Setting the default value for these variables to 0
     porch, patio, deck, garage = [0] * 4
     stories = 1
@@ -170,55 +512,111 @@ def get_data(property_id):
         if 'Story' in k:
             stories = 2
 
-    # Get the year built
-    try:
-        year_built = house_elements_table_rows[1].find_all('td')[-2].text
-    except AttributeError:
-        year_built = "Not Found"
-
-    # Selecting the Deed History table to get last sale information
-    # Getting the first row of data which includes deed date, seller, buyer etc
-    house_deed_rows = house_deed_table.find_all('tr')[1:2]
-
     purchase_date = ""
     buyer = ""
 
-    for row in house_deed_rows:
-        cells = row.find_all('td')
-        # Extracting the Purchase Date
-        try:
-            purchase_date = cells[0].text
-        except None:
-            purchase_date = "Not Found"
-        # Extracting the name of the buyer
-        try:
-            buyer = cells[4].text
-        except None:
-            buyer = "Not Found"
+    if deed_cells:
+        # Extracting the Purchase Date and the name of the buyer
+        purchase_date = deed_cells[0]
+        buyer = deed_cells[4]
 
     # Creating a House instance with the above scraped data
-    results = House(address=formatted_address,
-                    sqft=square_foot,
-                    value=appraised_value,
-                    year_built=year_built,
-                    porch=porch,
-                    patio=patio,
-                    deck=deck,
-                    garage=garage,
-                    purchase_date=purchase_date,
-                    buyer=buyer,
-                    bedrooms=bedrooms,
-                    baths=baths,
-                    half_baths=half_baths,
-                    fireplace=fireplace,
-                    stories=stories,
-                    elements=house_elements)
+    return House(address=formatted_address,
+                 sqft=square_foot,
+                 value=appraised_value,
+                 year_built=year_built,
+                 porch=porch,
+                 patio=patio,
+                 deck=deck,
+                 garage=garage,
+                 purchase_date=purchase_date,
+                 buyer=buyer,
+                 bedrooms=bedrooms,
+                 baths=baths,
+                 half_baths=half_baths,
+                 fireplace=fireplace,
+                 stories=stories,
+                 elements=house_elements)
+
+
+# The parsers that can be chosen for FBCAD pages
+# "soup" builds a full BeautifulSoup tree, "lxml" is faster and gives the same results
+# "stream" is lxml fed while the page downloads, pages already downloaded are parsed with lxml
+PARSERS = {'soup': parse_soup,
+           'lxml': parse_lxml,
+           'stream': parse_lxml}
+
+# The parser used by get_data()
+PARSER = 'soup'
+
+
+class FbcadAdapter(adapters.CountyAdapter):
+    """
+    FBCAD lookups: a JSON search for the property ID, then the property page
+    """
 
-    # Return the House object
-    return results
+    def is_property_id(self, query):
+        return property_id_of(query) is not None
+
+    def search(self, query):
+        # A property ID typed instead of an address is its own search result
+        return property_id_of(query) or search(query)
+
+    def fetch(self, property_id):
+        return fetch_property(property_id), property_id
+
+    def fetch_changed(self, property_id, validators=None):
+        with metrics.span('fbcad.view'):
+            s = client.get(VIEW_URL + property_id, headers=client.conditional_headers(validators))
+
+        if s.status_code == 304:
+            return None, validators
+
+        s.raise_for_status()
+        return (s.text, property_id), client.validators_of(s)
+
+    def change_hash(self, pages):
+        page = pages[0]
+        # A page without one of the tables is hashed whole so a layout change is not missed
+        return parsing.content_hash(*[parsing.table_after(page, heading) or page for heading in CHANGE_SECTIONS])
+
+    def lookup(self, query, lazy=False):
+        return get_property_id(query, lazy)
+
+    def lookup_id(self, property_id):
+        return get_data(property_id_of(property_id) or property_id)
+
+    async def lookup_async(self, scraper, query):
+        # A property ID goes straight to the property page, and the search is skipped
+        # when the property ID of this address is already known
+        property_id = property_id_of(query) or address_index.find('fbcad', query)
+        if property_id:
+            return await self.lookup_id_async(scraper, property_id)
+
+        page = await scraper.cached_request('fbcad', 'search', query, 'GET', SEARCH_URL,
+                                            params={'keywords': query.strip()})
+
+        # The returned data is in JSON format so parsing JSON
+        results = json.loads(page)['resultsList']
+        if not results:
+            return None
+
+        return await self.lookup_id_async(scraper, results[0]['propertyId'])
+
+    async def lookup_id_async(self, scraper, property_id):
+        property_id = property_id_of(property_id) or property_id
+        page = await scraper.cached_request('fbcad', 'view', property_id, 'GET', VIEW_URL + property_id)
+
+        # Passing the parse function itself since a process pool does not see PARSER changes
+        return await scraper.parse(self.parser(), page, property_id)
+
+
+ADAPTER = FbcadAdapter(sys.modules[__name__])
 
 
 if __name__ == '__main__':
+    import pyperclip
+
     # Ask the user for the address to search
     query = input("Enter Property Address > ")
 
@@ -1,59 +1,356 @@
 from utilities import House, format_result
+from concurrent.futures import ThreadPoolExecutor
+from addresses import split_address
 from bs4 import BeautifulSoup
-import pyperclip
-import requests
+from lxml import etree
+import address_index
+import adapters
+import parsing
+import metrics
+import client
+import cache
+import threading
 import datetime
+import html
+import sys
 import re
 
 
-def get_data(address):
+# The User agent is added by the shared client session
+# Adding the referrer/content-type in the headers was the key to get this working
+HEADERS = {'Content-type': 'application/x-www-form-urlencoded',
+           'Referer': 'https://public.hcad.org/records/quicksearch.asp'}
+
+# The HCAD website, links found on its pages are relative to it
+BASE_URL = 'https://public.hcad.org'
+
+# The HCAD URL for the initial query
+RECORD_URL = BASE_URL + '/records/QuickRecord.asp'
+
+# Most Ownership History pages downloaded at once in the background by get_record()
+OWNERSHIP_THREADS = 8
+
+# Headings of the record page tables compared by refresh.py, the sales are on the Ownership History page
+CHANGE_SECTIONS = ['Valuations']
+
+# Buyer and purchase date of a record parsed without its Ownership History page, the same as a missing page gives
+NO_OWNERSHIP = {'buyer': 'Not found', 'purchase_date': 'Not found'}
+
+
+def get_data(address, lazy=False):
     """
     Goes to the HCAD website and searches the inputted address
     If found, scrapes all the data and returns an House object
 
     :param address: User inputted query
+    :param lazy: Only download the Ownership History (buyer and purchase date) when they are first used
     :return: An instance of the House object containing all scraped data
     """
 
-    # Creating a new request session
-    r = requests.Session()
+    # Returning the saved result if this address was looked up before
+    house = cache.get_house('hcad', 'address', address)
+    if house:
+        return house
 
-    # Setting User agent to mimic browser
-    # Adding the referrer/content-type in the headers was the key to get this working
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:70.0) Gecko/20100101 Firefox/70.0',
-               'Content-type': 'application/x-www-form-urlencoded',
-               'Referer': 'https://public.hcad.org/records/quicksearch.asp'}
+    results = get_record(address, lazy)
 
-    # The HCAD URL for the initial query
-    url = 'https://public.hcad.org/records/QuickRecord.asp'
+    # A lazy House is not saved, saving it would load its fields
+    if results.loaded:
+        cache.put_house('hcad', 'address', address, results)
+    address_index.remember('hcad', address, results)
 
-    try:
-        property_id = int(address)
+    # Returning an instance of the House object with all the data
+    return results
 
-        # These are the params for the POST call to HCAD url
-        payload = {'TaxYear': datetime.datetime.now().year,
-                   'searchtype': 'strap',
-                   'searchval': property_id}  # This is the property id
 
-    except ValueError:
-        # Split the inputted address into street number and street name using regex
-        # Find all the numbers at the start of the address
-        stnum = re.findall(r'^[0-9]*', address)[0]
-        # Find all the characters in the address that are not numbers
-        stname = re.findall(r'[^0-9]+', address)[0].strip()
+def get_account(account, lazy=False):
+    """
+    Looks up a property by its HCAD account number without searching for an address
+
+    :param account: HCAD account number, a string so leading zeros are kept i.e. "0660640130020"
+    :param lazy: Only download the Ownership History when the buyer or purchase date is first used
+    :return: An instance of the House object containing all scraped data
+    """
+
+    account = str(account).strip()
+
+    if not is_account(account):
+        raise ValueError(f'Not an HCAD account number: {account}')
+
+    # Returning the saved result if this account was looked up before
+    house = cache.get_house('hcad', 'id', account)
+    if house:
+        return house
+
+    results = get_record(account, lazy)
+
+    if results.loaded:
+        cache.put_house('hcad', 'id', account, results)
+
+    return results
+
+
+def get_record(address, lazy=False):
+    """
+    Downloads and parses the record page, the Ownership History is downloaded
+    in the background while the record page is parsed
+
+    :param address: User inputted query
+    :param lazy: Download the Ownership History when the buyer or purchase date is first used instead
+    :return: An instance of the House object
+    """
+
+    if PARSER == 'stream':
+        # The record page is parsed while it downloads, the link is then read from the tree
+        root = fetch_record_tree(address)
+        ownership_url = find_ownership_url_in_tree(root)
+
+        def parse():
+            with metrics.span('hcad.parse'):
+                return parse_tree(root, None)
+    else:
+        page = fetch_record(address)
+
+        # The Ownership History link is found without parsing so it can be requested straight away
+        ownership_url = find_ownership_url(page)
+
+        def parse():
+            return parse_record(page, None)
+
+    if ownership_url is None or lazy:
+        results = parse()
+
+        if ownership_url:
+            results.load_later(lambda: parse_ownership(fetch_ownership(ownership_url)))
+
+        return results
+
+    ownership = ownership_pool().submit(fetch_ownership, ownership_url)
+
+    results = parse()
+
+    ownership_fields = parse_ownership(ownership.result())
+    results.buyer = ownership_fields['buyer']
+    results.purchase_date = ownership_fields['purchase_date']
+
+    return results
+
+
+# Threads downloading Ownership History pages, created on first use
+_ownership_pool = None
+_pool_lock = threading.Lock()
+
+
+def ownership_pool():
+    global _ownership_pool
+
+    with _pool_lock:
+        if _ownership_pool is None:
+            _ownership_pool = ThreadPoolExecutor(max_workers=OWNERSHIP_THREADS, thread_name_prefix='hcad-ownership')
+
+    return _ownership_pool
+
+
+def fetch_pages(address):
+    """
+    Fetch step of a lookup: downloads the record page and its Ownership History popup
+
+    :param address: User inputted query
+    :return: Tuple of the record page HTML and the Ownership History HTML (None if it could not be loaded)
+    """
+
+    page = fetch_record(address)
+
+    # Getting the Purchase date
+    # To get date we have to click on Ownership History link that opens a popup
+    # Finding and building the final Ownership History link
+    ownership_url = find_ownership_url(page)
+
+    # The link is missing when the property was not found, parse_record() will then fail as before
+    if ownership_url is None:
+        return page, None
+
+    return page, fetch_ownership(ownership_url)
+
+
+def fetch_record(address):
+    """
+    Downloads the record page of an address or account number
+
+    :param address: User inputted query
+    :return: HTML of the QuickRecord.asp page
+    """
+
+    page = cache.get_page('hcad', 'record', address)
+
+    if page is None:
+        with metrics.span('hcad.record'):
+            s = client.post(RECORD_URL, headers=HEADERS, data=build_payload(address))
+
+        # Check for errors
+        s.raise_for_status()
+
+        page = s.text
+        cache.put_page('hcad', 'record', address, page)
 
+    return page
+
+
+def fetch_record_tree(address):
+    """
+    Fetch step of a streaming lookup: builds the lxml tree of the record page while it downloads
+
+    :param address: User inputted query
+    :return: The root element of the QuickRecord.asp page
+    """
+
+    page = cache.get_page('hcad', 'record', address)
+
+    if page is not None:
+        return parsing.parse_html(page)
+
+    # The span covers the download and the parse since they overlap
+    with metrics.span('hcad.record'):
+        s = client.post(RECORD_URL, headers=HEADERS, data=build_payload(address), stream=True)
+        root, page = parsing.parse_response(s, keep_text=cache.SETTINGS['enabled'])
+
+    if page is not None:
+        cache.put_page('hcad', 'record', address, page)
+
+    return root
+
+
+def fetch_ownership(ownership_url):
+    """
+    Downloads the Ownership History popup
+
+    An error response is raised, returning nothing would save the House in the cache
+    with the buyer and purchase date "Not found" until it expires
+
+    :param ownership_url: Url found by find_ownership_url()
+    :return: HTML of the popup
+    """
+
+    ownership_page = cache.get_page('hcad', 'ownership', ownership_url)
+
+    if ownership_page is None:
+        # Going to the Ownership History link
+        with metrics.span('hcad.ownership'):
+            s2 = client.post(ownership_url, headers=HEADERS)
+
+        # Checking for errors
+        s2.raise_for_status()
+
+        ownership_page = s2.text
+        cache.put_page('hcad', 'ownership', ownership_url, ownership_page)
+
+    return ownership_page
+
+
+def build_payload(address):
+    """
+    Builds the form data for the HCAD search
+
+    :param address: User inputted query, either an address or an HCAD account number
+    :return: Dict of the POST params
+    """
+
+    # Searching by account number when one was given, or when this address
+    # was found before or is in an imported export
+    account = address.strip() if is_account(address) else address_index.find('hcad', address)
+
+    if account:
         # These are the params for the POST call to HCAD url
-        payload = {'TaxYear': datetime.datetime.now().year,
-                   'stnum': stnum,  # This is the street number
-                   'stname': stname}  # This is the street name
+        # The account number is sent as text so leading zeros are kept
+        return {'TaxYear': datetime.datetime.now().year,
+                'searchtype': 'strap',
+                'searchval': account}  # This is the property id
+
+    # Split the inputted address into street number and street name
+    # The street name uses the USPS abbreviations HCAD uses and has no unit number
+    stnum, stname = split_address(address)
+
+    # These are the params for the POST call to HCAD url
+    payload = {'TaxYear': datetime.datetime.now().year,
+               'stnum': stnum,  # This is the street number
+               'stname': stname}  # This is the street name
 
-    s = r.post(url, headers=headers, data=payload)
+    return payload
 
-    # Check for errors
-    s.raise_for_status()
+
+def is_account(query):
+    """
+    Checks if the query is an HCAD account number i.e. "0660640130020"
+
+    :return: True if the query is only digits
+    """
+
+    return query.strip().isdigit()
+
+
+def find_ownership_url(page):
+    """
+    Finds the Ownership History link in the HCAD record page without parsing the whole page
+
+    :param page: HTML of the QuickRecord.asp page
+    :return: The full url of the Ownership History popup or None
+    """
+
+    link = OWNERSHIP_LINK.search(page)
+
+    if link is None:
+        return None
+
+    return BASE_URL + html.unescape(link.group(1))
+
+
+def find_ownership_url_in_tree(root):
+    """
+    Finds the Ownership History link in the lxml tree of the record page
+
+    :return: The full url of the Ownership History popup or None
+    """
+
+    link = parsing.first(OWNERSHIP_HREF, root)
+
+    if link is None:
+        return None
+
+    return BASE_URL + link
+
+
+def parse_record(page, ownership_page):
+    """
+    Builds the House object from the HCAD pages using the parser set in PARSER
+
+    :param page: HTML of the QuickRecord.asp page
+    :param ownership_page: HTML of the Ownership History popup or None if it could not be loaded
+    :return: An instance of the House object containing all scraped data
+    """
+
+    return PARSERS[PARSER](page, ownership_page)
+
+
+def parse_ownership(ownership_page):
+    """
+    Gets the buyer and purchase date from the Ownership History popup using the parser set in PARSER
+
+    :param ownership_page: HTML of the popup or None if it could not be loaded
+    :return: Dict of the buyer and purchase_date
+    """
+
+    return OWNERSHIP_PARSERS[PARSER](ownership_page)
+
+
+@metrics.timed('hcad.parse')
+def parse_soup(page, ownership_page):
+    """
+    Extracts the property data by building a full BeautifulSoup tree of the pages
+    """
 
     # Parsing the date into BeautifulSoup
-    soup = BeautifulSoup(s.text, 'lxml')
+    with metrics.span('hcad.parse.tree'):
+        soup = BeautifulSoup(page, 'lxml')
 
     # Getting the latest appraised value
     # Since the table containing the value doesnt have an ID etc
@@ -70,81 +367,224 @@ def get_data(address):
 
     # NEW METHOD for (appraised value):
     # I am using regex to get the largest number on the page
-    try:
-        values_raw = value_table.find_all('td', string=re.compile("\d+,\d+"))
-        values_formatted = [int((re.sub(r'[^\d+,\d+]', '', v.text)).replace(',', '')) for v in values_raw]
-        value = "{:,}".format(max(values_formatted))
-    except ValueError:
-        value = 0
+    values_raw = [v.text for v in value_table.find_all('td', string=re.compile(r"\d+,\d+"))]
 
     # Getting the year built and sqft by finding the parent table
     year_table = soup.find('th', string="Year Built").parent.parent
     # Getting the second last row
     year_rows = year_table.find_all('tr')[-2]
     # Finding all the cells in the above table
-    year_cells = year_rows.find_all('td')
-    # Extracting the year built
-    year_built = year_cells[1].text.strip()
-    # Since the square foot is in the same table, getting sqft from same place
-    sqft = re.sub(r'\D', '', year_cells[-2].text.strip())
+    year_cells = [cell.text for cell in year_rows.find_all('td')]
 
     # Selecting the table on the bottom left of the HCAD page which has baths, fireplace etc
     building_data_table = soup.find('th', string='Building Data').parent.parent
 
-    # Getting the half-baths
-    try:
-        # Selecting the cell, using regex, that has the words Half
-        baths_half_cell = building_data_table.find('td', string=re.compile('(Half)')).parent
-        baths_half = baths_half_cell.find_all('td')[-1].text
-    except AttributeError:
-        baths_half = 0
-
-    # Getting the full-baths
-    try:
-        # Selecting the cell, using regex, that has the words Full
-        baths_full_cell = building_data_table.find('td', string=re.compile('(Full)')).parent
-        baths_full = baths_full_cell.find_all('td')[-1].text
-    except AttributeError:
-        baths_full = 0
-
-    # Compiling the full and half baths so two and a half baths would be 2.5
-    baths = int(baths_full) + int(baths_half) / 2
-
-    # Getting the Fireplace
-    try:
-        # Selecting the cell, using regex, that has the words Fireplace
-        fireplace_cell = building_data_table.find('td', string=re.compile('(Fireplace)')).parent
-        fireplace = fireplace_cell.find_all('td')[-1].text
-    except AttributeError:
-        fireplace = 0
+    # Gets the value next to the first cell, using regex, that has the given words
+    def building_data(words):
+        try:
+            cell = building_data_table.find('td', string=re.compile(words)).parent
+            return cell.find_all('td')[-1].text
+        except AttributeError:
+            return 0
 
     # Selecting the table on the bottom right of the HCAD page which has porch, patio etc
     # Selecting the <th>, using regex, that has the words Building Areas
     building_area_table = soup.find('th', string=re.compile('(Building Areas)')).parent.parent
     # Getting all the data from the above table
-    building_area_data = building_area_table.find_all('td')
-    # Using list comprehension to extract labels and values from the above list separately
-    building_area_labels = [label.text.title() for label in building_area_data[0::2]]
-    building_area_values = [label.text for label in building_area_data[1::2]]
+    building_area_data = [cell.text for cell in building_area_table.find_all('td')]
 
     # Some properties have Extra Features which show up on a separate table at the bottm
     # These can be detached garage, pool etc
+    extra_rows = []
     check_extra = soup.find('th', text="Extra Features")
     if check_extra:
         extra_table = check_extra.parent.parent
-        extra_rows = extra_table.find_all('tr')[2:]
-        for row in extra_rows[1:]:
-            extra_cells = row.find_all('td')
-            extra_raw = [cell.text for cell in extra_cells]
-            # Appending the extra features labels/values to the lists created above
-            building_area_labels.append(extra_raw[1].title())
-            building_area_values.append(extra_raw[-2])
-    else:
-        pass
+        for row in extra_table.find_all('tr')[2:][1:]:
+            extra_rows.append([cell.text for cell in row.find_all('td')])
 
     # Getting HCAD Account Number from the page <title>
     # HCAD website has the account number as part of the <title> tag
     acct_number_data = soup.title.string
+
+    # Getting the full formatted address
+    address_row = soup.find('td', string="Property Address:").parent
+    # The address in HCAD includes a <br\> so using ".contents" to create a list
+    # that automatically splits the values
+    address_raw = address_row.find('th').contents
+
+    # Alternative method to get Address above
+    # address_raw = str(address_row.find('th')).replace('<br/>', ', ').replace('</th>', '')
+    # address = re.sub(r"<([^>]+)>", "", address_raw).strip()
+
+    # Without the page the timed parse is skipped, get_record() parses the page once it arrives
+    ownership = NO_OWNERSHIP if ownership_page is None else parse_ownership_soup(ownership_page)
+
+    return build_house(values_raw, year_cells, building_data, building_area_data, extra_rows,
+                       acct_number_data, address_raw, ownership['buyer'], ownership['purchase_date'])
+
+
+@metrics.timed('hcad.parse.ownership')
+def parse_ownership_soup(ownership_page):
+    """
+    Gets the latest owner and purchase date from the Ownership History popup with BeautifulSoup
+
+    :param ownership_page: HTML of the popup or None if it could not be loaded
+    :return: Dict of the buyer and purchase_date, "Not found" when the page is missing
+    """
+
+    buyer, purchase_date = "Not found", "Not found"
+
+    if ownership_page is not None:
+        # Parsing the date to BeautifulSoup
+        soup2 = BeautifulSoup(ownership_page, 'lxml')
+
+        # Finding the table with the purchase date
+        owner_table = soup2.find_all('table')[1]
+        # Getting the cell that contains the text "Effective Date"
+        effective_date = owner_table.find('td', text="Effective Date")
+        # Moving to the next siblings to get the buyer name and purchase date
+        buyer = effective_date.find_next('td').text
+        purchase_date = effective_date.find_next('td').find_next('td').text
+
+    return {'buyer': buyer, 'purchase_date': purchase_date}
+
+
+# Precompiled XPath selectors for parse_lxml()
+# Each finds a heading cell then goes up to the table containing it
+VALUE_TABLE = etree.XPath("//th[starts-with(., 'Valuations')]/../..")
+YEAR_TABLE = etree.XPath("//th[. = 'Year Built']/../..")
+BUILDING_DATA_TABLE = etree.XPath("//th[. = 'Building Data']/../..")
+BUILDING_AREA_TABLE = etree.XPath("//th[contains(., 'Building Areas')]/../..")
+EXTRA_TABLE = etree.XPath("//th[. = 'Extra Features']/../..")
+ADDRESS_CELL = etree.XPath("//td[. = 'Property Address:']/..//th")
+TITLE = etree.XPath("//title")
+OWNERSHIP_HREF = etree.XPath("(//a[. = 'Ownership History'])[1]/@href")
+TABLES = etree.XPath("//table")
+# The HCAD page uses a non-breaking space between "Effective" and "Date"
+EFFECTIVE_DATE = etree.XPath(".//td[. = 'Effective Date']")
+NEXT_CELLS = etree.XPath("following::td[position() <= 2]")
+
+# Regex used instead of a parser where only a single value is needed
+NUMBER = re.compile(r"\d+,\d+")
+OWNERSHIP_LINK = re.compile(r"""<a\s[^>]*href=["']([^"']*)["'][^>]*>Ownership History</a>""")
+
+
+@metrics.timed('hcad.parse')
+def parse_lxml(page, ownership_page):
+    """
+    Extracts the property data with precompiled XPath selectors on an lxml tree,
+    only reading the tables that are needed instead of searching the whole page each time
+    """
+
+    with metrics.span('hcad.parse.tree'):
+        root = parsing.parse_html(page)
+
+    return parse_tree(root, ownership_page)
+
+
+def parse_tree(root, ownership_page):
+    """
+    Reads the property data from the lxml tree of the record page, built by parse_lxml() or while streaming
+    """
+
+    # The <th> is only matched when it holds text alone, the same as BeautifulSoup's string=
+    value_table = parsing.first(VALUE_TABLE, root)
+    values_raw = [cell.text_content() for cell in parsing.CELLS(value_table)
+                  if NUMBER.search(parsing.string_of(cell) or '')]
+
+    year_table = parsing.first(YEAR_TABLE, root)
+    year_cells = [cell.text_content() for cell in parsing.CELLS(parsing.ROWS(year_table)[-2])]
+
+    building_data_table = parsing.first(BUILDING_DATA_TABLE, root)
+    building_data_cells = parsing.CELLS(building_data_table)
+
+    def building_data(words):
+        for cell in building_data_cells:
+            if re.search(words, parsing.string_of(cell) or ''):
+                return parsing.CELLS(cell.getparent())[-1].text_content()
+        return 0
+
+    building_area_table = parsing.first(BUILDING_AREA_TABLE, root)
+    building_area_data = [cell.text_content() for cell in parsing.CELLS(building_area_table)]
+
+    extra_rows = []
+    extra_table = parsing.first(EXTRA_TABLE, root)
+    if extra_table is not None:
+        for row in parsing.ROWS(extra_table)[2:][1:]:
+            extra_rows.append([cell.text_content() for cell in parsing.CELLS(row)])
+
+    acct_number_data = parsing.string_of(parsing.first(TITLE, root))
+
+    address_raw = parsing.contents_of(parsing.first(ADDRESS_CELL, root))
+
+    # Without the page the timed parse is skipped, get_record() parses the page once it arrives
+    ownership = NO_OWNERSHIP if ownership_page is None else parse_ownership_lxml(ownership_page)
+
+    return build_house(values_raw, year_cells, building_data, building_area_data, extra_rows,
+                       acct_number_data, address_raw, ownership['buyer'], ownership['purchase_date'])
+
+
+@metrics.timed('hcad.parse.ownership')
+def parse_ownership_lxml(ownership_page):
+    """
+    Gets the latest owner and purchase date from the Ownership History popup with XPath selectors
+    """
+
+    buyer, purchase_date = "Not found", "Not found"
+
+    if ownership_page is not None:
+        owner_table = TABLES(parsing.parse_html(ownership_page))[1]
+        effective_date = parsing.first(EFFECTIVE_DATE, owner_table)
+        buyer, purchase_date = [cell.text_content() for cell in NEXT_CELLS(effective_date)]
+
+    return {'buyer': buyer, 'purchase_date': purchase_date}
+
+
+def build_house(values_raw, year_cells, building_data, building_area_data, extra_rows,
+                acct_number_data, address_raw, buyer, purchase_date):
+    """
+    Turns the text extracted from the HCAD pages by either parser into a House object
+
+    :param values_raw: Text of every cell in the Valuations table holding a number like "1,234"
+    :param year_cells: Text of each cell in the building row of the Year Built table
+    :param building_data: Function returning the value next to a Building Data label matching a regex
+    :param building_area_data: Text of every cell in the Building Areas table
+    :param extra_rows: Text of the cells in each row of the Extra Features table
+    :param acct_number_data: The page title which ends with the account number
+    :param address_raw: The contents of the Property Address cell
+    :param buyer: Latest owner from the Ownership History
+    :param purchase_date: Date of the latest owner from the Ownership History
+    :return: An instance of the House object containing all scraped data
+    """
+
+    try:
+        values_formatted = [int((re.sub(r'[^\d+,\d+]', '', v)).replace(',', '')) for v in values_raw]
+        value = "{:,}".format(max(values_formatted))
+    except ValueError:
+        value = 0
+
+    # Extracting the year built
+    year_built = year_cells[1].strip()
+    # Since the square foot is in the same table, getting sqft from same place
+    sqft = re.sub(r'\D', '', year_cells[-2].strip())
+
+    # Getting the half-baths, full-baths and fireplace
+    baths_half = building_data('(Half)')
+    baths_full = building_data('(Full)')
+    fireplace = building_data('(Fireplace)')
+
+    # Compiling the full and half baths so two and a half baths would be 2.5
+    baths = int(baths_full) + int(baths_half) / 2
+
+    # Using list comprehension to extract labels and values from the above list separately
+    building_area_labels = [label.title() for label in building_area_data[0::2]]
+    building_area_values = [label for label in building_area_data[1::2]]
+
+    for extra_raw in extra_rows:
+        # Appending the extra features labels/values to the lists created above
+        building_area_labels.append(extra_raw[1].title())
+        building_area_values.append(extra_raw[-2])
+
     # Getting the last item in the above string which is the acct number
     acct_number = acct_number_data.split()[-1]
 
@@ -174,71 +614,140 @@ def get_data(address):
         if 'upr' in k.lower():
             stories = 2
 
-    # Getting the full formatted address
-    address_row = soup.find('td', string="Property Address:").parent
-    # The address in HCAD includes a <br\> so using ".contents" to create a list
-    # that automatically splits the values
-    address_raw = address_row.find('th').contents
-    # In the above list, usually the first element will be street number and name
+    # In the address contents, usually the first element will be street number and name
     # second element will be the <br\>
     # third element will be city, state, zip
     address = f'{address_raw[0]}, {address_raw[2]}'.strip()
 
-    # Alternative method to get Address above
-    # address_raw = str(address_row.find('th')).replace('<br/>', ', ').replace('</th>', '')
-    # address = re.sub(r"<([^>]+)>", "", address_raw).strip()
+    # Creating a House instance with the above scraped data
+    return House(address=address,
+                 sqft=sqft,
+                 value=value,
+                 year_built=year_built,
+                 porch=porch,
+                 patio=patio,
+                 deck=deck,
+                 garage=garage,
+                 purchase_date=purchase_date,
+                 buyer=buyer,
+                 bedrooms='',
+                 baths=baths,
+                 half_baths=None,
+                 fireplace=fireplace,
+                 stories=stories,
+                 elements=building_area)
+
+
+# The parsers that can be chosen for HCAD pages
+# "soup" builds a full BeautifulSoup tree, "lxml" is faster and gives the same results
+# "stream" is lxml fed while the record page downloads, pages already downloaded are parsed with lxml
+PARSERS = {'soup': parse_soup,
+           'lxml': parse_lxml,
+           'stream': parse_lxml}
+
+# The matching parsers for the Ownership History popup
+OWNERSHIP_PARSERS = {'soup': parse_ownership_soup,
+                     'lxml': parse_ownership_lxml,
+                     'stream': parse_ownership_lxml}
+
+# The parser used by get_data()
+PARSER = 'soup'
+
+
+class HcadAdapter(adapters.CountyAdapter):
+    """
+    HCAD lookups: the record page is found by posting the address or account number,
+    the Ownership History popup linked from it has the buyer and purchase date
+    """
 
-    # Getting the Purchase date
-    # To get date we have to click on Ownership History link that opens a popup
-    # Finding and building the final Ownership History link
-    ownership_url = "https://public.hcad.org" + soup.find('a', string="Ownership History")['href']
+    def search(self, query):
+        # The record request itself finds the property so there is no separate search,
+        # build_payload() turns the query (or its indexed account number) into the form fields
+        return query.strip() or None
 
-    # Going to the Ownership History link
-    s2 = r.post(ownership_url, headers=headers)
+    def is_property_id(self, query):
+        return is_account(query)
 
-    # Checking for errors
-    try:
-        s2.raise_for_status()
+    def fetch(self, property_id):
+        return fetch_pages(property_id)
 
-        # Parsing the date to BeautifulSoup
-        soup2 = BeautifulSoup(s2.text, 'lxml')
+    def fetch_changed(self, property_id, validators=None):
+        with metrics.span('hcad.record'):
+            s = client.post(RECORD_URL, headers={**HEADERS, **client.conditional_headers(validators)},
+                            data=build_payload(property_id))
 
-        # Finding the table with the purchase date
-        owner_table = soup2.find_all('table')[1]
-        # Getting the cell that contains the text "Effective Date"
-        effective_date = owner_table.find('td', text="Effective Date")
-        # Moving to the next siblings to get the buyer name and purchase date
-        buyer = effective_date.find_next('td').text
-        purchase_date = effective_date.find_next('td').find_next('td').text
+        # A sale also changes the owner on the record page, so an unchanged record
+        # means the Ownership History popup is unchanged too
+        if s.status_code == 304:
+            return None, validators
 
-    except requests.exceptions.HTTPError as e:
-        purchase_date = "Not found"
-        buyer = "Not found"
-        print(e)
+        s.raise_for_status()
 
-    # Creating a House instance with the above scraped data
-    results = House(address=address,
-                    sqft=sqft,
-                    value=value,
-                    year_built=year_built,
-                    porch=porch,
-                    patio=patio,
-                    deck=deck,
-                    garage=garage,
-                    purchase_date=purchase_date,
-                    buyer=buyer,
-                    bedrooms='',
-                    baths=baths,
-                    half_baths=None,
-                    fireplace=fireplace,
-                    stories=stories,
-                    elements=building_area)
+        ownership_url = find_ownership_url(s.text)
+        ownership_page = None
 
-    # Returning an instance of the House object with all the data
-    return results
+        if ownership_url:
+            with metrics.span('hcad.ownership'):
+                s2 = client.post(ownership_url, headers=HEADERS)
+            s2.raise_for_status()
+            ownership_page = s2.text
+
+        return (s.text, ownership_page), client.validators_of(s)
+
+    def change_hash(self, pages):
+        page, ownership_page = pages
+        sections = [parsing.table_after(page, heading) or page for heading in CHANGE_SECTIONS]
+        return parsing.content_hash(*sections, ownership_page)
+
+    def lookup(self, query, lazy=False):
+        return get_data(query, lazy)
+
+    def lookup_id(self, property_id):
+        return get_account(property_id)
+
+    async def lookup_async(self, scraper, query):
+        # Only imported for the async engine, the threaded lookups do not need it
+        import asyncio
+
+        page = await scraper.cached_request('hcad', 'record', query, 'POST', RECORD_URL,
+                                            headers=HEADERS, data=build_payload(query))
+
+        # The Ownership History link is found without parsing so it is requested straight away
+        # and downloads while the record page is parsed
+        ownership_url = find_ownership_url(page)
+
+        if ownership_url is None:
+            return await scraper.parse(PARSERS[PARSER], page, None)
+
+        ownership = asyncio.ensure_future(scraper.cached_request('hcad', 'ownership', ownership_url, 'POST',
+                                                                 ownership_url, headers=HEADERS))
+
+        try:
+            house = await scraper.parse(PARSERS[PARSER], page, None)
+        except Exception:
+            ownership.cancel()
+            raise
+
+        # An error is raised as in fetch_ownership() so a House without its buyer is not cached
+        ownership_page = await ownership
+
+        ownership_fields = await scraper.parse(OWNERSHIP_PARSERS[PARSER], ownership_page)
+        house.buyer = ownership_fields['buyer']
+        house.purchase_date = ownership_fields['purchase_date']
+
+        return house
+
+    async def lookup_id_async(self, scraper, property_id):
+        # An account number is sent as a strap search by build_payload()
+        return await self.lookup_async(scraper, property_id)
+
+
+ADAPTER = HcadAdapter(sys.modules[__name__])
 
 
 if __name__ == '__main__':
+    import pyperclip
+
     # Ask the user for the address to search
     query = input("Enter Property Address > ")
 
@@ -0,0 +1,279 @@
+from utilities import House
+import json
+import csv
+
+
+# Columns describing each lookup, written before the House fields
+# "query" is the address as given in the input file, the House address is the one found on the website
+RECORD_FIELDS = ['row', 'county', 'query', 'status', 'error', 'latency']
+
+# Type of every column, used by the columnar (Parquet/Arrow) writers
+COLUMN_TYPES = {'row': 'int', 'county': 'str', 'query': 'str', 'status': 'str', 'error': 'str', 'latency': 'float',
+                'address': 'str', 'sqft': 'int', 'value': 'int', 'year_built': 'int', 'porch': 'int',
+                'patio': 'int', 'deck': 'int', 'garage': 'int', 'purchase_date': 'str', 'buyer': 'str',
+                'bedrooms': 'int', 'baths': 'float', 'half_baths': 'int', 'fireplace': 'int', 'stories': 'int',
+                'elements': 'elements'}
+
+
+class Writer:
+    """
+    Base class of the writers: keeps results in memory and writes them in batches
+
+    Only one batch is held in memory at a time so large runs use constant memory.
+    Subclasses write a batch in write_batch().
+    """
+
+    # Set to True by writers that need the file opened in binary mode
+    BINARY = False
+
+    def __init__(self, output, batch_size=100, close_output=False):
+        """
+        :param output: An open file
+        :param batch_size: Number of results kept before they are written to the file
+        :param close_output: Close the file when the writer is closed
+        """
+
+        self.output = output
+        self.batch_size = batch_size
+        self.close_output = close_output
+        self.batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record):
+        """
+        :param record: Dict with the RECORD_FIELDS and an optional "house" holding a House object
+        """
+
+        self.batch.append(record)
+
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the results kept in memory to the file
+        """
+
+        if self.batch:
+            self.write_batch(self.batch)
+            self.batch = []
+
+        self.output.flush()
+
+    def close(self):
+        self.flush()
+
+        if self.close_output:
+            self.output.close()
+
+    def write_batch(self, records):
+        raise NotImplementedError
+
+
+class JsonlWriter(Writer):
+    """
+    Writes each lookup result as one JSON object per line
+
+    The House is written under the "house" key using House.to_dict()
+    """
+
+    def write_batch(self, records):
+        lines = []
+
+        for record in records:
+            data = dict(record)
+            house = data.get('house')
+            if isinstance(house, House):
+                data['house'] = house.to_dict()
+            lines.append(json.dumps(data) + '\n')
+
+        self.output.write(''.join(lines))
+
+
+class CsvWriter(Writer):
+    """
+    Writes each lookup result as one CSV row with the House fields as columns
+    """
+
+    def __init__(self, output, batch_size=100, close_output=False):
+        """
+        :param output: An open text file, opened with newline=''
+        """
+
+        super().__init__(output, batch_size, close_output)
+        self.writer = csv.writer(output)
+        self.writer.writerow(RECORD_FIELDS + list(House.CSV_FIELDS))
+
+    def write_batch(self, records):
+        rows = []
+
+        for record in records:
+            row = [record.get(field, '') for field in RECORD_FIELDS]
+
+            house = record.get('house')
+            if house is None:
+                row += [''] * len(House.CSV_FIELDS)
+            else:
+                row += house.to_csv_row()
+
+            rows.append(row)
+
+        self.writer.writerows(rows)
+
+
+def import_pyarrow():
+    """
+    pyarrow is only needed for the Parquet and Arrow formats so it is not in requirements.txt
+
+    :return: The pyarrow module
+    """
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('The Parquet and Arrow formats need pyarrow: pip install pyarrow')
+
+    return pyarrow
+
+
+class ColumnarWriter(Writer):
+    """
+    Base class of the Parquet and Arrow writers
+
+    Each batch is turned into columns with one column per field.
+    The raw House elements are kept as a list of {label, value} structs.
+    """
+
+    BINARY = True
+
+    def __init__(self, output, batch_size=1000, close_output=False):
+        super().__init__(output, batch_size, close_output)
+        self.pa = import_pyarrow()
+        self.schema = self.build_schema()
+        self.file_writer = None
+
+    def build_schema(self):
+        pa = self.pa
+        types = {'int': pa.int64(),
+                 'float': pa.float64(),
+                 'str': pa.string(),
+                 'elements': pa.list_(pa.struct([('label', pa.string()), ('value', pa.string())]))}
+
+        return pa.schema([(name, types[kind]) for name, kind in COLUMN_TYPES.items()])
+
+    def to_table(self, records):
+        columns = {name: [] for name in COLUMN_TYPES}
+
+        for record in records:
+            for field in RECORD_FIELDS:
+                columns[field].append(record.get(field))
+
+            house = record.get('house')
+            for field in House.CSV_FIELDS:
+                columns[field].append(getattr(house, field) if house else None)
+
+            # Replacing the last value added, the elements tuple, with a list of structs
+            if house:
+                columns['elements'][-1] = [{'label': label, 'value': value} for label, value in house.elements]
+
+        return self.pa.table(columns, schema=self.schema)
+
+    def write_batch(self, records):
+        if self.file_writer is None:
+            self.file_writer = self.open_file_writer()
+
+        self.file_writer.write_table(self.to_table(records))
+
+    def close(self):
+        # The file writer adds the file footer so it is closed before the file
+        self.flush()
+
+        if self.file_writer is None:
+            self.file_writer = self.open_file_writer()
+        self.file_writer.close()
+
+        if self.close_output:
+            self.output.close()
+
+    def open_file_writer(self):
+        raise NotImplementedError
+
+
+class ParquetWriter(ColumnarWriter):
+    """
+    Writes the results to a Parquet file, each batch becomes one row group
+    """
+
+    def open_file_writer(self):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(self.output, self.schema)
+
+
+class ArrowWriter(ColumnarWriter):
+    """
+    Writes the results to an Arrow IPC (Feather v2) file
+    """
+
+    def open_file_writer(self):
+        return self.pa.ipc.new_file(self.output, self.schema)
+
+
+# The writers that can be chosen by name
+WRITERS = {'jsonl': JsonlWriter,
+           'csv': CsvWriter,
+           'parquet': ParquetWriter,
+           'arrow': ArrowWriter}
+
+# Other file extensions of the formats above
+EXTENSIONS = {'json': 'jsonl',
+              'feather': 'arrow'}
+
+
+def guess_format(path):
+    """
+    Picks the output format from the file extension
+
+    :param path: Output file path i.e. "results.csv"
+    :return: A key of WRITERS, "jsonl" if the extension is not known
+    """
+
+    extension = path.rsplit('.', 1)[-1].lower()
+    extension = EXTENSIONS.get(extension, extension)
+    return extension if extension in WRITERS else 'jsonl'
+
+
+def open_writer(path, output_format=None, batch_size=None):
+    """
+    Opens an output file and the writer for its format
+
+    Usage:
+        with open_writer('results.parquet') as writer:
+            writer.write(record)
+
+    :param path: Output file path
+    :param output_format: A key of WRITERS, by default picked from the file extension
+    :param batch_size: Number of results kept before they are written, uses the writer's default if not given
+    :return: A writer that closes the file when it is closed
+    """
+
+    writer_class = WRITERS[output_format or guess_format(path)]
+
+    if writer_class.BINARY:
+        output = open(path, 'wb')
+    else:
+        output = open(path, 'w', newline='', encoding='utf-8')
+
+    options = {'close_output': True}
+    if batch_size:
+        options['batch_size'] = batch_size
+
+    try:
+        return writer_class(output, **options)
+    except Exception:
+        output.close()
+        raise
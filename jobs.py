@@ -0,0 +1,319 @@
+from batch import BatchStats, read_rows, run_one
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from exporters import WRITERS, open_writer
+from utilities import House
+from adapters import REGISTRY
+import scheduler
+import threading
+import argparse
+import sqlite3
+import socket
+import json
+import time
+import os
+
+
+# Default settings of run()
+SETTINGS = {'max_attempts': 3,  # Times a row that failed with an error is tried
+            'backoff': 10,  # Seconds before the first retry, doubled after each attempt
+            'lease': 300}  # Seconds after which a row claimed by a worker that stopped can be claimed again
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, county TEXT, query TEXT, status TEXT DEFAULT 'pending',
+                                 attempts INTEGER DEFAULT 0, error TEXT, house TEXT, latency REAL,
+                                 worker TEXT, claimed REAL, retry_at REAL DEFAULT 0, finished REAL);
+CREATE INDEX IF NOT EXISTS rows_status ON rows (status, retry_at);
+"""
+
+# Statuses of rows that are done and are not claimed again
+FINISHED = ('found', 'not found')
+
+
+class Journal:
+    """
+    A batch job kept in a SQLite file with the status, result and error of every row
+
+    A job that stops for any reason is resumed by running it again, rows already done are skipped.
+    Several worker processes, on one machine or sharing the file, can run the same job at once,
+    each claims a few rows at a time.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Journal file, created if it does not exist
+        """
+
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_rows(self, rows):
+        """
+        Adds the rows of an input file, rows already in the journal are kept as they are
+        so adding the same file again resumes the job
+
+        :param rows: Iterable of (row number, county, address) tuples
+        :return: Number of new rows
+        """
+
+        before = self.count()
+
+        self.connection.execute('BEGIN')
+        try:
+            self.connection.executemany('INSERT OR IGNORE INTO rows (row, county, query) VALUES (?, ?, ?)', rows)
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+        return self.count() - before
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM rows').fetchone()[0]
+
+    def claim(self, worker, limit, max_attempts=None, lease=None):
+        """
+        Marks rows as being looked up by a worker
+
+        Claims pending rows, failed rows whose retry time has come and
+        rows claimed by a worker that stopped more than the lease ago.
+
+        :param worker: Name of the worker i.e. "hostname:pid"
+        :param limit: Most rows claimed
+        :return: List of (row number, county, address) tuples
+        """
+
+        max_attempts = max_attempts or SETTINGS['max_attempts']
+        lease = lease or SETTINGS['lease']
+        now = time.time()
+
+        # BEGIN IMMEDIATE takes the write lock first so two workers can not claim the same rows
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.connection.execute("SELECT row, county, query FROM rows "
+                                           "WHERE status = 'pending' "
+                                           "OR (status = 'error' AND attempts < ? AND retry_at <= ?) "
+                                           "OR (status = 'running' AND claimed < ?) "
+                                           "ORDER BY row LIMIT ?",
+                                           (max_attempts, now, now - lease, limit)).fetchall()
+
+            self.connection.executemany("UPDATE rows SET status = 'running', worker = ?, claimed = ? WHERE row = ?",
+                                        [(worker, now, row[0]) for row in rows])
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+        return rows
+
+    def complete(self, records, backoff=None):
+        """
+        Saves the outcome of looked up rows
+
+        :param records: Dicts returned by batch.run_one()
+        :param backoff: Seconds before the first retry of a failed row, doubled after each attempt,
+                        rows whose error is not retryable are not tried again
+        """
+
+        backoff = backoff or SETTINGS['backoff']
+        now = time.time()
+        rows = []
+
+        for record in records:
+            attempts = self.connection.execute('SELECT attempts FROM rows WHERE row = ?',
+                                               (record['row'],)).fetchone()[0] + 1
+            house = record.get('house')
+
+            # Errors that would fail again (no county, a page that could not be parsed) are not retried,
+            # a row without a retry time is never claimed again
+            retry_at = now + backoff * 2 ** (attempts - 1) if record.get('retryable', True) else None
+
+            rows.append((record['status'], attempts, record.get('error'), house.to_json() if house else None,
+                         record.get('latency'), retry_at, now, record['row']))
+
+        self.connection.execute('BEGIN')
+        try:
+            self.connection.executemany('UPDATE rows SET status = ?, attempts = ?, error = ?, house = ?, '
+                                        'latency = ?, retry_at = ?, finished = ? WHERE row = ?', rows)
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    def next_retry(self, max_attempts=None, lease=None):
+        """
+        :return: Seconds until a failed or stuck row can be claimed again, None if every row is finished
+        """
+
+        max_attempts = max_attempts or SETTINGS['max_attempts']
+        lease = lease or SETTINGS['lease']
+
+        retry_at = self.connection.execute("SELECT MIN(CASE WHEN status = 'running' THEN claimed + ? "
+                                           "ELSE retry_at END) FROM rows "
+                                           "WHERE status IN ('pending', 'running') "
+                                           "OR (status = 'error' AND attempts < ?)",
+                                           (lease, max_attempts)).fetchone()[0]
+
+        if retry_at is None:
+            return None
+
+        return max(0.0, retry_at - time.time())
+
+    def retry_failed(self):
+        """
+        Gives the rows that used up their attempts a new set of attempts
+
+        :return: Number of rows reset
+        """
+
+        return self.connection.execute("UPDATE rows SET status = 'pending', attempts = 0, retry_at = 0 "
+                                       "WHERE status = 'error'").rowcount
+
+    def status(self):
+        """
+        :return: Dict of status to number of rows
+        """
+
+        return dict(self.connection.execute('SELECT status, COUNT(*) FROM rows GROUP BY status').fetchall())
+
+    def records(self):
+        """
+        Reads the finished and failed rows in row order, in the format of batch.run_one()
+
+        :return: Generator of record dicts
+        """
+
+        cursor = self.connection.execute("SELECT row, county, query, status, error, latency, house FROM rows "
+                                         "WHERE status NOT IN ('pending', 'running') ORDER BY row")
+
+        for row, county, query, status, error, latency, house in cursor:
+            record = {'row': row, 'county': county, 'query': query, 'status': status, 'error': error,
+                      'latency': latency}
+            if house:
+                record['house'] = House.from_dict(json.loads(house))
+            yield record
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def run(journal, workers=8, per_host=4, max_attempts=None, backoff=None, lease=None, worker=None):
+    """
+    Looks up the rows of a journal until every row is finished or out of attempts
+
+    Failed rows are retried after their backoff, the worker waits for them if nothing else is left.
+
+    :param journal: A Journal
+    :param workers: Number of lookups running at the same time in this process
+    :param per_host: Most lookups at once against a single county website
+    :param max_attempts: Times a row that failed with an error is tried
+    :param backoff: Seconds before the first retry, doubled after each attempt
+    :param lease: Seconds after which rows claimed by a stopped worker are claimed again
+    :param worker: Name of this worker, defaults to "hostname:pid"
+    :return: A BatchStats instance for the rows looked up by this worker
+    """
+
+    worker = worker or worker_name()
+    stats = BatchStats()
+
+    # One semaphore per county so a slow website cannot take all the workers
+    limits = {county: threading.BoundedSemaphore(per_host) for county in REGISTRY}
+
+    # The lookups run on the scheduler's threads, the pool threads wait for them
+    scheduler.fit(workers, per_host)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        while True:
+            # Keeping a few rows queued per thread, claiming in small groups so other workers get rows too
+            if len(pending) < workers * 2:
+                for number, county, address in journal.claim(worker, workers * 2 - len(pending), max_attempts, lease):
+                    pending.add(pool.submit(run_one, number, county, address, limits, stats))
+
+            if not pending:
+                wait_for = journal.next_retry(max_attempts, lease)
+                if wait_for is None:
+                    break
+
+                # Waiting for a failed row to be due or for another worker to finish its rows
+                time.sleep(min(wait_for, 5) or 0.1)
+                continue
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            journal.complete([future.result() for future in done], backoff)
+
+    return stats
+
+
+def export(journal, path, output_format=None, batch_size=None):
+    """
+    Writes the results of a journal to a file with a writer from exporters.py
+
+    :return: Number of rows written
+    """
+
+    count = 0
+
+    with open_writer(path, output_format, batch_size) as writer:
+        for record in journal.records():
+            writer.write(record)
+            count += 1
+
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resumable batch lookups kept in a journal file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = commands.add_parser('add', help='Add the rows of an input file to a journal')
+    add_parser.add_argument('journal')
+    add_parser.add_argument('input', help='CSV file with an address column, or a file with one address per line')
+    add_parser.add_argument('--county', help='County used for rows without a county column')
+
+    run_parser = commands.add_parser('run', help='Look up the rows of a journal, run several at once to scale out')
+    run_parser.add_argument('journal')
+    run_parser.add_argument('--workers', type=int, default=8, help='Number of lookups running at the same time')
+    run_parser.add_argument('--per-host', type=int, default=4, help='Most lookups at once against one website')
+    run_parser.add_argument('--max-attempts', type=int, default=SETTINGS['max_attempts'],
+                            help='Times a row that failed with an error is tried')
+    run_parser.add_argument('--retry-failed', action='store_true',
+                            help='Give the rows that used up their attempts another try')
+
+    status_parser = commands.add_parser('status', help='Show the number of rows in each status')
+    status_parser.add_argument('journal')
+
+    export_parser = commands.add_parser('export', help='Write the results to a file')
+    export_parser.add_argument('journal')
+    export_parser.add_argument('output', help='File the results are written to, as JSON lines, CSV, Parquet or Arrow')
+    export_parser.add_argument('--format', choices=sorted(WRITERS), help='Output format, guessed from the extension')
+
+    args = parser.parse_args()
+
+    with Journal(args.journal) as job:
+        if args.command == 'add':
+            print(f'Added {job.add_rows(read_rows(args.input, args.county))} rows')
+
+        elif args.command == 'run':
+            if args.retry_failed:
+                job.retry_failed()
+            print(run(job, args.workers, args.per_host, args.max_attempts).report())
+            print(job.status())
+
+        elif args.command == 'status':
+            print(job.status())
+
+        else:
+            print(f'Wrote {export(job, args.output, args.format)} rows')
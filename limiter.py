@@ -0,0 +1,199 @@
+import threading
+import time
+
+
+# Seconds to wait before checking again when all the concurrency slots are taken
+# A finished request wakes up waiting threads straight away, this is only a safety net
+SLOT_WAIT = 0.05
+
+# Priority classes of the requests, a lower number goes first when several are waiting
+# Requests sent outside of a priority class (client.priority()) count as interactive
+PRIORITIES = {'interactive': 0,
+              'refresh': 1,
+              'bulk': 2}
+
+# After slowing down, further throttled responses within this many seconds are
+# from requests sent before the slow down so they do not slow down again
+DECREASE_INTERVAL = 1.0
+
+
+class HostLimiter:
+    """
+    Limits the requests sent to one website with a token bucket and an adaptive concurrency limit
+
+    While the website responds normally the request rate and the number of requests in flight
+    grow slowly (additive increase). When it throttles (429/503) or times out both are halved
+    (multiplicative decrease) so the lookups settle at the most the website tolerates.
+
+    Usage:
+        limiter.acquire()
+        try:
+            response = send_request()
+        finally:
+            limiter.release(throttled=response.status_code == 429)
+    """
+
+    def __init__(self, host, rate=10.0, concurrency=4, min_rate=0.5, max_rate=50.0, max_concurrency=10,
+                 increase=1.0, decrease=0.5, adaptive=True):
+        """
+        :param host: Name of the website, only used in stats()
+        :param rate: Requests per second to start with
+        :param concurrency: Requests in flight at once to start with
+        :param min_rate: Lowest rate after slowing down
+        :param max_rate: Highest rate after speeding up
+        :param max_concurrency: Most requests in flight at once
+        :param increase: Requests per second (and in flight) added for each second (and window) of successes
+        :param decrease: Rate and concurrency are multiplied by this when the website throttles
+        :param adaptive: Set to False to keep the starting rate and concurrency
+        """
+
+        self.host = host
+        self.rate = float(rate)
+        self.concurrency = float(concurrency)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.adaptive = adaptive
+
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+
+        self.in_flight = 0
+        self.waiting = 0
+        # Number of requests waiting in each priority class
+        self.waiting_by_priority = [0] * len(PRIORITIES)
+        self.successes = 0
+        self.throttled = 0
+
+        self.condition = threading.Condition()
+
+    def try_acquire(self, priority=0):
+        """
+        Takes a token and a concurrency slot if both are available
+
+        :param priority: A value of PRIORITIES, waiting requests of a lower number take the token first
+        :return: 0 if the request can be sent, otherwise the seconds to wait before trying again
+        """
+
+        with self.condition:
+            return self._try_acquire(priority)
+
+    def _try_acquire(self, priority=0):
+        now = time.monotonic()
+
+        # Adding the tokens earned since the last call, at most one second worth
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        if self.in_flight >= max(1, int(self.concurrency)):
+            return SLOT_WAIT
+
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+
+        # Leaving the token to a more urgent request that is waiting for one
+        if any(self.waiting_by_priority[:priority]):
+            return SLOT_WAIT
+
+        self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def acquire(self, priority=0):
+        """
+        Waits until a request can be sent
+
+        :param priority: A value of PRIORITIES
+        """
+
+        with self.condition:
+            self.waiting += 1
+            self.waiting_by_priority[priority] += 1
+            try:
+                while True:
+                    delay = self._try_acquire(priority)
+                    if not delay:
+                        return
+                    self.condition.wait(delay)
+            finally:
+                self.waiting -= 1
+                self.waiting_by_priority[priority] -= 1
+
+    async def acquire_async(self, priority=0):
+        """
+        Waits until a request can be sent without blocking the event loop
+
+        :param priority: A value of PRIORITIES
+        """
+
+        # Only the async engine needs asyncio, it is slow to import for the other commands
+        import asyncio
+
+        with self.condition:
+            self.waiting += 1
+            self.waiting_by_priority[priority] += 1
+        try:
+            while True:
+                delay = self.try_acquire(priority)
+                if not delay:
+                    return
+                await asyncio.sleep(delay)
+        finally:
+            with self.condition:
+                self.waiting -= 1
+                self.waiting_by_priority[priority] -= 1
+
+    def release(self, throttled=False, retry_after=None):
+        """
+        Gives back the concurrency slot and adjusts the rate with the outcome of the request
+
+        :param throttled: The website answered 429/503 or timed out
+        :param retry_after: Seconds the website asked to wait (Retry-After header), pauses all requests
+        """
+
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+
+            if throttled:
+                self.throttled += 1
+
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+
+                if self.adaptive and now - self.decreased_at > DECREASE_INTERVAL:
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self.concurrency = max(1.0, self.concurrency * self.decrease)
+                    self.tokens = min(self.tokens, 1.0)
+                    self.decreased_at = now
+
+            else:
+                self.successes += 1
+
+                if self.adaptive:
+                    self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+                    self.concurrency = min(self.max_concurrency, self.concurrency + self.increase / self.concurrency)
+
+            self.condition.notify_all()
+
+    def stats(self):
+        """
+        :return: Dict of the current rate, concurrency, requests in flight and requests waiting (queue depth)
+        """
+
+        with self.condition:
+            return {'host': self.host,
+                    'rate': round(self.rate, 2),
+                    'concurrency': int(self.concurrency),
+                    'in_flight': self.in_flight,
+                    'waiting': self.waiting,
+                    'waiting_by_priority': dict(zip(PRIORITIES, self.waiting_by_priority)),
+                    'successes': self.successes,
+                    'throttled': self.throttled}
@@ -0,0 +1,75 @@
+from adapters import CHOSEN_PARSERS, get_adapter, loaded_adapter, resolve_county, counties
+import metrics
+import bulk
+
+
+# The counties and how each one is looked up are registered in adapters.py,
+# resolve_county() is kept here for the modules importing it from lookup
+
+
+def set_parser(parser, county=None):
+    """
+    Chooses how the county pages are parsed
+
+    Counties whose module was not imported yet get the parser when it is,
+    so choosing a parser at startup does not import every county.
+
+    :param parser: "soup" (BeautifulSoup) or "lxml" (faster, same results)
+    :param county: Only change this county, by default all counties are changed
+    """
+
+    keys = [resolve_county(county)] if county else counties()
+
+    for key in keys:
+        CHOSEN_PARSERS[key] = parser
+
+        # A single county is imported to check it has the parser
+        adapter = get_adapter(key) if county else loaded_adapter(key)
+        if adapter is None:
+            continue
+
+        if parser in adapter.module.PARSERS:
+            adapter.module.PARSER = parser
+        elif county:
+            raise ValueError(f'Unknown parser for {key}: {parser}')
+
+
+def lookup(county, query, lazy=False):
+    """
+    Runs a property search on the website of the given county
+
+    :param county: County name, alias or menu number
+    :param query: Property address (or account number for HCAD)
+    :param lazy: Load the buyer and purchase date when first used, skipping the
+                 HCAD Ownership History request when they are not needed
+    :return: An instance of the House object or None if not found
+    """
+
+    county = resolve_county(county)
+
+    with metrics.span(f'lookup.{county}'):
+        # Answering from the loaded export files when the property is in them
+        house = bulk.find_house(county, query)
+        if house:
+            return house
+
+        return get_adapter(county).lookup(query.strip(), lazy=lazy)
+
+
+def lookup_id(county, property_id):
+    """
+    Looks up a property by its ID, only the property page is requested
+
+    :param county: County name, alias or menu number
+    :param property_id: FBCAD property ID or HCAD account number, as a string
+    :return: An instance of the House object
+    """
+
+    county = resolve_county(county)
+    property_id = str(property_id).strip()
+
+    house = bulk.find_house(county, property_id)
+    if house:
+        return house
+
+    return get_adapter(county).lookup_id(property_id)
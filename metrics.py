@@ -0,0 +1,209 @@
+import contextlib
+import functools
+import threading
+import bisect
+import json
+import time
+
+
+# Default settings, these can be changed with configure()
+SETTINGS = {'enabled': True}  # Set to False to skip timing, spans then cost a single dict lookup
+
+# Upper bounds in seconds of the histogram buckets exported to Prometheus
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Timer:
+    """
+    Keeps the count, total, min, max and histogram of the durations of one span
+    """
+
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        # One counter per bucket plus one for durations above the last bucket
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def to_dict(self):
+        return {'count': self.count,
+                'total': round(self.total, 6),
+                'mean': round(self.total / self.count, 6) if self.count else 0,
+                'min': round(self.min or 0, 6),
+                'max': round(self.max or 0, 6)}
+
+
+_timers = {}
+_lock = threading.Lock()
+
+
+def configure(**settings):
+    """
+    Changes the metrics settings
+
+    :param settings: Any of enabled
+    """
+
+    for name in settings:
+        if name not in SETTINGS:
+            raise ValueError(f'Unknown setting: {name}')
+
+    SETTINGS.update(settings)
+
+
+def record(name, seconds):
+    """
+    Adds a duration to a span
+
+    :param name: Span name i.e. "fbcad.search"
+    :param seconds: Duration in seconds
+    """
+
+    if not SETTINGS['enabled']:
+        return
+
+    with _lock:
+        timer = _timers.get(name)
+        if timer is None:
+            timer = _timers[name] = Timer()
+        timer.add(seconds)
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Times the code inside the with block, the time is recorded even if it raises
+
+    Usage:
+        with metrics.span('hcad.parse'):
+            house = parse_record(page, ownership_page)
+
+    :param name: Span name, the county and stage separated by dots i.e. "fbcad.view"
+    """
+
+    if not SETTINGS['enabled']:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as a span
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def snapshot():
+    """
+    :return: Dict of span name to its count, total, mean, min and max in seconds
+    """
+
+    with _lock:
+        return {name: timer.to_dict() for name, timer in sorted(_timers.items())}
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+
+
+def report():
+    """
+    :return: A table of the spans sorted by total time, for printing
+    """
+
+    lines = [f"{'Span':<28}{'Count':>8}{'Total':>10}{'Mean':>10}{'Max':>10}"]
+
+    for name, timer in sorted(snapshot().items(), key=lambda item: -item[1]['total']):
+        lines.append(f"{name:<28}{timer['count']:>8}{timer['total']:>9.3f}s"
+                     f"{timer['mean'] * 1000:>8.1f}ms{timer['max'] * 1000:>8.1f}ms")
+
+    return '\n'.join(lines)
+
+
+def write_json(path):
+    """
+    Saves the snapshot() to a JSON file
+    """
+
+    with open(path, 'w') as file:
+        json.dump({'time': time.time(), 'spans': snapshot()}, file, indent=2)
+
+
+def prometheus_text():
+    """
+    :return: The spans in the Prometheus text format, as one histogram with a span label
+    """
+
+    lines = ['# HELP cad_span_seconds Time spent in each lookup stage',
+             '# TYPE cad_span_seconds histogram']
+
+    with _lock:
+        timers = sorted(_timers.items())
+
+        for name, timer in timers:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, timer.buckets):
+                cumulative += count
+                lines.append(f'cad_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'cad_span_seconds_bucket{{span="{name}",le="+Inf"}} {timer.count}')
+            lines.append(f'cad_span_seconds_sum{{span="{name}"}} {timer.total}')
+            lines.append(f'cad_span_seconds_count{{span="{name}"}} {timer.count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def serve(port=9100, host='127.0.0.1'):
+    """
+    Serves the spans at http://host:port/metrics in a background thread for Prometheus to scrape
+
+    :return: The server, call shutdown() on it to stop
+    """
+
+    # Imported here since every lookup imports this module and only --metrics-port needs a server
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            # Scrapes are not printed to the console
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics').start()
+    return server
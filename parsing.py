@@ -0,0 +1,177 @@
+from lxml import etree
+import lxml.html
+import hashlib
+import codecs
+
+
+# Helpers for the lxml parser used by the county modules
+# They return the same text BeautifulSoup would so both parsers build identical House objects
+
+# Bytes read from the connection at a time by parse_response()
+STREAM_CHUNK = 16 * 1024
+
+# Every cell, row and div below an element, in page order
+CELLS = etree.XPath('.//td')
+ROWS = etree.XPath('.//tr')
+DIVS = etree.XPath('.//div')
+
+
+def parse_html(page):
+    """
+    Parses a page into an lxml tree
+
+    :param page: The page HTML as a string
+    :return: The root element of the page
+    """
+
+    return lxml.html.fromstring(page)
+
+
+def parse_response(response, keep_text=False):
+    """
+    Builds the lxml tree of a page while it downloads, each chunk is parsed as it arrives
+
+    The whole page is never held as bytes next to the tree. keep_text (i.e. to save the page
+    in the cache) decodes each chunk as it arrives, so only the text is kept with the tree,
+    the pieces are joined once at the end.
+
+    :param response: A requests Response sent with stream=True
+    :param keep_text: Also return the page text, decoded the same way as response.text
+    :return: Tuple of the root element of the page and the page text (None without keep_text)
+    """
+
+    try:
+        # Check for errors so an error page is not parsed
+        response.raise_for_status()
+
+        # The encoding of the Content-Type header, the same one response.text uses,
+        # otherwise lxml reads it from the page
+        parser = lxml.html.HTMLParser(encoding=response.encoding)
+
+        # An incremental decoder since a character can be split between two chunks
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace') if keep_text else None
+        pieces = []
+
+        for chunk in response.iter_content(STREAM_CHUNK):
+            parser.feed(chunk)
+            if decoder is not None:
+                pieces.append(decoder.decode(chunk))
+    finally:
+        response.close()
+
+    root = parser.close()
+
+    if decoder is None:
+        return root, None
+
+    pieces.append(decoder.decode(b'', final=True))
+    return root, ''.join(pieces)
+
+
+def text_of(node):
+    """
+    Gets all the text inside an element, the same as BeautifulSoup's ".text"
+
+    :param node: An lxml element or a text node returned by an XPath
+    :return: String
+    """
+
+    if isinstance(node, str):
+        return str(node)
+
+    return node.text_content()
+
+
+def string_of(element):
+    """
+    Gets the text of an element only if it holds a single piece of text,
+    the same as BeautifulSoup's ".string"
+
+    :param element: An lxml element
+    :return: String or None if the element holds several tags/texts
+    """
+
+    children = list(element)
+
+    if not children:
+        return element.text
+
+    # BeautifulSoup looks inside an element that only wraps one other element
+    if len(children) == 1 and not element.text and not children[0].tail:
+        return string_of(children[0])
+
+    return None
+
+
+def contents_of(element):
+    """
+    Gets the texts and tags directly inside an element, the same as BeautifulSoup's ".contents"
+
+    :param element: An lxml element
+    :return: List of strings and lxml elements
+    """
+
+    contents = [element.text] if element.text else []
+
+    for child in element:
+        contents.append(child)
+        if child.tail:
+            contents.append(child.tail)
+
+    return contents
+
+
+def first(xpath, element, **variables):
+    """
+    Runs a precompiled XPath and returns the first match
+
+    :return: The first match or None
+    """
+
+    matches = xpath(element, **variables)
+    return matches[0] if matches else None
+
+
+def table_after(page, heading):
+    """
+    Cuts the HTML of the table holding or following a heading out of a page without parsing it
+
+    :param page: The page HTML as a string
+    :param heading: Text of the heading i.e. "Property Deed History"
+    :return: The HTML of the table or None if the heading is not on the page
+    """
+
+    position = page.find(heading)
+
+    if position < 0:
+        return None
+
+    # The heading is in a cell of the table when that table is not closed before it
+    start = page.rfind('<table', 0, position)
+    if start < 0 or page.find('</table>', start, position) >= 0:
+        start = page.find('<table', position)
+
+    if start < 0:
+        return None
+
+    end = page.find('</table>', start)
+    return page[start:] if end < 0 else page[start:end + len('</table>')]
+
+
+def content_hash(*texts):
+    """
+    Hashes pieces of pages so a later download can be compared without parsing it
+    Differences in whitespace are ignored
+
+    :param texts: Strings, None is hashed as an empty piece
+    :return: Hex digest
+    """
+
+    digest = hashlib.sha1()
+
+    for text in texts:
+        digest.update(' '.join((text or '').split()).encode())
+        # Separating the pieces so moving text from one to the next changes the hash
+        digest.update(b'\0')
+
+    return digest.hexdigest()
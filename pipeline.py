@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from batch import BatchStats
+from adapters import REGISTRY, get_adapter, resolve_county
+import address_index
+import scheduler
+import bulk
+import threading
+import cache
+import time
+import os
+
+
+def fetch(record, limits):
+    """
+    Fetch stage: downloads the pages for one address while holding the slot for its county
+
+    :param record: Dict with the row number, county and query (the address)
+    :param limits: Dict of county to semaphore limiting requests per website
+    :return: The record and the arguments of the county parse function,
+             or None when the record is already finished (cached, not found or error)
+    """
+
+    try:
+        if not record['county']:
+            raise ValueError('No county given and the zip code is missing or in several counties')
+
+        county = resolve_county(record['county'])
+        record['county'] = county
+
+        # Returning the saved result if this address was looked up before or is in the export files
+        house = bulk.find_house(county, record['query']) or cache.get_house(county, 'address', record['query'])
+        if house:
+            record['status'] = 'found'
+            record['house'] = house
+            return record, None
+
+        # Queued as bulk on the shared scheduler so interactive lookups in this process go first
+        with limits[county]:
+            args = scheduler.run('bulk', county, download, record['query'])
+
+        if args is None:
+            record['status'] = 'not found'
+
+        return record, args
+
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+        return record, None
+
+
+def download(county, query):
+    """
+    Searches for an address and downloads the pages of the property
+
+    :return: The arguments of the county parse function or None if not found
+    """
+
+    adapter = get_adapter(county)
+    property_id = adapter.search(query)
+
+    if property_id is None:
+        return None
+
+    return adapter.fetch(property_id)
+
+
+def parse_chunk(chunk):
+    """
+    Parse stage: runs in a worker process and parses a chunk of fetched pages
+
+    Sending many pages at once to a process costs much less than sending them one by one.
+
+    :param chunk: List of (record, parse function, args)
+    :return: List of records with the House object or the error added
+    """
+
+    records = []
+
+    for record, function, args in chunk:
+        try:
+            record['house'] = function(*args)
+            record['status'] = 'found'
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = str(e)
+        records.append(record)
+
+    return records
+
+
+def run_pipeline(rows, writer, workers=8, per_host=4, parse_workers=None, chunk_size=20):
+    """
+    Looks up many addresses with threads downloading the pages and processes parsing them
+
+    Parsing is CPU bound so running it in separate processes lets a batch use all cores.
+
+    :param rows: Iterable of (row number, county, address) tuples
+    :param writer: A writer from exporters.py, results are passed to it as soon as they complete
+    :param workers: Number of threads downloading pages
+    :param per_host: Most downloads at once against a single county website
+    :param parse_workers: Number of parsing processes, defaults to the number of cores
+    :param chunk_size: Number of pages sent to a parsing process at once
+    :return: A BatchStats instance for the run
+    """
+
+    stats = BatchStats()
+
+    # One semaphore per county so a slow website cannot take all the workers
+    limits = {county: threading.BoundedSemaphore(per_host) for county in REGISTRY}
+
+    # Passing the parse function itself since the worker processes do not see PARSER changes
+    parsers = {county: get_adapter(county).parser() for county in REGISTRY}
+
+    # The downloads run on the scheduler's threads, the fetch threads wait for them
+    scheduler.fit(workers, per_host)
+
+    # Most chunks waiting for or being parsed at once
+    max_chunks = (parse_workers or os.cpu_count() or 1) * 2
+
+    with ThreadPoolExecutor(max_workers=workers) as fetchers, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+
+        fetching = set()
+        parsing = set()
+        chunk = []
+
+        def finish(record):
+            record['latency'] = round(time.monotonic() - record.pop('started'), 3)
+            stats.record(record['county'], record['status'], record['latency'])
+
+            house = record.get('house')
+            if house:
+                cache.put_house(record['county'], 'address', record['query'], house)
+                address_index.remember(record['county'], record['query'], house)
+
+            writer.write(record)
+
+        def collect_fetched(done):
+            for future in done:
+                record, args = future.result()
+                if args is None:
+                    finish(record)
+                else:
+                    chunk.append((record, parsers[record['county']], args))
+
+        def send_chunks(everything=False):
+            # Sending full chunks, or everything left once all pages are downloaded
+            while len(chunk) >= chunk_size or (everything and chunk):
+                parsing.add(parse_pool.submit(parse_chunk, chunk[:chunk_size]))
+                del chunk[:chunk_size]
+
+        def collect_parsed(done):
+            for future in done:
+                for record in future.result():
+                    finish(record)
+
+        for number, county, address in rows:
+            record = {'row': number, 'county': county, 'query': address, 'started': time.monotonic()}
+            fetching.add(fetchers.submit(fetch, record, limits))
+
+            # Only keep a limited number of lookups queued so large files are not loaded at once
+            if len(fetching) >= workers * 2:
+                done, fetching = wait(fetching, return_when=FIRST_COMPLETED)
+                collect_fetched(done)
+
+            send_chunks()
+
+            # Waiting for the parsers when they fall behind so parsed pages do not pile up in memory
+            if len(parsing) >= max_chunks:
+                done, parsing = wait(parsing, return_when=FIRST_COMPLETED)
+            else:
+                done = {future for future in parsing if future.done()}
+                parsing -= done
+            collect_parsed(done)
+
+        # Waiting for the remaining downloads, then parsing what is left
+        done, fetching = wait(fetching)
+        collect_fetched(done)
+
+        send_chunks(everything=True)
+
+        done, parsing = wait(parsing)
+        collect_parsed(done)
+
+    return stats
@@ -0,0 +1,254 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from adapters import REGISTRY, get_adapter, resolve_county
+from address_index import property_id_of
+from batch import read_rows
+from lookup import lookup
+from utilities import House
+import threading
+import argparse
+import scheduler
+import sqlite3
+import cache
+import json
+import time
+import sys
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS properties (county TEXT, property_id TEXT, query TEXT, house TEXT, hash TEXT,
+                                       etag TEXT, last_modified TEXT, checked REAL, changed REAL,
+                                       PRIMARY KEY (county, property_id));
+"""
+
+
+class Portfolio:
+    """
+    Properties that are checked again from time to time for new values and sales, kept in a SQLite file
+
+    Each property keeps its last House, the hash of its value and deed tables and the
+    ETag / Last-Modified of its page so a refresh only parses the pages that changed.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Portfolio file, created if it does not exist
+        """
+
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, county, query, house):
+        """
+        Adds a looked up property, a property already in the portfolio keeps its saved state
+
+        :param county: County key
+        :param query: Address or ID the property was added with
+        :param house: The House found for it, the starting point of the first refresh
+        :return: True if the property was added
+        """
+
+        property_id = property_id_of(county, house)
+
+        if property_id is None:
+            raise ValueError(f'No property ID in the result for: {query}')
+
+        return self.connection.execute('INSERT OR IGNORE INTO properties (county, property_id, query, house, checked) '
+                                       'VALUES (?, ?, ?, ?, ?)',
+                                       (county, property_id, query, house.to_json(), time.time())).rowcount > 0
+
+    def properties(self):
+        """
+        :return: List of dicts with the saved state of every property
+        """
+
+        cursor = self.connection.execute('SELECT county, property_id, house, hash, etag, last_modified '
+                                         'FROM properties ORDER BY county, property_id')
+
+        return [{'county': county, 'property_id': property_id, 'house': house, 'hash': page_hash,
+                 'validators': {'etag': etag, 'last_modified': last_modified}}
+                for county, property_id, house, page_hash, etag, last_modified in cursor]
+
+    def save(self, result):
+        """
+        Saves the outcome of check() for the next refresh
+        """
+
+        now = time.time()
+
+        if result['status'] == 'error':
+            return
+
+        if result['status'] == 'changed':
+            self.connection.execute('UPDATE properties SET house = ?, changed = ? WHERE county = ? AND property_id = ?',
+                                    (result['house'].to_json(), now, result['county'], result['property_id']))
+
+        validators = result['validators'] or {}
+        self.connection.execute('UPDATE properties SET hash = COALESCE(?, hash), etag = ?, last_modified = ?, '
+                                'checked = ? WHERE county = ? AND property_id = ?',
+                                (result.get('hash'), validators.get('etag'), validators.get('last_modified'), now,
+                                 result['county'], result['property_id']))
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM properties').fetchone()[0]
+
+
+def diff(old, new):
+    """
+    Compares two House objects field by field
+
+    :param old: The saved House as a dict from to_dict()
+    :param new: The new House
+    :return: Dict of each changed field to its [old, new] values, empty if nothing changed
+    """
+
+    # Round tripping through JSON so tuples and lists, and numbers read back from the file, compare equal
+    new = json.loads(new.to_json())
+
+    return {field: [old.get(field), new.get(field)] for field in House.FIELDS if old.get(field) != new.get(field)}
+
+
+def check(state):
+    """
+    Checks one property for changes
+
+    The page is requested with its saved ETag / Last-Modified, a 304 Not Modified is not downloaded.
+    Otherwise the value and deed tables are hashed and the page is only parsed when the hash changed.
+
+    :param state: Dict from Portfolio.properties()
+    :return: Dict with the status "not modified", "unchanged", "changed" or "error",
+             and for changed properties the new House and the changes from diff()
+    """
+
+    result = {'county': state['county'], 'property_id': state['property_id'], 'validators': state['validators']}
+
+    try:
+        adapter = get_adapter(state['county'])
+        pages, result['validators'] = adapter.fetch_changed(state['property_id'], state['validators'])
+
+        if pages is None:
+            result['status'] = 'not modified'
+            return result
+
+        result['hash'] = adapter.change_hash(pages)
+
+        if result['hash'] == state['hash']:
+            result['status'] = 'unchanged'
+            return result
+
+        house = adapter.parse(*pages)
+        changes = diff(json.loads(state['house']), house)
+
+        # The first refresh only has a hash to save when the tables match the House saved by add
+        result['status'] = 'changed' if changes else 'unchanged'
+        result['house'] = house
+        result['changes'] = changes
+
+        # Later lookups of this property get the new data
+        cache.put_house(state['county'], 'id', state['property_id'], house)
+
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+
+    return result
+
+
+def run(portfolio, output=sys.stdout, workers=8, per_host=4):
+    """
+    Refreshes every property of a portfolio and writes the changed ones as JSON lines
+
+    Each line has the county, property ID, address and the changed fields, i.e.
+    {"county": "hcad", "property_id": "0660640130020", "address": "...", "changes": {"value": [297600, 310000]}}
+
+    :param portfolio: A Portfolio
+    :param output: File the changes are written to
+    :param workers: Number of properties checked at the same time
+    :param per_host: Most checks at once against a single county website
+    :return: Dict of status to number of properties
+    """
+
+    counts = {}
+
+    # One semaphore per county so a slow website cannot take all the workers
+    limits = {county: threading.BoundedSemaphore(per_host) for county in REGISTRY}
+
+    def check_one(state):
+        # Queued as refresh on the shared scheduler, after interactive lookups and before bulk ones
+        with limits[state['county']]:
+            return scheduler.run('refresh', state['county'], lambda county: check(state))
+
+    # The checks run on the scheduler's threads, the pool threads wait for them
+    scheduler.fit(workers, per_host)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(check_one, state) for state in portfolio.properties()]
+
+        # Saving from this thread since the portfolio connection can not be shared
+        for future in as_completed(futures):
+            result = future.result()
+            portfolio.save(result)
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+
+            if result['status'] == 'changed':
+                line = {'county': result['county'], 'property_id': result['property_id'],
+                        'address': result['house'].address, 'changes': result['changes']}
+                output.write(json.dumps(line) + '\n')
+            elif result['status'] == 'error':
+                print(f"{result['county']} {result['property_id']}: {result['error']}", file=sys.stderr)
+
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check a portfolio of properties for new values and sales')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = commands.add_parser('add', help='Look up the rows of an input file and add them to a portfolio')
+    add_parser.add_argument('portfolio')
+    add_parser.add_argument('input', help='CSV file with an address column, or a file with one address or ID per line')
+    add_parser.add_argument('--county', help='County used for rows without a county column')
+
+    run_parser = commands.add_parser('run', help='Check every property and print the changed fields as JSON lines')
+    run_parser.add_argument('portfolio')
+    run_parser.add_argument('--output', help='File the changes are added to, printed by default')
+    run_parser.add_argument('--workers', type=int, default=8, help='Number of properties checked at the same time')
+    run_parser.add_argument('--per-host', type=int, default=4, help='Most checks at once against one website')
+
+    args = parser.parse_args()
+
+    with Portfolio(args.portfolio) as properties:
+        if args.command == 'add':
+            added = 0
+            for number, county, query in read_rows(args.input, args.county):
+                # A row that fails (unknown county, network error, no property ID) is reported
+                # and the rest of the file is still added
+                try:
+                    county = resolve_county(county)
+                    found = lookup(county, query)
+
+                    if found is None:
+                        print(f'Row {number}: not found: {query}', file=sys.stderr)
+                    elif properties.add(county, query, found):
+                        added += 1
+                except Exception as e:
+                    print(f'Row {number}: {type(e).__name__}: {e}', file=sys.stderr)
+
+            print(f'Added {added} properties, {properties.count()} in the portfolio')
+
+        elif args.output:
+            with open(args.output, 'a', encoding='utf-8') as changes_file:
+                print(run(properties, changes_file, args.workers, args.per_host), file=sys.stderr)
+
+        else:
+            print(run(properties, sys.stdout, args.workers, args.per_host), file=sys.stderr)
@@ -0,0 +1,333 @@
+from lookup import lookup, lookup_id, resolve_county
+from concurrent.futures import Future
+from limiter import PRIORITIES
+import collections
+import threading
+import metrics
+import client
+import time
+
+
+# Default settings, these can be changed with configure()
+SETTINGS = {'workers': 16,  # Lookups running at the same time
+            'per_host': 4,  # Most lookups at once against a single county website
+            'reserved': 1,  # Lookups per website only the interactive class can run
+            'target': 2.0,  # Seconds an interactive lookup should take, queue wait included
+            'min_shared': 1}  # Fewest refresh and bulk lookups per website left running when over the target
+
+
+class Scheduler:
+    """
+    Runs lookups from one queue per priority class on a fixed number of threads
+
+    Queued interactive lookups always start before refresh and bulk ones, and a reserved share of each
+    website's lookups is kept free for them. When an interactive lookup takes longer than the target
+    the refresh and bulk share of that website is halved, and it grows back slowly while the
+    interactive lookups are fast again (the same AIMD as limiter.py).
+
+    The requests of each lookup are sent in its priority class so the rate limiter of the website
+    also lets the interactive ones go first, see client.priority().
+
+    Usage:
+        scheduler = Scheduler()
+        house = scheduler.lookup('hcad', '1234 Main St')
+        future = scheduler.submit('bulk', 'fbcad', lookup, '4567 Elm St')
+    """
+
+    def __init__(self, workers=16, per_host=4, reserved=1, target=2.0, min_shared=1):
+        """
+        :param workers: Lookups running at the same time
+        :param per_host: Most lookups at once against a single county website
+        :param reserved: Lookups per website only the interactive class can run
+        :param target: Seconds an interactive lookup should take, queue wait included
+        :param min_shared: Fewest refresh and bulk lookups per website left running when over the target
+        """
+
+        self.per_host = per_host
+        self.reserved = reserved
+        self.max_shared = max(min_shared, per_host - reserved)
+        self.min_shared = min_shared
+        self.target = target
+
+        # Priority class -> county -> queued lookups, the classes in the order they are served
+        self.queues = {name: {} for name in sorted(PRIORITIES, key=PRIORITIES.get)}
+
+        # County -> running lookups of each class
+        self.running = {}
+        # County -> refresh and bulk lookups allowed at once, lowered while interactive ones are slow
+        self.shared = {}
+
+        self.queued = dict.fromkeys(self.queues, 0)
+        self.completed = dict.fromkeys(self.queues, 0)
+        self.missed = 0
+
+        self.condition = threading.Condition()
+        self.stopping = False
+
+        self.threads = [threading.Thread(target=self.work, daemon=True, name=f'scheduler-{number}')
+                        for number in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, priority, county, function, *args):
+        """
+        Queues a lookup
+
+        :param priority: A key of limiter.PRIORITIES
+        :param county: County name, alias or menu number, lookups of one county share its website's slots
+        :param function: Called with the county key and the args i.e. lookup.lookup
+        :return: A Future of the result of the function
+        """
+
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}')
+
+        county = resolve_county(county)
+        future = Future()
+
+        with self.condition:
+            if self.stopping:
+                raise RuntimeError('The scheduler is shut down')
+
+            self.queues[priority].setdefault(county, collections.deque()).append(
+                (future, function, args, time.monotonic()))
+            self.queued[priority] += 1
+            self.condition.notify()
+
+        return future
+
+    def grow(self, workers, per_host):
+        """
+        Raises the limits to at least those of a batch, job, pipeline or refresh run,
+        the reserved slots of each website are kept on top of its per_host
+
+        :param workers: Number of threads wanted
+        :param per_host: Refresh and bulk lookups wanted at once against a single county website
+        """
+
+        with self.condition:
+            self.per_host = max(self.per_host, per_host + self.reserved)
+            self.max_shared = max(self.max_shared, per_host)
+
+            threads = [threading.Thread(target=self.work, daemon=True, name=f'scheduler-{number}')
+                       for number in range(len(self.threads), workers)]
+            self.threads.extend(threads)
+
+            # Queued lookups may fit in the new slots
+            self.condition.notify_all()
+
+        for thread in threads:
+            thread.start()
+
+    def lookup(self, county, query, priority='interactive'):
+        """
+        Looks up an address and waits for the result
+
+        :return: An instance of the House object or None if not found
+        """
+
+        return self.submit(priority, county, lookup, query).result()
+
+    def lookup_id(self, county, property_id, priority='interactive'):
+        """
+        Looks up a property ID and waits for the result
+
+        :return: An instance of the House object
+        """
+
+        return self.submit(priority, county, lookup_id, property_id).result()
+
+    def has_slot(self, priority, county):
+        running = self.running.setdefault(county, dict.fromkeys(self.queues, 0))
+        shared = self.shared.setdefault(county, self.max_shared)
+        total = sum(running.values())
+
+        if total >= self.per_host:
+            return False
+
+        if priority == 'interactive':
+            return True
+
+        # Refresh and bulk lookups leave the reserved slots to the interactive ones
+        return total - running['interactive'] < int(shared)
+
+    def next_lookup(self):
+        """
+        Takes the most urgent queued lookup whose website has a free slot, waiting for one
+
+        :return: Tuple of the priority class, county and the queued lookup, or None when shutting down
+        """
+
+        with self.condition:
+            while not self.stopping:
+                for priority, counties in self.queues.items():
+                    for county, queue in counties.items():
+                        if queue and self.has_slot(priority, county):
+                            # Moving the county to the end so the websites of a class take turns
+                            del counties[county]
+                            counties[county] = queue
+
+                            self.queued[priority] -= 1
+                            self.running[county][priority] += 1
+                            return priority, county, queue.popleft()
+
+                self.condition.wait()
+
+            return None
+
+    def work(self):
+        while True:
+            taken = self.next_lookup()
+
+            if taken is None:
+                return
+
+            priority, county, (future, function, args, queued) = taken
+            metrics.record(f'queue.wait.{priority}', time.monotonic() - queued)
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    with client.priority(priority):
+                        future.set_result(function(county, *args))
+                except Exception as e:
+                    future.set_exception(e)
+
+            self.finish(priority, county, time.monotonic() - queued)
+
+    def finish(self, priority, county, latency):
+        """
+        Frees the slot of a lookup and adjusts the refresh and bulk share of its website
+
+        :param latency: Seconds from queueing to the result
+        """
+
+        metrics.record(f'queue.latency.{priority}', latency)
+
+        with self.condition:
+            self.running[county][priority] -= 1
+            self.completed[priority] += 1
+            shared = self.shared[county]
+
+            if priority == 'interactive' and latency > self.target:
+                self.missed += 1
+                self.shared[county] = max(self.min_shared, shared / 2)
+            elif priority == 'interactive' or not self.queues['interactive'].get(county):
+                self.shared[county] = min(self.max_shared, shared + 1 / shared)
+
+            # Several lookups may fit in the freed slot and the new share
+            self.condition.notify_all()
+
+    def stats(self):
+        """
+        :return: Dict of the queued, running and completed lookups of each class, the interactive
+                 lookups over the target and the refresh and bulk share of each website
+        """
+
+        with self.condition:
+            return {'queued': dict(self.queued),
+                    'running': {name: sum(running[name] for running in self.running.values())
+                                for name in self.queues},
+                    'completed': dict(self.completed),
+                    'target': self.target,
+                    'missed': self.missed,
+                    'shared': {county: round(shared, 2) for county, shared in self.shared.items()}}
+
+    def shutdown(self, wait=True):
+        """
+        Stops the threads, queued lookups that did not start are cancelled
+
+        :param wait: Wait for the running lookups to finish
+        """
+
+        with self.condition:
+            self.stopping = True
+            for counties in self.queues.values():
+                for queue in counties.values():
+                    for future, *ignored in queue:
+                        future.cancel()
+                    queue.clear()
+            self.condition.notify_all()
+
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def configure(**settings):
+    """
+    Changes the scheduler settings, the next lookup starts a new scheduler with them
+
+    :param settings: Any of the keys of SETTINGS
+    """
+
+    global _scheduler
+
+    for name in settings:
+        if name not in SETTINGS:
+            raise ValueError(f'Unknown setting: {name}')
+
+    with _lock:
+        SETTINGS.update(settings)
+        if _scheduler:
+            _scheduler.shutdown(wait=False)
+        _scheduler = None
+
+
+def get_scheduler():
+    """
+    Gets the scheduler shared by the process, starting it on first use
+
+    :return: A Scheduler
+    """
+
+    global _scheduler
+
+    with _lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(**SETTINGS)
+        return _scheduler
+
+
+def fit(workers, per_host):
+    """
+    Sizes the shared scheduler for a batch, job, pipeline or refresh run so its workers and per_host are used
+
+    A process that did not start the scheduler yet (no lookup service) gets one without reserved slots
+    since it has no interactive lookups to keep them for, a running one is grown with Scheduler.grow().
+
+    :param workers: Number of lookups running at the same time
+    :param per_host: Most lookups at once against a single county website
+    :return: The shared Scheduler
+    """
+
+    global _scheduler
+
+    with _lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(**{**SETTINGS, 'workers': workers, 'per_host': per_host, 'reserved': 0})
+            return _scheduler
+
+        shared = _scheduler
+
+    shared.grow(workers, per_host)
+    return shared
+
+
+def run(priority, county, function, *args):
+    """
+    Runs a lookup on the shared scheduler and waits for it, used by the batch, job, pipeline and refresh threads
+
+    Usage:
+        house = scheduler.run('bulk', 'hcad', lookup, '1234 Main St')
+
+    :param priority: A key of limiter.PRIORITIES
+    :param county: County name, alias or menu number
+    :param function: Called with the county key and the args
+    :return: The result of the function, or raises its exception
+    """
+
+    return get_scheduler().submit(priority, county, function, *args).result()
@@ -0,0 +1,245 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from lookup import resolve_county, set_parser
+from urllib.parse import urlsplit, parse_qs
+from addresses import normalize_address
+from adapters import get_adapter
+from limiter import PRIORITIES
+import threading
+import scheduler
+import argparse
+import metrics
+import client
+import cache
+import bulk
+import json
+
+
+class SingleFlight:
+    """
+    Runs a function once for concurrent calls with the same key
+
+    Callers that arrive while a lookup for the same key is running wait
+    for it and get its result instead of sending the same requests again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.started = 0
+        self.shared = 0
+
+    def run(self, key, function, *args):
+        """
+        :param key: Calls with equal keys are merged
+        :return: The result of the function, or raises its exception, for every caller
+        """
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                self.started += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call['done'].wait()
+        else:
+            try:
+                call['result'] = function(*args)
+            except Exception as e:
+                call['error'] = e
+            finally:
+                # Removing the call before waking the others so later requests start a new lookup
+                with self.lock:
+                    del self.calls[key]
+                call['done'].set()
+
+        if call['error'] is not None:
+            raise call['error']
+
+        return call['result']
+
+    def stats(self):
+        with self.lock:
+            return {'in_flight': len(self.calls), 'started': self.started, 'shared': self.shared}
+
+
+# Shared by all the request threads of the server
+flights = SingleFlight()
+
+
+def find(kind, county, query, priority='interactive'):
+    """
+    Looks up a property, merging concurrent requests for the same property
+
+    The lookup is queued on the shared scheduler in its priority class.
+
+    :param kind: "address" or "id"
+    :param county: County name, alias or menu number
+    :param query: Address or property ID
+    :param priority: "interactive", "refresh" or "bulk"
+    :return: An instance of the House object or None if not found
+    """
+
+    county = resolve_county(county)
+    query = query.strip()
+
+    # Addresses typed differently but meaning the same property share one lookup
+    # The class is part of the key so an interactive request never waits on a queued bulk one
+    key = (kind, county, normalize_address(query) if kind == 'address' else query.upper(), priority)
+
+    if kind == 'id':
+        return flights.run(key, scheduler.get_scheduler().lookup_id, county, query, priority)
+
+    return flights.run(key, scheduler.get_scheduler().lookup, county, query, priority)
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    """
+    GET /lookup?county=hcad&address=1234 Main St   House as JSON, 404 if not found
+    GET /id?county=fbcad&id=R416144                 House as JSON
+    GET /stats                                      Rate limiter, scheduler and request merging stats
+
+    Lookups are interactive unless a priority=refresh or priority=bulk parameter is given.
+    GET /metrics                                    Stage timings in the Prometheus text format
+    GET /health                                     {"status": "ok"}
+    """
+
+    # Keeping connections open between requests from the same tool
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        if url.path == '/lookup':
+            self.send_lookup('address', params)
+        elif url.path == '/id':
+            self.send_lookup('id', params)
+        elif url.path == '/stats':
+            self.send_json(200, {'limiters': client.limiter_stats(), 'requests': flights.stats(),
+                                 'scheduler': scheduler.get_scheduler().stats()})
+        elif url.path == '/metrics':
+            self.send_body(200, metrics.prometheus_text().encode(), 'text/plain; version=0.0.4')
+        elif url.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': f'Unknown path: {url.path}'})
+
+    def send_lookup(self, kind, params):
+        """
+        Checks the parameters of a lookup, a bad request is answered with a 400 before anything is looked up
+
+        :param kind: "address" or "id", also the name of the parameter with the query
+        :param params: Dict of the query string parameters
+        """
+
+        query = params.get(kind, '').strip()
+        priority = params.get('priority', 'interactive')
+
+        if not query:
+            self.send_json(400, {'error': f'Missing parameter: {kind}'})
+            return
+
+        if priority not in PRIORITIES:
+            self.send_json(400, {'error': f'Unknown priority: {priority}'})
+            return
+
+        try:
+            county = resolve_county(params.get('county', ''))
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        if kind == 'id' and not get_adapter(county).is_property_id(query):
+            self.send_json(400, {'error': f'Not a {county} property ID: {query}'})
+            return
+
+        try:
+            house = find(kind, county, query, priority)
+        except Exception as e:
+            # Errors from the county websites or parsing, the input was checked above
+            self.send_json(502, {'error': str(e)})
+            return
+
+        self.send_house(house)
+
+    def send_house(self, house):
+        if house is None:
+            self.send_json(404, {'error': 'Property not found'})
+        else:
+            self.send_json(200, house.to_dict())
+
+    def send_json(self, status, data):
+        self.send_body(status, json.dumps(data).encode(), 'application/json')
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Only server errors are printed, every lookup would flood the console
+        if len(args) > 1 and str(args[1]).startswith('5'):
+            super().log_message(format, *args)
+
+
+def serve(port=8080, host='127.0.0.1'):
+    """
+    Runs the lookup service until it is stopped with CTRL+C
+
+    The shared session, rate limiters and caches stay warm between requests.
+    """
+
+    server = ThreadingHTTPServer((host, port), LookupHandler)
+    server.daemon_threads = True
+    print(f'Serving lookups on http://{host}:{port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def add_arguments(parser):
+    """
+    Adds the service options to an argparse parser, used by app.py serve
+    """
+
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on, 0.0.0.0 for every network')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--parser', choices=['soup', 'lxml', 'stream'], default='lxml',
+                        help='How pages are parsed, lxml is faster and gives the same results, '
+                             'stream is lxml parsing pages while they download, it only saves memory '
+                             'with --no-cache since the cache keeps the page text')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or save cached results')
+    parser.add_argument('--no-bulk', action='store_true', help='Do not answer from the loaded export files')
+    parser.add_argument('--workers', type=int, default=scheduler.SETTINGS['workers'],
+                        help='Lookups running at the same time')
+    parser.add_argument('--per-host', type=int, default=scheduler.SETTINGS['per_host'],
+                        help='Most lookups at once against one website')
+    parser.add_argument('--reserved', type=int, default=scheduler.SETTINGS['reserved'],
+                        help='Lookups per website kept for interactive requests')
+    parser.add_argument('--target', type=float, default=scheduler.SETTINGS['target'],
+                        help='Seconds an interactive lookup should take, bulk lookups slow down above it')
+
+
+def run_from_args(args):
+    cache.configure(enabled=not args.no_cache)
+    bulk.configure(enabled=not args.no_bulk)
+    set_parser(args.parser)
+    scheduler.configure(workers=args.workers, per_host=args.per_host, reserved=args.reserved, target=args.target)
+    serve(args.port, args.host)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='HTTP service answering property lookups as JSON')
+    add_arguments(arg_parser)
+    run_from_args(arg_parser.parse_args())
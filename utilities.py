@@ -1,23 +1,151 @@
+import json
+import re
+
+
+def to_int(value):
+    """
+    Converts a number scraped from the CAD website to an int
+
+    :param value: Number or text such as "1,234", "$310,000" or "2,345.00"
+    :return: Int or None if the text has no number i.e. "Not Found"
+    """
+
+    if value is None or isinstance(value, int):
+        return value
+
+    if isinstance(value, float):
+        return int(value)
+
+    digits = re.sub(r'[^\d.]', '', str(value)).rstrip('.')
+
+    if not digits:
+        return None
+
+    return int(float(digits))
+
+
+def to_number(value):
+    """
+    Converts text to an int, or a float when it has a fraction i.e. "2.5" baths
+
+    :return: Int, float or None
+    """
+
+    if value is None or isinstance(value, (int, float)):
+        return value
+
+    text = re.sub(r'[^\d.]', '', str(value))
+
+    if not text:
+        return None
+
+    number = float(text)
+    return int(number) if number.is_integer() else number
+
+
 # Creating a House object to organize the results for easier access
+# __slots__ keeps each instance small since batch runs can hold many of them
 class House:
+    FIELDS = ('address', 'sqft', 'value', 'year_built', 'porch', 'patio', 'deck', 'garage', 'purchase_date',
+              'buyer', 'bedrooms', 'baths', 'half_baths', 'fireplace', 'stories', 'elements')
+
+    # _loader holds the function loading the LAZY_FIELDS, see load_later()
+    __slots__ = FIELDS + ('_loader',)
+
+    # Column names used by to_csv_row(), the elements are written as a JSON list
+    CSV_FIELDS = FIELDS
+
+    # Fields that come from a second page and can be loaded when first used
+    LAZY_FIELDS = ('purchase_date', 'buyer')
+
     def __init__(self, address, sqft, value, year_built, porch, patio, deck, garage, purchase_date, buyer, bedrooms,
                  baths, half_baths, fireplace, stories, elements):
         self.address = address
-        self.sqft = sqft
-        self.value = value
-        self.year_built = year_built
-        self.porch = porch
-        self.patio = patio
-        self.deck = deck
-        self.garage = garage
+        self.sqft = to_int(sqft)
+        self.value = to_int(value)
+        self.year_built = to_int(year_built)
+        self.porch = to_int(porch)
+        self.patio = to_int(patio)
+        self.deck = to_int(deck)
+        self.garage = to_int(garage)
         self.purchase_date = purchase_date
         self.buyer = buyer
-        self.bedrooms = bedrooms
-        self.baths = baths
-        self.half_baths = half_baths
-        self.fireplace = fireplace
-        self.stories = stories
-        self.elements = elements
+        self.bedrooms = to_int(bedrooms)
+        self.baths = to_number(baths)
+        self.half_baths = to_int(half_baths)
+        self.fireplace = to_int(fireplace)
+        self.stories = to_int(stories)
+        # The raw label/value pairs from the CAD website i.e. ("Open Porch", "96")
+        self.elements = tuple((str(label), str(value)) for label, value in elements)
+        self._loader = None
+
+    def __getattr__(self, name):
+        # Only called when a field is not set, which is a lazy field that was not loaded yet
+        if name in House.LAZY_FIELDS and self._loader is not None:
+            # The loader is only dropped once it worked, a failed load raises and is tried again on the next use
+            for field, value in self._loader().items():
+                setattr(self, field, value)
+
+            self._loader = None
+            return getattr(self, name)
+
+        raise AttributeError(f"'House' object has no attribute '{name}'")
+
+    def load_later(self, loader):
+        """
+        Removes the LAZY_FIELDS so they are loaded the first time one of them is used
+
+        :param loader: Function returning a dict of the LAZY_FIELDS values
+        """
+
+        for field in House.LAZY_FIELDS:
+            if hasattr(self, field):
+                delattr(self, field)
+
+        self._loader = loader
+
+    @property
+    def loaded(self):
+        """
+        :return: False while the lazy fields are waiting to be loaded
+        """
+
+        return self._loader is None
+
+    def __eq__(self, other):
+        return isinstance(other, House) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'House({self.address!r})'
+
+    def to_dict(self):
+        """
+        :return: Dict of all the fields, with the elements as a list of [label, value] lists
+        """
+
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data['elements'] = [list(element) for element in self.elements]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a House from the output of to_dict()
+        """
+
+        return cls(**data)
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def to_csv_row(self):
+        """
+        :return: List of values in the order of CSV_FIELDS
+        """
+
+        row = [getattr(self, field) for field in self.FIELDS]
+        row[-1] = json.dumps([list(element) for element in self.elements])
+        return row
 
 
 def format_result(house):
@@ -34,6 +162,9 @@ def format_result(house):
     for k, v in house.elements:
         raw_data += f'{k}: {v}\n'
 
+    # Values are kept as numbers, adding the thousands separator for display
+    value = 'Not Found' if house.value is None else f'{house.value:,}'
+
     if not house.half_baths or house.half_baths == 0:
         bathroom_template = house.baths
     else:
@@ -55,7 +186,7 @@ PATIO      : {house.patio}
 WINDOW     : 
 PAY        : 
 BOUGHT     : {house.purchase_date}
-MARKET VAL : {house.value}
+MARKET VAL : {value}
 FLOOD QUOTE:
 
 Raw Data:
@@ -80,7 +211,7 @@ DOGS       :
 PAY        : 
 EXTERIOR   : 
 BOUGHT     : {house.purchase_date}
-MARKET VAL : {house.value}
+MARKET VAL : {value}
 FLOOD QUOTE: 
 
 Raw Data: